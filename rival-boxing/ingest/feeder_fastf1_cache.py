@@ -1,26 +1,26 @@
 #!/usr/bin/env python3
-import argparse, json, time, sys
+import argparse, json, time, sys, threading, queue
 from pathlib import Path
-from collections import defaultdict, deque
+from importlib.util import find_spec
+from collections import defaultdict
 
 import requests
+from requests.adapters import HTTPAdapter
 import numpy as np
 import pandas as pd
 import fastf1
 
-# --------------- helpers ----------------
+try:  # C-level JSON encoder for the per-lap POST bodies (optional)
+    import orjson
+    def dumps(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    def dumps(obj):
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
 
-def nz(x, default=0.0):
-    try:
-        if x is None:
-            return float(default)
-        if hasattr(x, "total_seconds"):
-            x = x.total_seconds()
-        if isinstance(x, float) and (np.isnan(x) or np.isinf(x)):
-            return float(default)
-        return float(x)
-    except Exception:
-        return float(default)
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# --------------- helpers ----------------
 
 def load_feat_list(meta_path):
     meta = json.loads(Path(meta_path).read_text())
@@ -30,22 +30,30 @@ def load_feat_list(meta_path):
         sys.exit(1)
     return fl
 
-def compound_flags(raw):
-    # Normalise text
-    c = (raw or "").upper()
-    # FastF1 typically uses 'SOFT','MEDIUM','HARD','INTERMEDIATE','WET'
-    # Your feats want 'MED' not 'MEDIUM'
-    is_soft = 1 if c == "SOFT" else 0
-    is_med  = 1 if c in ("MED", "MEDIUM") else 0
-    is_hard = 1 if c == "HARD" else 0
-    is_int  = 1 if c in ("INTERMEDIATE","INT") else 0
-    is_wet  = 1 if c == "WET" else 0
-    return is_soft, is_med, is_hard, is_int, is_wet
+COMPOUNDS = ["SOFT", "MED", "HARD", "INTERMEDIATE", "WET"]
+COMP_IDX = {"SOFT": 0, "MEDIUM": 1, "MED": 1, "HARD": 2, "INTERMEDIATE": 3, "INT": 3, "WET": 4}
+
+# Canonical (de-duplicated) feature columns produced by build_feature_frame
+FEAT_COLS = [
+    "tire_age_laps", "stint_no",
+    "compound_SOFT", "compound_MED", "compound_HARD", "compound_INTERMEDIATE", "compound_WET",
+    "last3_avg", "last5_slope", "last3_var",
+    "typical_stint_len", "age_vs_typical", "age_percentile", "overshoot",
+    "cheap_stop_flag", "cheap_prev1", "cheap_prev2", "non_green_runlen",
+    "pits_prev1", "pits_prev2",
+]
+
+def to_seconds(s):
+    # Timedelta or numeric Series -> float seconds (NaN kept)
+    if pd.api.types.is_timedelta64_dtype(s):
+        return s.dt.total_seconds()
+    return pd.to_numeric(s, errors="coerce").astype(float)
 
 def build_track_status_timeline(session):
     """
-    Returns a DataFrame with columns: ['Time','StatusCode','is_green']
+    Returns a DataFrame with columns: ['Time','Time_s','StatusCode','is_green']
     StatusCode is int if possible; else 1 for green by default.
+    Time_s is Time materialized once as float64 seconds for array lookups.
     """
     try:
         ts = session.api.track_status_data  # cached when session.load() ran
@@ -60,26 +68,25 @@ def build_track_status_timeline(session):
         df["StatusCode"] = df["Status"].map(to_code)
         # Heuristic: 1=green, others=not green.
         df["is_green"] = (df["StatusCode"] == 1).astype(int)
+        df["Time_s"] = to_seconds(df["Time"]).to_numpy(dtype=np.float64)
         # Keep only what we need
-        return df[["Time","StatusCode","is_green"]].sort_values("Time").reset_index(drop=True)
+        return df[["Time","Time_s","StatusCode","is_green"]].sort_values("Time_s").reset_index(drop=True)
     except Exception:
         # Fallback: always green
-        return pd.DataFrame({"Time":[0.0], "StatusCode":[1], "is_green":[1]})
+        return pd.DataFrame({"Time":[0.0], "Time_s":[0.0], "StatusCode":[1], "is_green":[1]})
 
-def status_at_time(ts_df, t_seconds):
-    # Find last status change at or before t_seconds
+def status_at_laps(ts_df, t_seconds):
+    """
+    Vectorized track-status lookup: last status change at or before each
+    t_seconds value. Returns (StatusCode, is_green) int arrays.
+    """
+    n = len(t_seconds)
     if ts_df is None or ts_df.empty:
-        return 1, 1
-    # ts_df["Time"] is Timedelta in many cases
-    if hasattr(ts_df["Time"].iloc[0], "total_seconds"):
-        tvals = ts_df["Time"].apply(lambda x: x.total_seconds())
-    else:
-        tvals = ts_df["Time"].astype(float)
-    idx = tvals.searchsorted(t_seconds, side="right") - 1
-    idx = max(0, min(idx, len(ts_df)-1))
-    sc = int(ts_df["StatusCode"].iloc[idx])
-    green = int(ts_df["is_green"].iloc[idx])
-    return sc, green
+        return np.ones(n, dtype=int), np.ones(n, dtype=int)
+    tvals = ts_df["Time_s"].to_numpy(dtype=np.float64) if "Time_s" in ts_df else to_seconds(ts_df["Time"]).to_numpy()
+    idx = np.searchsorted(tvals, np.asarray(t_seconds, dtype=float), side="right") - 1
+    idx = np.clip(idx, 0, len(ts_df) - 1)
+    return ts_df["StatusCode"].to_numpy(dtype=int)[idx], ts_df["is_green"].to_numpy(dtype=int)[idx]
 
 def typical_stint_len_by_comp(laps_df):
     """
@@ -106,122 +113,260 @@ def typical_stint_len_by_comp(laps_df):
 
 # --------------- feature builder (EXACT names) ----------------
 
-def compute_features_for_row(row, prev_row, ts_df, driver_state, typical_len_fn):
+# Closed-form OLS slope over x=0..k-1: slope = (k*Sxy - Sx*Sy) / (k*Sxx - Sx^2).
+# Sx and the denominator only depend on the window length k, so keep a LUT (k=0..5).
+_K = np.arange(6, dtype=np.float64)
+SLOPE_SX = _K * (_K - 1.0) / 2.0
+SLOPE_DEN = _K * ((_K - 1.0) * _K * (2.0 * _K - 1.0) / 6.0) - SLOPE_SX ** 2  # k=5 -> 50
+SLOPE_DEN[SLOPE_DEN == 0] = 1.0  # k<2: unused (slope forced to 0)
+
+def _lap_stats_kernel(y, codes, n_groups, slope_sx, slope_den):
     """
-    Returns a dict with exactly the keys in your feat_list.
-    Uses row (current lap), prev_row (previous lap of same driver),
-    track-status timeline, rolling driver_state (keeps last laps), and
-    typical_len_fn(compound)->typical_len.
+    Single pass over the lap stream keeping a 5-slot float64 ring per driver.
+    Returns last3_avg, last3_var (ddof=0) and closed-form last5_slope.
     """
-    lap_no = int(row.get("LapNumber", 0))
-    stint_no = int(row.get("Stint", 0))
-    tire_age = int(row.get("TyreLife", 0))
-    comp_raw = row.get("Compound", None)
-    comp_soft, comp_med, comp_hard, comp_int, comp_wet = compound_flags(comp_raw)
-
-    # lap times & rolling stats
-    lt = nz(row.get("LapTime"))
-    s1 = nz(row.get("Sector1Time"))
-    s2 = nz(row.get("Sector2Time"))
-    s3 = nz(row.get("Sector3Time"))
-    t_sess = nz(row.get("SessionTime"))
-
-    # update driver rolling buffers
-    lbuf = driver_state["last_laps"]
-    lbuf.append(lt)
-    if len(lbuf) > 10:
-        lbuf.popleft()
-
-    # last3_avg, last3_var
-    if len(lbuf) >= 3:
-        arr3 = np.array(list(lbuf)[-3:], dtype=float)
-        last3_avg = float(np.nanmean(arr3))
-        last3_var = float(np.nanvar(arr3))
-    else:
-        last3_avg = lt if lt > 0 else 0.0
-        last3_var = 0.0
-
-    # last5_slope: simple linear regression slope over last up-to-5 points
-    if len(lbuf) >= 2:
-        tail = list(lbuf)[-5:]
-        xs = np.arange(len(tail), dtype=float)
-        ys = np.array(tail, dtype=float)
-        # if any NaNs, fallback 0
-        if np.any(~np.isfinite(ys)):
-            last5_slope = 0.0
+    n = y.shape[0]
+    ring = np.zeros((n_groups, 5), dtype=np.float64)
+    cnt = np.zeros(n_groups, dtype=np.int64)
+    avg3 = np.zeros(n, dtype=np.float64)
+    var3 = np.zeros(n, dtype=np.float64)
+    slope5 = np.zeros(n, dtype=np.float64)
+    for i in range(n):
+        g = codes[i]
+        c = cnt[g]
+        ring[g, c % 5] = y[i]
+        c += 1
+        cnt[g] = c
+        if c >= 3:
+            a0 = ring[g, (c - 3) % 5]; a1 = ring[g, (c - 2) % 5]; a2 = ring[g, (c - 1) % 5]
+            m = (a0 + a1 + a2) / 3.0
+            avg3[i] = m
+            var3[i] = ((a0 - m) ** 2 + (a1 - m) ** 2 + (a2 - m) ** 2) / 3.0
         else:
-            # slope = cov(x,y)/var(x)
-            vx = np.var(xs)
-            if vx == 0:
-                last5_slope = 0.0
-            else:
-                last5_slope = float(np.cov(xs, ys, bias=True)[0,1] / vx)
-    else:
-        last5_slope = 0.0
+            avg3[i] = y[i] if y[i] > 0 else 0.0
+        k = c if c < 5 else 5
+        if k >= 2:
+            sy = 0.0; sxy = 0.0
+            for j in range(k):
+                v = ring[g, (c - k + j) % 5]
+                sy += v; sxy += j * v
+            slope5[i] = (k * sxy - slope_sx[k] * sy) / slope_den[k]
+    return avg3, var3, slope5
+
+try:  # JIT the per-lap ring-buffer kernel when numba is available
+    from numba import njit
+    _lap_stats_kernel = njit(cache=True)(_lap_stats_kernel)
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+def lap_time_stats(lt, drv):
+    """
+    last3_avg / last3_var / last5_slope per lap, in stream order, per driver.
+    numba kernel when available; otherwise grouped pandas rolling ops.
+    """
+    if HAVE_NUMBA:
+        codes, uniq = pd.factorize(drv, sort=False)
+        avg3, var3, slope5 = _lap_stats_kernel(lt.to_numpy(dtype=np.float64), codes.astype(np.int64), len(uniq),
+                                               SLOPE_SX, SLOPE_DEN)
+        return (pd.Series(avg3, index=lt.index), pd.Series(var3, index=lt.index),
+                pd.Series(slope5, index=lt.index))
+
+    g = lt.groupby(drv, sort=False)
+    avg3 = g.rolling(3, min_periods=3).mean().reset_index(level=0, drop=True).reindex(lt.index)
+    var3 = g.rolling(3, min_periods=3).var(ddof=0).reset_index(level=0, drop=True).reindex(lt.index)
+    avg3 = avg3.fillna(lt.where(lt > 0, 0.0))
+    var3 = var3.fillna(0.0).clip(lower=0.0)
+
+    # closed-form OLS slope over the last n=min(k+1, 5) points
+    k = drv.groupby(drv, sort=False).cumcount().astype(float)
+    ky = (k * lt).groupby(drv, sort=False)
+    sy = g.rolling(5, min_periods=1).sum().reset_index(level=0, drop=True).reindex(lt.index)
+    sky = ky.rolling(5, min_periods=1).sum().reset_index(level=0, drop=True).reindex(lt.index)
+    n = np.minimum(k + 1.0, 5.0)
+    ni = n.to_numpy(dtype=np.int64)
+    sxy = sky - (k - n + 1.0) * sy
+    slope = (n * sxy - SLOPE_SX[ni] * sy) / SLOPE_DEN[ni]
+    return avg3, var3, slope.where(n >= 2, 0.0).fillna(0.0)
+
+LAP_NUM_COLS = ("LapNumber", "Stint", "TyreLife", "LapTime", "Time", "PitIn")
+
+def lap_arrays(laps):
+    """
+    Pull the lap columns the features need out of pandas once, as contiguous
+    float64 arrays (Timedelta -> seconds, NaN/inf -> 0; missing column -> 0).
+    """
+    cols = {}
+    for c in LAP_NUM_COLS:
+        if c not in laps:
+            cols[c] = np.zeros(len(laps), dtype=np.float64)
+        elif c == "PitIn":
+            cols[c] = laps[c].fillna(False).astype(bool).to_numpy(dtype=np.float64)
+        else:
+            cols[c] = np.nan_to_num(to_seconds(laps[c]).to_numpy(dtype=np.float64), nan=0.0, posinf=0.0, neginf=0.0)
+    return cols
+
+def prev_same_driver(codes):
+    """Index of the previous lap of the same driver in stream order (-1 if none)."""
+    order = np.argsort(codes, kind="stable")
+    prev = np.full(len(codes), -1, dtype=np.int64)
+    same = codes[order[1:]] == codes[order[:-1]]
+    prev[order[1:]] = np.where(same, order[:-1], -1)
+    return prev
+
+def shift_prev(x, prev, fill=0.0):
+    return np.where(prev >= 0, x[np.maximum(prev, 0)], fill)
+
+def run_length(flag, codes):
+    """Consecutive 1s in `flag` per driver, counted in stream order (0 where flag==0)."""
+    order = np.argsort(codes, kind="stable")
+    f = flag[order].astype(np.int64)
+    cs = np.cumsum(f)
+    start = np.r_[True, codes[order][1:] != codes[order][:-1]]
+    # cumsum value just before the most recent reset (a 0 or a new driver)
+    base = np.where(f == 0, cs, np.where(start, cs - f, 0))
+    base = np.maximum.accumulate(np.where((f == 0) | start, base, -1))
+    out = np.empty_like(cs)
+    out[order] = (cs - base) * f
+    return out
+
+def build_feature_frame(laps, ts_df, typical_len_fn):
+    """
+    Computes every feature for all laps at once (one row per lap, same index
+    and order as `laps`). Per-driver state (prev flags, runs, rolling stats)
+    is expressed through previous-lap index arrays over the stream order, so it
+    matches a lap-by-lap replay. Columns: Driver, LapNumber + FEAT_COLS.
+    """
+    cols = lap_arrays(laps)
+    drv = laps["Driver"].astype(str).str.upper()
+    codes, _ = pd.factorize(drv, sort=False)
+    prev1 = prev_same_driver(codes)
+
+    fc = {"Driver": drv.to_numpy(), "LapNumber": cols["LapNumber"].astype(int)}
+
+    tire_age = cols["TyreLife"].astype(int).astype(np.float64)
+    fc["tire_age_laps"] = tire_age
+    fc["stint_no"] = cols["Stint"].astype(int).astype(np.float64)
+
+    # compound one-hot (MEDIUM->MED, INT->INTERMEDIATE)
+    comp_raw = laps["Compound"] if "Compound" in laps else pd.Series(None, index=laps.index, dtype=object)
+    cidx = comp_raw.astype(str).str.upper().map(COMP_IDX).fillna(-1).astype(int).to_numpy()
+    onehot = np.eye(len(COMPOUNDS) + 1, dtype=np.float64)[cidx][:, :len(COMPOUNDS)]  # -1 -> all-zero row
+    for j, c in enumerate(COMPOUNDS):
+        fc[f"compound_{c}"] = onehot[:, j]
+
+    # rolling lap-time stats per driver (window includes current lap)
+    lt = pd.Series(cols["LapTime"], index=laps.index)
+    avg3, var3, slope5 = lap_time_stats(lt, drv)
+    fc["last3_avg"] = avg3.to_numpy()
+    fc["last3_var"] = var3.to_numpy()
+    fc["last5_slope"] = slope5.to_numpy()
 
     # typical stint length & derived
-    typical_len = float(typical_len_fn(comp_raw))
-    age_vs_typical = float(tire_age - typical_len)
+    typ_map = {c: float(typical_len_fn(c)) for c in comp_raw.dropna().unique()}
+    typical_len = comp_raw.map(typ_map).fillna(float(typical_len_fn(None))).to_numpy(dtype=np.float64)
+    fc["typical_stint_len"] = typical_len
+    fc["age_vs_typical"] = tire_age - typical_len
     # "percentile": crude: age / typical_len (clipped 0..2) then rescale to 0..1 by /2
-    age_percentile = float(np.clip(tire_age / (typical_len + 1e-6), 0.0, 2.0) / 2.0)
-    overshoot = float(max(0.0, age_vs_typical))
-
-    # Track status & cheap stop flags
-    scode, green = status_at_time(ts_df, t_sess)
-    cheap_flag = 0 if green == 1 else 1
-
-    # previous cheap flags (per driver)
-    cheap_prev1 = driver_state["cheap_prev1"]
-    cheap_prev2 = driver_state["cheap_prev2"]
-    driver_state["cheap_prev2"] = cheap_prev1
-    driver_state["cheap_prev1"] = cheap_flag
-
-    # non_green_runlen: consecutive laps with !green (kept in state)
-    if cheap_flag == 1:
-        driver_state["non_green_runlen"] += 1
-    else:
-        driver_state["non_green_runlen"] = 0
-    non_green_runlen = driver_state["non_green_runlen"]
+    fc["age_percentile"] = np.clip(tire_age / (typical_len + 1e-6), 0.0, 2.0) / 2.0
+    fc["overshoot"] = np.maximum(0.0, fc["age_vs_typical"])
+
+    # track status & cheap stop flags
+    _, green = status_at_laps(ts_df, cols["Time"])
+    cheap = (1 - green).astype(np.float64)
+    fc["cheap_stop_flag"] = cheap
+    fc["cheap_prev1"] = shift_prev(cheap, prev1)
+    fc["cheap_prev2"] = shift_prev(fc["cheap_prev1"], prev1)
+
+    # non_green_runlen: consecutive non-green laps per driver
+    fc["non_green_runlen"] = run_length(cheap, codes).astype(np.float64)
 
     # previous pit flags
-    pit_in = 1 if row.get("PitIn", False) else 0
-    pits_prev1 = driver_state["pits_prev1"]
-    pits_prev2 = driver_state["pits_prev2"]
-    driver_state["pits_prev2"] = pits_prev1
-    driver_state["pits_prev1"] = pit_in
-
-    # Assemble EXACT feature names (26), including duplicates at the end
-    feats = {
-        "tire_age_laps": float(tire_age),
-        "stint_no": float(stint_no),
-        "compound_SOFT": float(comp_soft),
-        "compound_MED": float(comp_med),
-        "compound_HARD": float(comp_hard),
-        "compound_INTERMEDIATE": float(comp_int),
-        "compound_WET": float(comp_wet),
-        "last3_avg": float(last3_avg),
-        "last5_slope": float(last5_slope),
-        "last3_var": float(last3_var),
-        "typical_stint_len": float(typical_len),
-        "age_vs_typical": float(age_vs_typical),
-        "age_percentile": float(age_percentile),
-        "overshoot": float(overshoot),
-        "cheap_stop_flag": float(cheap_flag),
-        "cheap_prev1": float(cheap_prev1),
-        "cheap_prev2": float(cheap_prev2),
-        "non_green_runlen": float(non_green_runlen),
-        "pits_prev1": float(pits_prev1),
-        "pits_prev2": float(pits_prev2),
-        # duplicates:
-        "tire_age_laps": float(tire_age),
-        "compound_SOFT": float(comp_soft),
-        "compound_MED": float(comp_med),
-        "compound_HARD": float(comp_hard),
-        "compound_INTERMEDIATE": float(comp_int),
-        "compound_WET": float(comp_wet),
-    }
-
-    return feats
+    fc["pits_prev1"] = shift_prev(cols["PitIn"], prev1)
+    fc["pits_prev2"] = shift_prev(fc["pits_prev1"], prev1)
+
+    return pd.DataFrame(fc, index=laps.index)
+
+# --------------- HTTP ----------------
+
+def make_http_session(pool_connections=4, pool_maxsize=16):
+    # One keep-alive session shared by predictor + bridge POSTs
+    ses = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    ses.mount("http://", adapter)
+    ses.mount("https://", adapter)
+    return ses
+
+class BridgePoster:
+    """
+    Bridge updates go into a bounded in-process queue drained by a daemon
+    thread (shared pooled session, bounded retry). When the queue is full the
+    oldest update is dropped, so the main loop never blocks on bridge health.
+    """
+    def __init__(self, http, url, maxsize=1024, retries=2):
+        self.http = http
+        self.url = url
+        self.retries = retries
+        self.q = queue.Queue(maxsize=maxsize)
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._pump, daemon=True)
+        self.thread.start()
+
+    def _pump(self):
+        while True:
+            body = self.q.get()
+            if body is None:
+                self.q.task_done()
+                return
+            self._post(body)
+            self.q.task_done()
+
+    def _post(self, body):
+        for attempt in range(self.retries + 1):
+            try:
+                r = self.http.post(self.url, data=body, headers=JSON_HEADERS, timeout=1.0)
+                if r.status_code == 200:
+                    return
+                if attempt == self.retries:
+                    n = self._fail()
+                    if n % 50 == 0:
+                        print(f"[WARN] Bridge POST failed: {r.status_code} (total failures: {n})", flush=True)
+            except requests.exceptions.RequestException:
+                # Don't fail the main flow if bridge is down
+                if attempt == self.retries:
+                    n = self._fail()
+                    if n == 1:
+                        print(f"[WARN] Bridge service unavailable at {self.url}. Predictions won't reach frontend.", flush=True)
+                        print(f"       Make sure bridge service is running: cd bridge-service && npm start", flush=True)
+                    elif n % 100 == 0:
+                        print(f"[WARN] Bridge connection issues (failures: {n})", flush=True)
+
+    def _fail(self):
+        with self.lock:
+            self.failures += 1
+            return self.failures
+
+    def submit(self, payload):
+        body = dumps(payload)
+        while True:
+            try:
+                self.q.put_nowait(body)
+                return
+            except queue.Full:
+                # ring behaviour: drop the oldest pending update
+                try:
+                    self.q.get_nowait()
+                    self.q.task_done()
+                    with self.lock:
+                        self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def close(self):
+        self.q.put(None)
+        self.thread.join()
 
 # --------------- FastF1 access ----------------
 
@@ -239,8 +384,43 @@ def iter_laps_stream(session, only_codes=None):
     if only_codes:
         only = set([x.strip().upper() for x in only_codes.split(",") if x.strip()])
         laps = laps[laps["Driver"].str.upper().isin(only)]
-    laps = laps.sort_values(by=["LapStartTime", "Driver"])
-    return laps
+    # stream order = (LapStartTime, Driver); lexsort on raw arrays (last key is primary)
+    drv_codes = pd.Categorical(laps["Driver"]).codes  # categories sorted -> alphabetical codes
+    start_s = to_seconds(laps["LapStartTime"]).to_numpy(dtype=np.float64)
+    return laps.iloc[np.lexsort((drv_codes, start_s))]
+
+# --------------- feature cache ----------------
+
+# pandas reads/writes Parquet through pyarrow or fastparquet; without one the cache defaults off
+HAVE_PARQUET = any(find_spec(m) is not None for m in ("pyarrow", "fastparquet"))
+
+def feat_cache_path(cache_root, race_spec, only_codes=""):
+    year_s, gp_name = race_spec.split(":", 1)
+    key = f"{year_s}_{gp_name}".replace(" ", "_")
+    if only_codes:
+        key += "_" + "-".join(sorted(x.strip().upper() for x in only_codes.split(",") if x.strip()))
+    return Path(cache_root) / f"{key}.parquet"
+
+def load_feat_cache(path, fastf1_cache, race_spec):
+    # valid only if newer than the FastF1 cache for that season
+    if not path.exists():
+        return None
+    season_dir = Path(fastf1_cache) / race_spec.split(":", 1)[0]
+    if season_dir.exists() and season_dir.stat().st_mtime > path.stat().st_mtime:
+        return None
+    try:
+        return pd.read_parquet(path)
+    except Exception as e:
+        print(f"[WRN] feature cache unreadable ({e}); rebuilding", flush=True)
+        return None
+
+def save_feat_cache(path, feat_df):
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        feat_df.to_parquet(path, compression="zstd")
+        print(f"Saved feature cache: {path}")
+    except Exception as e:
+        print(f"[WRN] could not write feature cache {path}: {e}", flush=True)
 
 # --------------- main ----------------
 
@@ -256,111 +436,108 @@ def main():
     # NEW: Bridge service for WebSocket broadcasting to frontend
     ap.add_argument("--bridge", default="http://localhost:8081/update", 
                     help="Bridge service URL for WebSocket broadcasting")
+    ap.add_argument("--batch", action="store_true",
+                    help="POST all drivers of a lap tick in one request to --batch_url")
+    ap.add_argument("--batch_url", default="http://localhost:8080/ingest_batch")
+    ap.add_argument("--feat_cache", default="data/feat_cache" if HAVE_PARQUET else "",
+                    help="Dir for per-race Parquet feature cache ('' disables; off by default without pyarrow)")
     args = ap.parse_args()
 
     feat_list = load_feat_list(args.meta)
     print(f"Loaded feat_list[{len(feat_list)}] from {args.meta}")
+    # meta repeats some names; a JSON object can only carry each key once
+    payload_keys = list(dict.fromkeys(feat_list))
+    if len(payload_keys) != len(feat_list):
+        print(f"  {len(feat_list) - len(payload_keys)} duplicate names collapsed -> {len(payload_keys)} payload keys")
+
+    cache_path = feat_cache_path(args.feat_cache, args.race, args.only) if args.feat_cache else None
+    feat_df = load_feat_cache(cache_path, args.cache, args.race) if cache_path else None
+    if feat_df is not None:
+        print(f"Loaded feature cache: {cache_path} ({len(feat_df)} laps)")
+    else:
+        print(f"Loading FastF1 {args.race} (Race) from cache: {args.cache}")
+        ses = load_fastf1_session(args.race, args.cache)
+        status_df = build_track_status_timeline(ses)
+        laps = iter_laps_stream(ses, args.only)
 
-    print(f"Loading FastF1 {args.race} (Race) from cache: {args.cache}")
-    ses = load_fastf1_session(args.race, args.cache)
-    status_df = build_track_status_timeline(ses)
-    laps = iter_laps_stream(ses, args.only)
-    drivers = sorted(list(set(laps["Driver"].str.upper().values.tolist())))
-    print("Drivers found:", drivers)
+        # Typical stint length per compound (median at pit-in)
+        typical_len_fn = typical_stint_len_by_comp(laps)
 
-    # Typical stint length per compound (median at pit-in)
-    typical_len_fn = typical_stint_len_by_comp(laps)
+        # All features for the whole stream in one vectorized pass
+        feat_df = build_feature_frame(laps, status_df, typical_len_fn).reset_index(drop=True)
+        if cache_path:
+            save_feat_cache(cache_path, feat_df)
 
-    # Per-driver state
-    state_by_driver = defaultdict(lambda: {
-        "last_laps": deque(maxlen=10),
-        "cheap_prev1": 0,
-        "cheap_prev2": 0,
-        "non_green_runlen": 0,
-        "pits_prev1": 0,
-        "pits_prev2": 0,
-        "prev_row": None,
-    })
+    drivers = sorted(set(feat_df["Driver"].tolist()))
+    print("Drivers found:", drivers)
+
+    missing = [k for k in payload_keys if k not in feat_df.columns]
+    if missing:
+        print(f"[WRN] missing {len(missing)} feats: {missing[:4]}...", flush=True)
 
+    http = make_http_session()
+    bridge = BridgePoster(http, args.bridge)
     posted = 0
-    bridge_failures = 0
-    
-    for _, lap in laps.iterrows():
-        drv = str(lap["Driver"]).upper()
-        lapnum = int(lap["LapNumber"])
-
-        row = {
-            "LapNumber": lapnum,
-            "Stint": int(lap.get("Stint", 0)),
-            "TyreLife": int(nz(lap.get("TyreLife", 0))),
-            "Compound": lap.get("Compound", None),
-            "PitIn": bool(lap.get("PitIn", False)),
-            "PitOut": bool(lap.get("PitOut", False)),
-            "LapTime": nz(lap["LapTime"]),
-            "Sector1Time": nz(lap.get("Sector1Time", 0.0)),
-            "Sector2Time": nz(lap.get("Sector2Time", 0.0)),
-            "Sector3Time": nz(lap.get("Sector3Time", 0.0)),
-            "SessionTime": nz(lap.get("Time", 0.0)),
-        }
-
-        drv_state = state_by_driver[drv]
-        feats = compute_features_for_row(row, drv_state["prev_row"], status_df, drv_state, typical_len_fn)
-
-        # sanity: check coverage and variability
-        matched = sum(1 for k in feat_list if k in feats)
-        if matched != len(feat_list):
-            missing = [k for k in feat_list if k not in feats]
-            print(f"[WRN] {drv} L{lapnum} missing {len(missing)} feats: {missing[:4]}...", flush=True)
-
-        # form flat payload: exactly the feature keys
-        payload = {"driver": drv, "lap": lapnum}
-        for k in feat_list:  # keep explicit order on server side
-            payload[k] = nz(feats.get(k, 0.0))
 
+    # positional feature matrix in payload order (finite by construction)
+    feat_mat = feat_df.reindex(columns=payload_keys, fill_value=0.0).to_numpy(dtype=np.float64)
+
+    payloads = [{"driver": drv, "lap": lapnum, **dict(zip(payload_keys, vals))}
+                for drv, lapnum, vals in zip(feat_df["Driver"].tolist(), feat_df["LapNumber"].tolist(), feat_mat.tolist())]
+
+    def on_prediction(drv, lapnum, out):
+        if args.echo:
+            p2 = out.get("p2", None)
+            p3 = out.get("p3", None)
+            print(f"[OK] {drv} L {lapnum:2d}: p2={p2:.3f} p3={p3:.3f}", flush=True)
+
+        # NEW: Send to bridge service for WebSocket broadcasting to frontend (async)
+        bridge.submit({
+            'driver': drv,
+            'lap': lapnum,
+            'p2': out.get('p2', 0.0),
+            'p3': out.get('p3', 0.0),
+            't': out.get('t', int(time.time() * 1000))
+        })
+
+    if args.batch:
+        # one request per lap tick (all drivers on that lap), in stream order
+        ticks = defaultdict(list)
+        for p in payloads:
+            ticks[p["lap"]].append(p)
+        sends = list(ticks.values())
+    else:
+        sends = [[p] for p in payloads]
+
+    for group in sends:
         try:
-            # Send to rt_predictor for inference
-            r = requests.post(args.url, json=payload, timeout=2.0)
+            if args.batch:
+                r = http.post(args.batch_url, data=dumps({"batch": group}), headers=JSON_HEADERS, timeout=2.0)
+            else:
+                # Send to rt_predictor for inference
+                r = http.post(args.url, data=dumps(group[0]), headers=JSON_HEADERS, timeout=2.0)
             if r.status_code != 200:
                 print(f"[WARN] POST {r.status_code}: {r.text[:200]}", flush=True)
             else:
                 out = r.json()
-                if args.echo:
-                    p2 = out.get("p2", None)
-                    p3 = out.get("p3", None)
-                    print(f"[OK] {drv} L {lapnum:2d}: p2={p2:.3f} p3={p3:.3f}", flush=True)
-                
-                # NEW: Send to bridge service for WebSocket broadcasting to frontend
-                try:
-                    bridge_payload = {
-                        'driver': drv,
-                        'lap': lapnum,
-                        'p2': out.get('p2', 0.0),
-                        'p3': out.get('p3', 0.0),
-                        't': out.get('t', int(time.time() * 1000))
-                    }
-                    bridge_r = requests.post(args.bridge, json=bridge_payload, timeout=1.0)
-                    if bridge_r.status_code != 200:
-                        bridge_failures += 1
-                        if bridge_failures % 50 == 0:
-                            print(f"[WARN] Bridge POST failed: {bridge_r.status_code} (total failures: {bridge_failures})", flush=True)
-                except requests.exceptions.RequestException as bridge_e:
-                    # Don't fail the main flow if bridge is down
-                    bridge_failures += 1
-                    if bridge_failures == 1:
-                        print(f"[WARN] Bridge service unavailable at {args.bridge}. Predictions won't reach frontend.", flush=True)
-                        print(f"       Make sure bridge service is running: cd bridge-service && npm start", flush=True)
-                    elif bridge_failures % 100 == 0:
-                        print(f"[WARN] Bridge connection issues (failures: {bridge_failures})", flush=True)
-                    
+                results = out.get("results", []) if args.batch else [out]
+                for p, res in zip(group, results):
+                    on_prediction(p["driver"], p["lap"], res)
+
         except Exception as e:
             print(f"[ERR] POST to rt_predictor failed: {e}", flush=True)
 
-        drv_state["prev_row"] = row
-        posted += 1
-        if posted % 50 == 0:
-            print(f"Posted {posted} packets... (bridge failures: {bridge_failures})", flush=True)
+        prev = posted
+        posted += len(group)
+        if posted // 50 > prev // 50:
+            print(f"Posted {posted} packets... (bridge failures: {bridge.failures}, dropped: {bridge.dropped})", flush=True)
+
+        # pacing only (replay speed); 0 disables
+        if args.sleep > 0:
+            time.sleep(args.sleep)
 
-        time.sleep(args.sleep if args.sleep >= 0 else 0.0)
+    bridge.close()
+    bridge_failures = bridge.failures
 
     print(f"\n=== Summary ===")
     print(f"Total packets posted to rt_predictor: {posted}")
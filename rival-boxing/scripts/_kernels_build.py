@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+AOT-compile the scalar hot kernels (numba.pycc) into scripts/rb_kernels.<ext>,
+so the prediction scripts import plain machine code instead of paying the
+numba JIT warm-up on every short CLI run. Scripts fall back to JIT / NumPy
+when the extension is absent.
+
+Optional build step: run once after installing (or upgrading) numba/NumPy, from
+rival-boxing/ (output lands next to this file):
+  pip install numba
+  python scripts/_kernels_build.py
+
+numba.pycc has been pending deprecation since numba 0.57 and may be removed in
+a future release; if it is unavailable, skip this step (the JIT/NumPy paths
+are used). rolling_slope_f8 is float64 rather than float32 so AOT results
+match the NumPy closed-form fallback bit-for-bit.
+"""
+
+from pathlib import Path
+
+import numpy as np
+from numba.pycc import CC
+
+cc = CC("rb_kernels")
+cc.output_dir = str(Path(__file__).resolve().parent)
+
+@cc.export("runlen_i32", "i4[:](i4[:])")
+def runlen_i32(arr):
+    # consecutive non-zero run length, reset at every 0
+    out = np.empty_like(arr)
+    c = 0
+    for i in range(arr.size):
+        c = c + 1 if arr[i] else 0
+        out[i] = c
+    return out
+
+@cc.export("rolling_slope_f8", "f8[:](f8[:], i4)")
+def rolling_slope_f8(x, w):
+    # OLS slope of each trailing window (up to w points) vs lap index; 0 for windows of < 2
+    n = x.size
+    out = np.zeros(n)
+    for i in range(n):
+        s = max(0, i - w + 1)
+        k = i - s + 1
+        if k < 2:
+            continue
+        tm = (k - 1) / 2.0
+        ym = 0.0
+        for j in range(s, i + 1):
+            ym += x[j]
+        ym /= k
+        num = 0.0
+        den = 0.0
+        for j in range(k):
+            dt = j - tm
+            num += dt * (x[s + j] - ym)
+            den += dt * dt
+        out[i] = num / den
+    return out
+
+if __name__ == "__main__":
+    cc.compile()
+    print(f"Built rb_kernels in {cc.output_dir}")
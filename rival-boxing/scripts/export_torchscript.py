@@ -11,6 +11,7 @@ Run:
   python scripts/export_torchscript.py
 Outputs:
   artifacts/rl/qrdqn_torchscript.pt
+  artifacts/rl/qrdqn_torchscript_int8.pt   (dynamic INT8 Linear sibling)
   artifacts/rl/meta.json   (updated/created if needed)
 """
 
@@ -23,6 +24,8 @@ import torch.nn as nn
 ART = Path("artifacts/rl")
 CKPT = ART / "qrdqn.pt"
 OUT_TS = ART / "qrdqn_torchscript.pt"
+OUT_TS_INT8 = ART / "qrdqn_torchscript_int8.pt"
+TRACE_BATCH = 32  # representative batch; traced graph keeps batch dim dynamic (view(-1,...))
 META_JSON = ART / "meta.json"
 
 class MLPQRDQN(nn.Module):
@@ -36,7 +39,7 @@ class MLPQRDQN(nn.Module):
         self.n_actions = n_actions
         self.n_quant = n_quant
 
-    def forward(self, x):
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
         z = self.backbone(x)
         qz = self.head(z).view(-1, self.n_actions, self.n_quant)  # (B,A,Q)
         return qz
@@ -81,13 +84,21 @@ def main():
     net.eval()
 
     # trace
-    example = torch.zeros(1, in_dim)
+    example = torch.zeros(TRACE_BATCH, in_dim)
     with torch.inference_mode():
         ts = torch.jit.trace(net, example)
     OUT_TS.parent.mkdir(parents=True, exist_ok=True)
     ts.save(str(OUT_TS))
     print(f"Saved TorchScript: {OUT_TS}")
 
+    # INT8 sibling: dynamic-quantized Linear layers (weights int8, activations quantized per batch)
+    qnet = torch.ao.quantization.quantize_dynamic(net, {nn.Linear}, dtype=torch.qint8)
+    with torch.inference_mode():
+        ts_q = torch.jit.trace(qnet, example)
+        err = (ts_q(example) - ts(example)).abs().max().item()
+    ts_q.save(str(OUT_TS_INT8))
+    print(f"Saved TorchScript INT8: {OUT_TS_INT8} (max |dq| on zeros batch={err:.4g})")
+
     # (Re)write meta.json to keep Rust runtime aligned
     meta_out = {
         "feat_list": feat_list,
@@ -83,9 +83,12 @@ def export_torchscript(
     out_path: str,
     n_actions: int = 2,
     n_quantiles: int = 101,
-    update_meta: bool = True
+    update_meta: bool = True,
+    quantize: bool = False,
+    trace_batch: int = 32,
+    freeze: bool = True
 ):
-    """Export model to TorchScript"""
+    """Export model to TorchScript (optionally also a dynamic-INT8 sibling)"""
     
     ckpt_path = Path(ckpt_path)
     meta_path = Path(meta_path)
@@ -141,12 +144,16 @@ def export_torchscript(
     
     # Export to TorchScript
     with torch.inference_mode():
-        dummy_input = torch.zeros(1, in_dim_ckpt, dtype=torch.float32)
+        dummy_input = torch.zeros(trace_batch, in_dim_ckpt, dtype=torch.float32)
         traced_model = torch.jit.trace(model, dummy_input)
+        if freeze:
+            # inline weights as constants + fold/fuse Linear(+ReLU) for inference
+            traced_model = torch.jit.freeze(traced_model)
+            traced_model = torch.jit.optimize_for_inference(traced_model)
         
         # Verify output shape
         test_output = traced_model(dummy_input)
-        expected_shape = (1, n_actions, n_quantiles_inferred)
+        expected_shape = (trace_batch, n_actions, n_quantiles_inferred)
         if tuple(test_output.shape) != expected_shape:
             raise RuntimeError(
                 f"Output shape mismatch! Got {tuple(test_output.shape)}, "
@@ -158,6 +165,15 @@ def export_torchscript(
         print(f"✓ Saved TorchScript model to {out_path}")
         print(f"  Input: [batch, {in_dim_ckpt}]")
         print(f"  Output: [batch, {n_actions}, {n_quantiles_inferred}]")
+
+    if quantize:
+        int8_path = out_path.with_name(out_path.stem + "_int8" + out_path.suffix)
+        qmodel = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+        with torch.inference_mode():
+            traced_q = torch.jit.trace(qmodel, dummy_input)
+            err = (traced_q(dummy_input) - test_output).abs().max().item()
+        traced_q.save(str(int8_path))
+        print(f"✓ Saved INT8 TorchScript model to {int8_path} (max |dq|={err:.4g})")
     
     # Update meta.json if requested
     if update_meta:
@@ -206,6 +222,22 @@ def main():
         action="store_true",
         help="Update meta.json with inferred dimensions"
     )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="Also write a dynamic-INT8 (nn.Linear) sibling <out>_int8.pt"
+    )
+    parser.add_argument(
+        "--trace_batch",
+        type=int,
+        default=32,
+        help="Representative batch size used for tracing (batch dim stays dynamic)"
+    )
+    parser.add_argument(
+        "--no_freeze",
+        action="store_true",
+        help="Skip torch.jit.freeze/optimize_for_inference (keep a plain traced module)"
+    )
     
     args = parser.parse_args()
     
@@ -215,7 +247,10 @@ def main():
         out_path=args.out,
         n_actions=args.n_actions,
         n_quantiles=args.n_quantiles,
-        update_meta=args.update_meta
+        update_meta=args.update_meta,
+        quantize=args.quantize,
+        trace_batch=args.trace_batch,
+        freeze=not args.no_freeze
     )
 
 if __name__ == "__main__":
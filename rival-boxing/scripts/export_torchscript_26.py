@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
+import copy
+import gc
 import json
+import pickle
 import argparse
 from pathlib import Path
 import torch
@@ -40,6 +43,13 @@ def extract_state_dict(obj: Any) -> Dict[str, torch.Tensor]:
         return obj
     raise RuntimeError(f"Unrecognized checkpoint type: {type(obj)}")
 
+def load_checkpoint(ckpt_path: Path) -> Any:
+    # mmap'd tensors-only load; full-module pickles need the unrestricted unpickler
+    try:
+        return torch.load(ckpt_path, map_location="cpu", mmap=True, weights_only=True)
+    except pickle.UnpicklingError:
+        return torch.load(ckpt_path, map_location="cpu", weights_only=False)
+
 def infer_in_dim_from_sd(sd: Dict[str, torch.Tensor]) -> int:
     # assumes first layer is backbone.0.weight with shape [hidden, in_dim]
     for k in ("backbone.0.weight", "backbone.0.linear.weight", "backbone.0.lin.weight"):
@@ -47,23 +57,34 @@ def infer_in_dim_from_sd(sd: Dict[str, torch.Tensor]) -> int:
             return sd[k].shape[1]
     raise RuntimeError("Could not infer input dim from state_dict; first layer weight not found.")
 
-# -- Wrapper that pads 26 -> orig_in_dim -----------------------
+# -- Fold the zero padding (26 -> orig_in_dim) into the first Linear ----
 
-class PadWrap(torch.nn.Module):
-    def __init__(self, base: torch.nn.Module, in_dim_runtime: int, in_dim_orig: int):
+def fold_pad_into_first_linear(base: torch.nn.Module, in_dim_runtime: int) -> torch.nn.Module:
+    """
+    The runtime sends 26 columns and the trailing orig_in_dim-26 inputs were
+    always zero-padded, so they contribute nothing: keep only the first 26
+    weight columns. Same outputs as padding, without a zeros+cat per call.
+    """
+    lin = base.backbone[0]
+    assert lin.in_features >= in_dim_runtime, "orig_in_dim must be >= runtime in_dim"
+    new = torch.nn.Linear(in_dim_runtime, lin.out_features)
+    with torch.no_grad():
+        new.weight.copy_(lin.weight[:, :in_dim_runtime])
+        new.bias.copy_(lin.bias)
+    base.backbone[0] = new
+    return base
+
+class CastWrap(torch.nn.Module):
+    """Keeps a float32 in/out contract around a reduced-precision model."""
+    def __init__(self, base: torch.nn.Module, dtype: torch.dtype):
         super().__init__()
-        self.base = base
-        self.in_dim_runtime = in_dim_runtime
-        self.in_dim_orig = in_dim_orig
-        assert in_dim_orig >= in_dim_runtime, "orig_in_dim must be >= runtime in_dim"
-        self.pad = in_dim_orig - in_dim_runtime
+        self.base = base.to(dtype)
+        self.dtype = dtype
 
     def forward(self, x: torch.Tensor) -> torch.Tensor:
-        # x: [B, 26]  -> cat zeros -> [B, 38]
-        if self.pad > 0:
-            z = torch.zeros((x.shape[0], self.pad), dtype=x.dtype, device=x.device)
-            x = torch.cat([x, z], dim=1)
-        return self.base(x)
+        return self.base(x.to(self.dtype)).float()
+
+DTYPES = {"fp32": torch.float32, "fp16": torch.float16, "bf16": torch.bfloat16}
 
 # -- Main ------------------------------------------------------
 
@@ -80,6 +101,12 @@ def main():
     ap.add_argument("--n_actions", type=int, default=2)
     ap.add_argument("--n_quantiles", type=int, default=101)  # from your train defaults
     ap.add_argument("--hidden", type=int, default=256)       # from your train defaults
+    ap.add_argument("--quantize", action="store_true",
+                    help="Also write a dynamic-INT8 (nn.Linear) sibling <out_ts>_int8.pt")
+    ap.add_argument("--dtype", choices=list(DTYPES), default="fp32",
+                    help="Weight/activation precision of the exported model (I/O stays float32)")
+    ap.add_argument("--out_onnx", default="",
+                    help="Also export a batch-polymorphic ONNX graph here for onnxruntime serving (e.g. artifacts/rl/qrdqn.onnx)")
     args = ap.parse_args()
 
     meta_path = Path(args.meta)
@@ -92,7 +119,7 @@ def main():
     MLPQRDQN = load_mlp_class()
 
     # Load checkpoint and infer original input dim (likely 38)
-    obj = torch.load(ckpt_path, map_location="cpu")
+    obj = load_checkpoint(ckpt_path)
     sd = extract_state_dict(obj)
     in_dim_orig = infer_in_dim_from_sd(sd)
     print(f"Inferred original input dim from checkpoint: {in_dim_orig}")
@@ -104,18 +131,45 @@ def main():
         n_actions=args.n_actions,
         n_quant=args.n_quantiles
     )
-    missing, unexpected = base.load_state_dict(sd, strict=False)
+    missing, unexpected = base.load_state_dict(sd, strict=False, assign=True)
     print("load_state_dict -> missing:", missing, "unexpected:", unexpected)
+    del obj, sd
+    gc.collect()
 
-    # Wrap with PadWrap so runtime expects 26 and pads internally to in_dim_orig
-    wrapped = PadWrap(base, in_dim_runtime=in_dim_runtime, in_dim_orig=in_dim_orig)
-    wrapped.eval()
+    # Runtime expects 26: slice the first Linear instead of padding at inference time
+    base = fold_pad_into_first_linear(base, in_dim_runtime).eval()
+    fp32_base = base
+    if args.dtype != "fp32":
+        base = CastWrap(copy.deepcopy(base), DTYPES[args.dtype]).eval()
 
+    # script (not trace): no example shape is baked in, batch size stays polymorphic
+    ts = torch.jit.script(base)
     with torch.inference_mode():
-        dummy = torch.zeros(1, in_dim_runtime, dtype=torch.float32)
-        ts = torch.jit.trace(wrapped, dummy)
+        # constant-fold weights and fuse Linear+ReLU for inference
+        ts = torch.jit.optimize_for_inference(torch.jit.freeze(ts.eval()))
         ts.save(str(out_ts))
-        print(f"Saved TorchScript (runtime in=26, internal in={in_dim_orig}) -> {out_ts}")
+        print(f"Saved TorchScript (runtime in=26, folded from in={in_dim_orig}, {args.dtype}) -> {out_ts}")
+
+    if args.out_onnx:
+        # Same folded model as the TorchScript artifact; dynamic batch axis on input x and output q
+        out_onnx = Path(args.out_onnx)
+        with torch.no_grad():
+            torch.onnx.export(base, (torch.zeros(1, in_dim_runtime, dtype=torch.float32),), str(out_onnx),
+                              input_names=["x"], output_names=["q"],
+                              dynamic_axes={"x": {0: "B"}, "q": {0: "B"}}, opset_version=17,
+                              dynamo=False)  # TorchScript exporter: needs onnx only, not onnxscript
+        print(f"Saved ONNX (in={in_dim_runtime}, {args.dtype}) -> {out_onnx}")
+
+    if args.quantize:
+        int8_path = out_ts.with_name(out_ts.stem + "_int8" + out_ts.suffix)
+        # per-output-channel int8 weight scales; FBGEMM/x86 or QNNPACK kernels picked by torch
+        qspec = {torch.nn.Linear: torch.ao.quantization.per_channel_dynamic_qconfig}
+        qbase = torch.ao.quantization.quantize_dynamic(fp32_base, qspec, dtype=torch.qint8).eval()
+        ts_q = torch.jit.script(qbase)
+        with torch.inference_mode():
+            ts_q = torch.jit.freeze(ts_q.eval())
+            ts_q.save(str(int8_path))
+        print(f"Saved INT8 TorchScript -> {int8_path}")
 
     if args.update_meta:
         # Keep runtime contract explicit
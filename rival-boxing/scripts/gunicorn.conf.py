@@ -0,0 +1,19 @@
+# Production WSGI config for test_server.app
+#
+# Usage (from rival-boxing/, so artifacts/rl/ resolves):
+#   gunicorn -c scripts/gunicorn.conf.py test_server:app
+#
+# One process, many threads: torch runs single-threaded per call and releases
+# the GIL inside the forward, request threads overlap, and the micro-batch
+# worker sees them all. No preload, so the model, OpenMP pools and the batch
+# thread are created in the worker after fork instead of being duplicated.
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8080")
+pythonpath = "scripts"
+worker_class = "gthread"
+workers = 1
+threads = int(os.getenv("THREADS", "8"))
+preload_app = False
+timeout = 30
+keepalive = 5
@@ -23,11 +23,13 @@ import os
 import json
 import argparse
 from pathlib import Path
+from importlib.util import find_spec
+from functools import lru_cache
+from collections import Counter
 from typing import List, Dict, Tuple
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
 import torch
 import torch.nn as nn
@@ -74,10 +76,6 @@ def load_race_session(race_spec: str):
     year_evt = int(pd.Timestamp(ses.event["EventDate"]).year)
     return ses, race_id, track_name, year_evt
 
-def _safe_secs(td):
-    try: return float(td.total_seconds())
-    except Exception: return None
-
 def lap_time_window_cols(laps_df: pd.DataFrame) -> pd.DataFrame:
     df = laps_df.copy()
     if "LapStartTime" not in df.columns or df["LapStartTime"].isna().all():
@@ -89,46 +87,81 @@ def lap_time_window_cols(laps_df: pd.DataFrame) -> pd.DataFrame:
     df["LapEndTime"] = df["LapStartTime"] + df["LapTime"].fillna(pd.Timedelta(seconds=0))
     return df
 
-def non_green_in_window(track_status: pd.DataFrame, start: pd.Timedelta, end: pd.Timedelta) -> int:
-    if track_status is None or len(track_status)==0: return 0
-    sub = track_status[(track_status["Time"] >= start) & (track_status["Time"] <= end)]
-    return int(((sub["Status"].astype(str) != "1")).any())
+def non_green_in_windows(track_status: pd.DataFrame, starts: pd.Series, ends: pd.Series) -> np.ndarray:
+    """
+    Per lap: 1 if any non-"1" track-status entry has start <= Time <= end.
+    One searchsorted pair over the sorted status times + a prefix sum.
+    """
+    n = len(starts)
+    if track_status is None or len(track_status)==0: return np.zeros(n, dtype=int)
+    ts = track_status[track_status["Time"].notna()].sort_values("Time", kind="stable")
+    t = ts["Time"].to_numpy(dtype="timedelta64[ns]").astype(np.int64)
+    bad = np.r_[0, np.cumsum(ts["Status"].astype(str).to_numpy() != "1")]
+    st = pd.to_timedelta(starts).to_numpy(dtype="timedelta64[ns]")
+    en = pd.to_timedelta(ends).to_numpy(dtype="timedelta64[ns]")
+    ok = ~(np.isnat(st) | np.isnat(en))
+    lo = np.searchsorted(t, st.astype(np.int64), side="left")
+    hi = np.searchsorted(t, en.astype(np.int64), side="right")
+    return (ok & (bad[np.maximum(hi, lo)] - bad[lo] > 0)).astype(int)
+
+LAST_LAP_COLS = [f"last_lap_m{k}" for k in range(5, 0, -1)]  # oldest -> newest, NaN-padded
 
 def build_car_lap_rows(session, race_id: str, track_key: str, year_evt: int) -> pd.DataFrame:
-    rows=[]
-    laps_all = lap_time_window_cols(session.laps)
+    """
+    One row per (driver, lap), drivers sorted, laps ascending. Stint/age and
+    the pit-within-2 labels come from per-driver shifts / lap-number lookups;
+    LAST_LAP_COLS hold the previous (up to 5) valid lap times in seconds.
+    """
+    laps = lap_time_window_cols(session.laps)
+    laps = laps[laps["Driver"].notna()].sort_values(["Driver","LapNumber"], kind="stable").reset_index(drop=True)
     ts = getattr(session, "track_status", None)
-    for drv, g in laps_all.groupby("Driver"):
-        g=g.sort_values("LapNumber").reset_index(drop=True)
-        stint_no=0; last_comp=None; age=0; last_full=[]
-        index_map={int(r["LapNumber"]): r for _, r in g.iterrows()}
-        for _, row in g.iterrows():
-            lap=int(row["LapNumber"])
-            comp=str(row.get("Compound","")).upper() or "HARD"
-            pit_in=row.get("PitInTime"); pit_out=row.get("PitOutTime")
-            if (comp != last_comp) or pd.notnull(pit_out):
-                stint_no+=1; age=0; last_comp=comp
-            next_lap = index_map.get(lap+1)
-            pitted_this = int(pd.notnull(pit_in) or (next_lap is not None and pd.notnull(next_lap.get("PitOutTime"))))
-            next2 = index_map.get(lap+2)
-            pitted_next = int(next_lap is not None and (pd.notnull(next_lap.get("PitInTime")) or (next2 is not None and pd.notnull(next2.get("PitOutTime")))))
-            y_within2 = int(pitted_this or pitted_next)
-            start_t=row["LapStartTime"]; end_t=row["LapEndTime"]
-            cheap = non_green_in_window(ts, start_t, end_t)
-            rows.append({
-                "race_id": race_id, "track": track_key, "year": year_evt, "driver": drv, "lap": lap,
-                "stint_no": stint_no, "compound": comp, "tire_age_laps": age,
-                "last_laps_json": json.dumps(last_full[-5:]),
-                "cheap_stop_flag_true": cheap,
-                "pitted_this_lap": pitted_this,
-                "pitted_within2": y_within2
-            })
-            lt=row.get("LapTime")
-            if pd.notnull(lt):
-                s=_safe_secs(lt)
-                if s is not None: last_full.append(s)
-            age+=1
-    return pd.DataFrame(rows)
+    drv = laps["Driver"]
+    lapno = laps["LapNumber"]
+    new_drv = (drv != drv.shift()).to_numpy()
+
+    comp = (laps["Compound"].map(str).str.upper() if "Compound" in laps else pd.Series("", index=laps.index))
+    comp = comp.mask(comp == "", "HARD")
+    pit_in = laps["PitInTime"].notna() if "PitInTime" in laps else pd.Series(False, index=laps.index)
+    pit_out = laps["PitOutTime"].notna() if "PitOutTime" in laps else pd.Series(False, index=laps.index)
+
+    # stint starts on compound change, pit-out, or a new driver; age counts laps within stint
+    new_stint = new_drv | (comp != comp.shift()).to_numpy() | pit_out.to_numpy()
+    stint_no = pd.Series(new_stint.astype(int)).groupby(drv).cumsum()
+    age = pd.Series(0, index=laps.index).groupby([drv, stint_no]).cumcount()
+
+    # lap+1 / lap+2 lookups by lap number (gaps -> missing), last row wins on duplicates
+    flags = pd.DataFrame({"present": True, "pit_in": pit_in, "pit_out": pit_out,
+                          "Driver": drv, "LapNumber": lapno}).drop_duplicates(["Driver","LapNumber"], keep="last")
+    flags = flags.set_index(["Driver","LapNumber"])
+    def at(offset):
+        key = pd.MultiIndex.from_arrays([drv, lapno + offset])
+        return flags.reindex(key).fillna(False).astype(bool).to_numpy().T  # present, pit_in, pit_out
+    nx_present, nx_in, nx_out = at(1)
+    _, _, nx2_out = at(2)
+    pitted_this = pit_in.to_numpy() | nx_out
+    pitted_next = nx_present & (nx_in | nx2_out)
+
+    # previous up-to-5 valid lap times: index into the compacted valid-time array
+    secs = laps["LapTime"].dt.total_seconds().to_numpy()
+    valid = ~np.isnan(secs)
+    vt = secs[valid]
+    before = np.cumsum(valid) - valid                      # valid laps strictly before each row
+    drv_start = np.maximum.accumulate(np.where(new_drv, before, 0))
+    last = {}
+    for k in range(1, 6):
+        idx = before - k
+        last[f"last_lap_m{k}"] = np.where(idx >= drv_start, vt[np.clip(idx, 0, max(len(vt)-1, 0))] if len(vt) else np.nan, np.nan)
+
+    cheap = non_green_in_windows(ts, laps["LapStartTime"], laps["LapEndTime"])
+    out = pd.DataFrame({
+        "race_id": race_id, "track": track_key, "year": year_evt, "driver": drv.map(str).str.upper(), "lap": lapno.astype(int),
+        "stint_no": stint_no.astype(int), "compound": comp, "tire_age_laps": age.astype(int),
+        **{c: last[c].astype(np.float32) for c in LAST_LAP_COLS},  # fixed-width float32 buffer, no JSON
+        "cheap_stop_flag_true": np.asarray(cheap, dtype=int),
+        "pitted_this_lap": pitted_this.astype(int),
+        "pitted_within2": (pitted_this | pitted_next).astype(int),
+    })
+    return out
 
 def median_stint_lengths(df: pd.DataFrame) -> Dict[str, Dict[str, float]]:
     stint = (df.groupby(["race_id","driver","stint_no"], as_index=False)
@@ -147,83 +180,139 @@ def make_per_lap_pit_counts(df: pd.DataFrame) -> pd.DataFrame:
     agg["pits_prev2"] = agg.groupby("race_id")["pits_this_lap"].shift(2).fillna(0)
     return agg[["race_id","lap","pits_prev1","pits_prev2"]]
 
-def parse_last(js, k=5):
-    try:
-        arr = json.loads(js) if isinstance(js,str) else js
-        return [float(x) for x in (arr or [])][-k:]
-    except Exception:
-        return []
-
-def slope(vals):
-    if len(vals)<3: return 0.0
-    x = np.arange(len(vals), dtype=float); y = np.array(vals, dtype=float)
-    x -= x.mean(); y -= y.mean()
-    d = (x**2).sum()
-    return float((x*y).sum()/d) if d else 0.0
-
-def var3(vals):
-    if len(vals)<3: return 0.0
-    return float(np.var(vals[-3:]))
-
-def hazard_features(df: pd.DataFrame, priors: Dict[str, Dict[str, float]]) -> pd.DataFrame:
-    feats=pd.DataFrame(index=df.index)
-    feats["tire_age_laps"]=df["tire_age_laps"].fillna(0).clip(lower=0).astype(float)
-    feats["stint_no"]=df["stint_no"].fillna(1).astype(int)
+def last_lap_stats(M: np.ndarray):
+    """
+    Row-wise over the NaN-padded last-laps matrix:
+    last3_avg (mean of up to 3, 0 if none), last5_slope (OLS over the valid
+    tail, 0 if <3 points), last3_var (population var of last 3, 0 if <3).
+    """
+    M = M.astype(np.float32, copy=False)
+    valid = ~np.isnan(M)
+    Y = np.where(valid, M, np.float32(0))
+    cnt = valid.sum(axis=1)
+    n3 = valid[:, -3:].sum(axis=1)
+    avg3 = Y[:, -3:].sum(axis=1) / np.maximum(n3, 1)
+    var3 = np.where(cnt >= 3, ((Y[:, -3:] - avg3[:, None])**2).mean(axis=1, dtype=np.float32), np.float32(0))
+    x = np.arange(M.shape[1], dtype=np.float32)
+    n = np.maximum(cnt, 1)
+    xbar = (valid * x).sum(axis=1) / n
+    ybar = Y.sum(axis=1) / n
+    dx = np.where(valid, x - xbar[:, None], np.float32(0))
+    num = (dx * (Y - ybar[:, None])).sum(axis=1)
+    den = (dx**2).sum(axis=1)
+    slope = np.where((cnt >= 3) & (den > 0), num / np.where(den > 0, den, np.float32(1)), np.float32(0))
+    return avg3, slope, var3
+
+def run_length(a: np.ndarray) -> np.ndarray:
+    # consecutive-ones count, reset at every 0: idx - index of last zero
+    idx = np.arange(len(a))
+    last_zero = np.maximum.accumulate(np.where(a == 0, idx, -1))
+    return idx - last_zero
+
+def compound_onehot(df: pd.DataFrame) -> np.ndarray:
+    # (N,5) int8 one-hot over COMPOUNDS; unknown compounds -> all-zero row
     comp=df["compound"].str.upper().fillna("HARD")
-    for c in COMPOUNDS: feats[f"compound_{c}"]=(comp==c).astype(int)
-    last=df["last_laps_json"].apply(parse_last)
-    feats["last3_avg"]=last.apply(lambda a: float(np.mean(a[-3:])) if len(a) else 0.0)
-    feats["last5_slope"]=last.apply(slope)
-    feats["last3_var"]=last.apply(var3)
-    med=df.apply(lambda r: priors.get(r["track"],{}).get(str(r["compound"]).upper(),None), axis=1)
-    feats["typical_stint_len"]=med.fillna(0).astype(float)
-    feats["age_vs_typical"]=feats["tire_age_laps"]-feats["typical_stint_len"]
-    feats["age_percentile"]=(feats["tire_age_laps"]/(feats["typical_stint_len"]+1e-6)).clip(upper=1.4)
-    feats["overshoot"]=(feats["tire_age_laps"]-feats["typical_stint_len"]).clip(lower=0)
-    return feats
-
-def tactical_features(df: pd.DataFrame, perlap: pd.DataFrame) -> pd.DataFrame:
-    feats=pd.DataFrame(index=df.index)
-    cheap=df["cheap_stop_flag_true"].astype(int)
-    feats["cheap_stop_flag"]=cheap
+    codes=pd.Categorical(comp, categories=COMPOUNDS).codes
+    oh=np.zeros((len(df), len(COMPOUNDS)+1), dtype=np.int8)
+    oh[np.arange(len(df)), codes]=1  # code -1 lands in the spare last column
+    return oh[:, :len(COMPOUNDS)]
+
+HAZARD_FEATS = ["tire_age_laps","stint_no"] + [f"compound_{c}" for c in COMPOUNDS] + \
+    ["last3_avg","last5_slope","last3_var","typical_stint_len","age_vs_typical","age_percentile","overshoot"]
+# tire_age_laps / compound_* are also "due markers" in the trainer's tactical block;
+# they are identical to the hazard columns, so they live in one slot here
+TACTICAL_FEATS = ["cheap_stop_flag","cheap_prev1","cheap_prev2","non_green_runlen","pits_prev1","pits_prev2"]
+FEAT_ORDER = HAZARD_FEATS + TACTICAL_FEATS  # 20 unique names; model_inputs expands to the meta layout
+
+def hazard_features(df: pd.DataFrame, priors: Dict[str, Dict[str, float]], oh: np.ndarray = None,
+                    out: np.ndarray = None) -> np.ndarray:
+    """Fills (N, len(HAZARD_FEATS)) float32 `out` (allocated if None) in HAZARD_FEATS order."""
+    if out is None: out=np.empty((len(df), len(HAZARD_FEATS)), dtype=np.float32)
+    col={n:i for i,n in enumerate(HAZARD_FEATS)}
+    age=df["tire_age_laps"].fillna(0).clip(lower=0).to_numpy(dtype=np.float32)
+    out[:,col["tire_age_laps"]]=age
+    out[:,col["stint_no"]]=df["stint_no"].fillna(1).astype(int).to_numpy()
+    if oh is None: oh=compound_onehot(df)
+    out[:,col["compound_SOFT"]:col["compound_SOFT"]+len(COMPOUNDS)]=oh
+    M=df[LAST_LAP_COLS].to_numpy(dtype=np.float32)
+    out[:,col["last3_avg"]], out[:,col["last5_slope"]], out[:,col["last3_var"]] = last_lap_stats(M)
+    flat={(t,c): v for t,d in priors.items() for c,v in d.items()}
+    key=pd.Series(list(zip(df["track"], df["compound"].astype(str).str.upper())), index=df.index)
+    typ=key.map(flat).fillna(0).to_numpy(dtype=np.float32)
+    out[:,col["typical_stint_len"]]=typ
+    out[:,col["age_vs_typical"]]=age-typ
+    out[:,col["age_percentile"]]=np.minimum(age/(typ+np.float32(1e-6)), np.float32(1.4))
+    out[:,col["overshoot"]]=np.maximum(age-typ, np.float32(0))
+    return out
+
+def tactical_features(df: pd.DataFrame, perlap: pd.DataFrame, out: np.ndarray = None) -> np.ndarray:
+    """Fills (N, len(TACTICAL_FEATS)) float32 `out` (allocated if None) in TACTICAL_FEATS order."""
+    if out is None: out=np.empty((len(df), len(TACTICAL_FEATS)), dtype=np.float32)
+    col={n:i for i,n in enumerate(TACTICAL_FEATS)}
+    out[:,col["cheap_stop_flag"]]=df["cheap_stop_flag_true"].astype(int).to_numpy()
     grp=df.groupby("race_id")
-    feats["cheap_prev1"]=grp["cheap_stop_flag_true"].shift(1).fillna(0).astype(int)
-    feats["cheap_prev2"]=grp["cheap_stop_flag_true"].shift(2).fillna(0).astype(int)
-    # run length per race
-    run_series=pd.Series(0,index=df.index,dtype=int)
-    for rid, idx in df.sort_values(["race_id","lap"]).groupby("race_id").groups.items():
-        sub=df.loc[idx]
-        arr=sub["cheap_stop_flag_true"].astype(int).to_numpy()
-        out=np.zeros_like(arr,dtype=int); c=0
-        for i,v in enumerate(arr):
-            c = c+1 if v==1 else 0
-            out[i]=c
-        run_series.loc[idx]=out
-    feats["non_green_runlen"]=run_series.astype(int)
-    # per-lap pit behavior
+    out[:,col["cheap_prev1"]]=grp["cheap_stop_flag_true"].shift(1).fillna(0).to_numpy()
+    out[:,col["cheap_prev2"]]=grp["cheap_stop_flag_true"].shift(2).fillna(0).to_numpy()
+    # run length per race (rows in race_id, lap order)
+    srt=df.sort_values(["race_id","lap"])
+    run_series=srt.groupby("race_id", sort=False)["cheap_stop_flag_true"].transform(
+        lambda x: run_length(x.to_numpy(np.int8)))
+    out[:,col["non_green_runlen"]]=run_series.reindex(df.index).to_numpy()
+    # per-lap pit behavior (left merge keeps df row order)
     joined=df.merge(perlap, how="left", on=["race_id","lap"]).fillna({"pits_prev1":0,"pits_prev2":0})
-    feats["pits_prev1"]=joined["pits_prev1"].astype(float)
-    feats["pits_prev2"]=joined["pits_prev2"].astype(float)
-    # due markers
-    feats["tire_age_laps"]=df["tire_age_laps"].fillna(0).clip(lower=0).astype(float)
-    comp=df["compound"].str.upper().fillna("HARD")
-    for c in COMPOUNDS: feats[f"compound_{c}"]=(comp==c).astype(int)
-    return feats
-
-def build_state_matrix(base: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
-    priors=median_stint_lengths(base)
-    perlap=make_per_lap_pit_counts(base)
-    H=hazard_features(base, priors)
-    T=tactical_features(base, perlap)
-    X=pd.concat([H,T], axis=1)
-    feat_list=list(X.columns)
-    return X, feat_list
+    out[:,col["pits_prev1"]]=joined["pits_prev1"].to_numpy()
+    out[:,col["pits_prev2"]]=joined["pits_prev2"].to_numpy()
+    return out
+
+def compute_global_priors(base_all: pd.DataFrame):
+    """Cross-driver per-race aggregates: (median stint priors, per-lap pit counts)."""
+    return median_stint_lengths(base_all), make_per_lap_pit_counts(base_all)
+
+def build_features(base_all: pd.DataFrame, priors, perlap, rows: np.ndarray = None) -> Tuple[np.ndarray, List[str]]:
+    """
+    (len(rows),20) float32 features for base_all.iloc[rows] (all rows if None).
+    Hazard features are per-row, so only the requested rows are built. Tactical
+    flags (prev / run-length) depend on neighbouring rows of the race grid, so
+    they are computed on the full table (vectorized, cheap) and then sliced.
+    """
+    if rows is None: rows=np.arange(len(base_all))
+    sub=base_all.iloc[rows]
+    X=np.empty((len(rows), len(FEAT_ORDER)), dtype=np.float32)
+    nh=len(HAZARD_FEATS)
+    hazard_features(sub, priors, compound_onehot(sub), out=X[:,:nh])
+    X[:,nh:]=tactical_features(base_all, perlap)[rows]
+    return X, list(FEAT_ORDER)
+
+def build_state_matrix(base: pd.DataFrame) -> Tuple[np.ndarray, List[str]]:
+    """Returns (X, FEAT_ORDER): one preallocated (N,20) float32 matrix, hazard then tactical block."""
+    priors, perlap = compute_global_priors(base)
+    return build_features(base, priors, perlap)
+
+def model_inputs(X: np.ndarray, feat_order: List[str], meta_feats: List[str], in_dim: int) -> np.ndarray:
+    """
+    Select/arrange feature columns for the checkpoint's input layer.
+    Checkpoints trained on X[feat_list] with duplicated names saw pandas'
+    duplicate-label expansion (each repeated name pulls every matching
+    column, e.g. 26 names -> 38 inputs); those are reproduced here.
+    """
+    pos={n:i for i,n in enumerate(feat_order)}
+    missing=[n for n in meta_feats if n not in pos]
+    if missing: raise ValueError(f"features missing from state matrix: {missing[:5]}")
+    counts=Counter(meta_feats)
+    if in_dim == len(meta_feats):
+        cols=[pos[n] for n in meta_feats]
+    elif in_dim == sum(counts[n] for n in meta_feats):
+        cols=[pos[n] for n in meta_feats for _ in range(counts[n])]
+    else:
+        raise ValueError(f"checkpoint in_dim={in_dim} does not match feat_list[{len(meta_feats)}]")
+    return np.ascontiguousarray(X[:,cols], dtype=np.float32)
 
 # ----------------------------- Loading artifacts -----------------------------
 
 def load_artifacts(artifacts_dir: str):
     rl_dir = Path(artifacts_dir) / "rl"
-    ckpt = torch.load(rl_dir / "qrdqn.pt", map_location="cpu")
+    # file-backed storages: weights are paged in, not copied to heap
+    ckpt = torch.load(rl_dir / "qrdqn.pt", map_location="cpu", mmap=True, weights_only=True)
     meta = json.loads((rl_dir / "meta.json").read_text())
     calib = json.loads((rl_dir / "calib_platt.json").read_text())
     return ckpt, meta, calib
@@ -235,24 +324,45 @@ def build_net_from_ckpt(ckpt):
         n_quantiles=ckpt["n_quantiles"],
         hidden=ckpt["hidden"],
     )
-    net.load_state_dict(ckpt["state_dict"])
+    net.load_state_dict(ckpt["state_dict"], assign=True)
     net.eval()
     return net
 
+@lru_cache(maxsize=4)
+def load_predictor(artifacts_dir: str):
+    """(net on device, meta, calib, device, in_dim), built once per artifacts dir."""
+    ckpt, meta, calib = load_artifacts(artifacts_dir)
+    device = choose_device()
+    net = build_net_from_ckpt(ckpt).to(device)
+    return net, meta, calib, device, int(ckpt["in_dim"])
+
 # ----------------------------- Probability helpers -----------------------------
 
 def _score_to_prob(scores: np.ndarray, calib: dict) -> np.ndarray:
-    # Platt scaling
-    z = calib["coef"] * scores + calib["intercept"]
-    return 1.0 / (1.0 + np.exp(-z))
+    # Platt scaling, kept in float32 end-to-end
+    scores = np.asarray(scores).astype(np.float32, copy=False)
+    z = np.float32(calib["coef"]) * scores + np.float32(calib["intercept"])
+    return np.float32(1) / (np.float32(1) + np.exp(-z))
+
+_PINNED = None  # reusable pinned host staging buffer (CUDA only)
+
+def _to_device(X_block: np.ndarray, device) -> torch.Tensor:
+    global _PINNED
+    x = torch.from_numpy(np.ascontiguousarray(X_block, dtype=np.float32))  # zero-copy view
+    if device.type != "cuda":
+        return x.to(device)
+    if _PINNED is None or _PINNED.shape[0] < x.shape[0] or _PINNED.shape[1] != x.shape[1]:
+        _PINNED = torch.empty(tuple(x.shape), dtype=torch.float32, pin_memory=True)
+    buf = _PINNED[:x.shape[0]]
+    buf.copy_(x)
+    return buf.to(device, non_blocking=True)
 
 def _prob_within2(net, device, X_block: np.ndarray) -> np.ndarray:
-    with torch.no_grad():
-        x = torch.tensor(X_block, dtype=torch.float32, device=device)
-        qz = net(x).cpu().numpy()              # (N,2,Q)
-        exp = qz.mean(axis=-1)                 # (N,2)
+    with torch.inference_mode():
+        x = _to_device(X_block, device)
+        exp = net(x).mean(dim=-1)              # (N,2), reduced on device
         scores = exp[:,1] - exp[:,0]           # BOX - NOBOX
-    return scores
+    return scores.cpu().numpy()                # only N floats cross to host
 
 def _prob_within3(net, device, X_block: np.ndarray, calib: dict) -> np.ndarray:
     """
@@ -261,49 +371,98 @@ def _prob_within3(net, device, X_block: np.ndarray, calib: dict) -> np.ndarray:
     where p2 is the calibrated within-2 probability. For t+1, we use the next state's features.
     Last lap uses only p2(t).
     """
-    scores_t = _prob_within2(net, device, X_block)
-    p2_t = _score_to_prob(scores_t, calib)
-
     # shift X by one for t+1
     X_next = np.vstack([X_block[1:], X_block[-1:]])   # duplicate last for boundary
-    scores_t1 = _prob_within2(net, device, X_next)
+    # one forward pass over [X_t; X_t+1]
+    scores_t, scores_t1 = np.split(_prob_within2(net, device, np.concatenate([X_block, X_next], 0)), 2)
+    p2_t = _score_to_prob(scores_t, calib)
     p2_t1 = _score_to_prob(scores_t1, calib)
 
-    p3 = 1.0 - (1.0 - p2_t) * (1.0 - p2_t1)
+    p3 = np.float32(1) - (np.float32(1) - p2_t) * (np.float32(1) - p2_t1)
     return p3
 
+# ----------------------------- Per-race table cache -----------------------------
+
+# pandas reads/writes Parquet through pyarrow or fastparquet; without one the cache defaults off
+HAVE_PARQUET = any(find_spec(m) is not None for m in ("pyarrow", "fastparquet"))
+
+def race_cache_paths(cache_root: str, race_spec: str) -> Tuple[Path, Path]:
+    """(<race_id>_base.parquet, <race_id>_X.npy) under cache_root."""
+    year_s, gp = race_spec.split(":", 1)
+    key = f"{year_s}_{gp}".replace(" ", "_")
+    return Path(cache_root) / f"{key}_base.parquet", Path(cache_root) / f"{key}_X.npy"
+
+def load_race_cache(cache_root: str, race_spec: str, fastf1_cache: str):
+    """(base_all, X_all) if both cached files exist and are newer than the FastF1 season cache, else None."""
+    base_p, x_p = race_cache_paths(cache_root, race_spec)
+    if not (base_p.exists() and x_p.exists()):
+        return None
+    season_dir = Path(fastf1_cache) / race_spec.split(":", 1)[0]
+    if season_dir.exists() and season_dir.stat().st_mtime > min(base_p.stat().st_mtime, x_p.stat().st_mtime):
+        return None
+    try:
+        base_all, X_all = pd.read_parquet(base_p), np.load(x_p)
+    except Exception as e:
+        print(f"[WRN] race cache unreadable ({e}); rebuilding")
+        return None
+    if X_all.shape != (len(base_all), len(FEAT_ORDER)):
+        return None
+    return base_all, X_all
+
+def save_race_cache(cache_root: str, race_spec: str, base_all: pd.DataFrame, X_all: np.ndarray):
+    base_p, x_p = race_cache_paths(cache_root, race_spec)
+    try:
+        base_p.parent.mkdir(parents=True, exist_ok=True)
+        base_all.to_parquet(base_p, compression="zstd")
+        np.save(x_p, X_all)
+        print(f"Saved race cache: {base_p.parent}")
+    except Exception as e:
+        print(f"[WRN] could not write race cache {base_p.parent}: {e}")
+
 # ----------------------------- Main prediction routine -----------------------------
 
 def predict_for_driver(race_spec: str, driver_code: str, cache_dir: str, artifacts_dir: str,
-                       hops: int = 2) -> pd.DataFrame:
+                       hops: int = 2, race_cache: str = None) -> pd.DataFrame:
     """
     Returns a DataFrame with columns:
       lap, prob_withinK, cheap_stop_flag_true, pitted_this_lap, pitted_within2
+    With race_cache set, the all-driver base table and feature matrix are
+    reused from disk, so repeat runs on a race skip the FastF1 load entirely.
     """
-    enable_cache(cache_dir)
-    ses, race_id, track, year = load_race_session(race_spec)
-
-    # Build the full race base table (all drivers), then filter to driver
-    base_all = build_car_lap_rows(ses, race_id, track, year)
-    base = base_all[base_all["driver"].astype(str).str.upper() == driver_code.upper()].copy()
-    base = base.sort_values("lap").reset_index(drop=True)
-
-    # Features (use global priors/per-lap computed on full grid to match trainer)
-    X_all, feat_list = build_state_matrix(base_all)
-    X_drv = X_all.loc[base.index, feat_list].to_numpy(dtype=np.float32)
+    cached = load_race_cache(race_cache, race_spec, cache_dir) if race_cache else None
+    if cached is not None:
+        base_all, X_all = cached
+        print(f"Loaded race cache for {race_spec} ({len(base_all)} rows)")
+    else:
+        enable_cache(cache_dir)
+        ses, race_id, track, year = load_race_session(race_spec)
+        # Build the full race base table (all drivers), then filter to driver
+        base_all = build_car_lap_rows(ses, race_id, track, year)
+        X_all = None
+
+    mask = (base_all["driver"] == driver_code.upper()).to_numpy()  # codes upper-cased at build time
+    rows = np.flatnonzero(mask)
+    rows = rows[np.argsort(base_all["lap"].to_numpy()[rows], kind="stable")]
+    base = base_all.iloc[rows].reset_index(drop=True)
+
+    # Features: priors/per-lap aggregates on the full grid (to match trainer),
+    # per-row feature work on this driver's rows only (all rows when caching)
+    feat_list = list(FEAT_ORDER)
+    if X_all is not None:
+        X_drv = X_all[rows]
+    elif race_cache:
+        X_all, _ = build_state_matrix(base_all)
+        save_race_cache(race_cache, race_spec, base_all, X_all)
+        X_drv = X_all[rows]
+    else:
+        priors, perlap = compute_global_priors(base_all)
+        X_drv, feat_list = build_features(base_all, priors, perlap, rows)
 
-    # Load model + calib
-    ckpt, meta, calib = load_artifacts(artifacts_dir)
+    # Load model + calib (memoized per artifacts dir)
+    net, meta, calib, device, in_dim = load_predictor(artifacts_dir)
     # Safety: enforce feature order from meta if present
     meta_feats = meta.get("feat_list", feat_list)
-    # Reindex X columns to meta order if needed
-    if meta_feats != feat_list:
-        # Build mapped frame to meta order
-        X_all_meta = X_all[meta_feats]
-        X_drv = X_all_meta.loc[base.index].to_numpy(dtype=np.float32)
-
-    device = choose_device()
-    net = build_net_from_ckpt(ckpt).to(device)
+    X_drv = model_inputs(X_drv, feat_list, meta_feats, in_dim)
 
     # Scores -> prob
     if hops == 2:
@@ -323,6 +482,12 @@ def predict_for_driver(race_spec: str, driver_code: str, cache_dir: str, artifac
 
 def plot_probability(df: pd.DataFrame, hops: int, title: str, save_path: str = None,
                      threshold: float = None):
+    # lazy: CSV-only runs never pay the matplotlib import; headless Agg when saving
+    import matplotlib
+    if save_path:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
     col = f"prob_within{hops}"
     laps = df["lap"].values
     probs = df[col].values
@@ -364,6 +529,8 @@ def main():
     ap.add_argument("--save_csv", action="store_true")
     ap.add_argument("--save_png", action="store_true")
     ap.add_argument("--threshold", type=float, default=None, help="Optional horizontal threshold line on the chart")
+    ap.add_argument("--race_cache", default="data/race_cache" if HAVE_PARQUET else "",
+                    help="Dir for per-race Parquet/NPY base+feature cache ('' disables; off by default without pyarrow)")
     args = ap.parse_args()
 
     df = predict_for_driver(
@@ -371,7 +538,8 @@ def main():
         driver_code=args.driver,
         cache_dir=args.cache,
         artifacts_dir=args.artifacts,
-        hops=args.hops
+        hops=args.hops,
+        race_cache=args.race_cache or None
     )
 
     # save CSV
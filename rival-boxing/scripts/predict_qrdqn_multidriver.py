@@ -23,6 +23,7 @@ import os
 import json
 import argparse
 from pathlib import Path
+from importlib.util import find_spec
 from typing import List, Dict, Tuple
 
 import numpy as np
@@ -73,10 +74,6 @@ def load_race_session(race_spec: str):
     year_evt = int(pd.Timestamp(ses.event["EventDate"]).year)
     return ses, race_id, track_name, year_evt
 
-def _safe_secs(td):
-    try: return float(td.total_seconds())
-    except Exception: return None
-
 def lap_time_window_cols(laps_df: pd.DataFrame) -> pd.DataFrame:
     df = laps_df.copy()
     if "LapStartTime" not in df.columns or df["LapStartTime"].isna().all():
@@ -88,55 +85,90 @@ def lap_time_window_cols(laps_df: pd.DataFrame) -> pd.DataFrame:
     df["LapEndTime"] = df["LapStartTime"] + df["LapTime"].fillna(pd.Timedelta(seconds=0))
     return df
 
-def non_green_in_window(track_status: pd.DataFrame, start: pd.Timedelta, end: pd.Timedelta) -> int:
-    if track_status is None or len(track_status)==0: return 0
-    sub = track_status[(track_status["Time"] >= start) & (track_status["Time"] <= end)]
-    return int(((sub["Status"].astype(str) != "1")).any())
+def non_green_in_windows(track_status: pd.DataFrame, starts: pd.Series, ends: pd.Series) -> np.ndarray:
+    """
+    Per lap: 1 if any non-"1" track-status entry has start <= Time <= end.
+    One searchsorted pair over the sorted status times + a prefix sum.
+    """
+    n = len(starts)
+    if track_status is None or len(track_status)==0: return np.zeros(n, dtype=int)
+    ts = track_status[track_status["Time"].notna()].sort_values("Time", kind="stable")
+    t = ts["Time"].to_numpy(dtype="timedelta64[ns]").astype(np.int64)
+    bad = np.r_[0, np.cumsum(ts["Status"].astype(str).to_numpy() != "1")]
+    st = pd.to_timedelta(starts).to_numpy(dtype="timedelta64[ns]")
+    en = pd.to_timedelta(ends).to_numpy(dtype="timedelta64[ns]")
+    ok = ~(np.isnat(st) | np.isnat(en))
+    lo = np.searchsorted(t, st.astype(np.int64), side="left")
+    hi = np.searchsorted(t, en.astype(np.int64), side="right")
+    return (ok & (bad[np.maximum(hi, lo)] - bad[lo] > 0)).astype(int)
+
+LAST_LAP_COLS = [f"last_lap_m{k}" for k in range(5, 0, -1)]  # oldest -> newest, NaN-padded
 
 def build_car_lap_rows(session, race_id: str, track_key: str, year_evt: int) -> pd.DataFrame:
-    rows=[]
-    laps_all = lap_time_window_cols(session.laps)
+    """
+    One row per (driver, lap), drivers sorted, laps ascending. Stint/age and
+    the pit-within-2 labels come from per-driver shifts / lap-number lookups;
+    LAST_LAP_COLS hold the previous (up to 5) valid lap times in seconds.
+    """
+    laps = lap_time_window_cols(session.laps)
+    laps = laps[laps["Driver"].notna()].sort_values(["Driver","LapNumber"], kind="stable").reset_index(drop=True)
     ts = getattr(session, "track_status", None)
-    for drv, g in laps_all.groupby("Driver"):
-        g=g.sort_values("LapNumber").reset_index(drop=True)
-        stint_no=0; last_comp=None; age=0; last_full=[]
-        index_map={int(r["LapNumber"]): r for _, r in g.iterrows()}
-        for _, row in g.iterrows():
-            lap=int(row["LapNumber"])
-            comp=str(row.get("Compound","")).upper() or "HARD"
-            pit_in=row.get("PitInTime"); pit_out=row.get("PitOutTime")
-            if (comp != last_comp) or pd.notnull(pit_out):
-                stint_no+=1; age=0; last_comp=comp
-            next_lap = index_map.get(lap+1)
-            pitted_this = int(pd.notnull(pit_in) or (next_lap is not None and pd.notnull(next_lap.get("PitOutTime"))))
-            next2 = index_map.get(lap+2)
-            pitted_next = int(next_lap is not None and (pd.notnull(next_lap.get("PitInTime")) or (next2 is not None and pd.notnull(next2.get("PitOutTime")))))
-            y_within2 = int(pitted_this or pitted_next)
-            start_t=row["LapStartTime"]; end_t=row["LapEndTime"]
-            cheap = non_green_in_window(ts, start_t, end_t)
-            rows.append({
-                "race_id": race_id, "track": track_key, "year": year_evt, "driver": drv, "lap": lap,
-                "stint_no": stint_no, "compound": comp, "tire_age_laps": age,
-                "last_laps_json": json.dumps(last_full[-5:]),
-                "cheap_stop_flag_true": cheap,
-                "pitted_this_lap": pitted_this,
-                "pitted_within2": y_within2
-            })
-            lt=row.get("LapTime")
-            if pd.notnull(lt):
-                s=_safe_secs(lt)
-                if s is not None: last_full.append(s)
-            age+=1
-    return pd.DataFrame(rows)
+    drv = laps["Driver"]
+    lapno = laps["LapNumber"]
+    new_drv = (drv != drv.shift()).to_numpy()
+
+    comp = (laps["Compound"].map(str).str.upper() if "Compound" in laps else pd.Series("", index=laps.index))
+    comp = comp.mask(comp == "", "HARD")
+    pit_in = laps["PitInTime"].notna() if "PitInTime" in laps else pd.Series(False, index=laps.index)
+    pit_out = laps["PitOutTime"].notna() if "PitOutTime" in laps else pd.Series(False, index=laps.index)
+
+    # stint starts on compound change, pit-out, or a new driver; age counts laps within stint
+    new_stint = new_drv | (comp != comp.shift()).to_numpy() | pit_out.to_numpy()
+    stint_no = pd.Series(new_stint.astype(int)).groupby(drv).cumsum()
+    age = pd.Series(0, index=laps.index).groupby([drv, stint_no]).cumcount()
+
+    # lap+1 / lap+2 lookups by lap number (gaps -> missing), last row wins on duplicates
+    flags = pd.DataFrame({"present": True, "pit_in": pit_in, "pit_out": pit_out,
+                          "Driver": drv, "LapNumber": lapno}).drop_duplicates(["Driver","LapNumber"], keep="last")
+    flags = flags.set_index(["Driver","LapNumber"])
+    def at(offset):
+        key = pd.MultiIndex.from_arrays([drv, lapno + offset])
+        return flags.reindex(key).fillna(False).astype(bool).to_numpy().T  # present, pit_in, pit_out
+    nx_present, nx_in, nx_out = at(1)
+    _, _, nx2_out = at(2)
+    pitted_this = pit_in.to_numpy() | nx_out
+    pitted_next = nx_present & (nx_in | nx2_out)
+
+    # previous up-to-5 valid lap times: index into the compacted valid-time array
+    secs = laps["LapTime"].dt.total_seconds().to_numpy()
+    valid = ~np.isnan(secs)
+    vt = secs[valid]
+    before = np.cumsum(valid) - valid                      # valid laps strictly before each row
+    drv_start = np.maximum.accumulate(np.where(new_drv, before, 0))
+    last = {}
+    for k in range(1, 6):
+        idx = before - k
+        last[f"last_lap_m{k}"] = np.where(idx >= drv_start, vt[np.clip(idx, 0, max(len(vt)-1, 0))] if len(vt) else np.nan, np.nan)
+
+    cheap = non_green_in_windows(ts, laps["LapStartTime"], laps["LapEndTime"])
+    out = pd.DataFrame({
+        "race_id": race_id, "track": track_key, "year": year_evt, "driver": drv, "lap": lapno.astype(int),
+        "stint_no": stint_no.astype(int), "compound": comp, "tire_age_laps": age.astype(int),
+        **{c: last[c].astype(np.float32) for c in LAST_LAP_COLS},  # fixed-width float32 buffer, no JSON
+        "cheap_stop_flag_true": np.asarray(cheap, dtype=int),
+        "pitted_this_lap": pitted_this.astype(int),
+        "pitted_within2": (pitted_this | pitted_next).astype(int),
+    })
+    return out
 
 def median_stint_lengths(df: pd.DataFrame) -> Dict[str, Dict[str, float]]:
     stint = (df.groupby(["race_id","driver","stint_no"], as_index=False)
                .agg({"tire_age_laps":"max","track":"first","compound":"last"}))
+    # one hashed group-by over (track, compound) instead of nested Python loops
+    med=stint.groupby(["track","compound"])["tire_age_laps"].median()
     out={}
-    for track,g in stint.groupby("track"):
-        out.setdefault(track,{})
-        for comp,gc in g.groupby("compound"):
-            out[track][comp]=float(gc["tire_age_laps"].median())
+    for (track,comp),v in med.items():
+        out.setdefault(track,{})[comp]=float(v)
     return out
 
 def make_per_lap_pit_counts(df: pd.DataFrame) -> pd.DataFrame:
@@ -146,23 +178,28 @@ def make_per_lap_pit_counts(df: pd.DataFrame) -> pd.DataFrame:
     agg["pits_prev2"] = agg.groupby("race_id")["pits_this_lap"].shift(2).fillna(0)
     return agg[["race_id","lap","pits_prev1","pits_prev2"]]
 
-def parse_last(js, k=5):
-    try:
-        arr = json.loads(js) if isinstance(js,str) else js
-        return [float(x) for x in (arr or [])][-k:]
-    except Exception:
-        return []
-
-def slope(vals):
-    if len(vals)<3: return 0.0
-    x = np.arange(len(vals), dtype=float); y = np.array(vals, dtype=float)
-    x -= x.mean(); y -= y.mean()
-    d = (x**2).sum()
-    return float((x*y).sum()/d) if d else 0.0
-
-def var3(vals):
-    if len(vals)<3: return 0.0
-    return float(np.var(vals[-3:]))
+def last_lap_stats(M: np.ndarray):
+    """
+    Row-wise over the NaN-padded last-laps matrix:
+    last3_avg (mean of up to 3, 0 if none), last5_slope (OLS over the valid
+    tail, 0 if <3 points), last3_var (population var of last 3, 0 if <3).
+    """
+    M = M.astype(np.float32, copy=False)
+    valid = ~np.isnan(M)
+    Y = np.where(valid, M, np.float32(0))
+    cnt = valid.sum(axis=1)
+    n3 = valid[:, -3:].sum(axis=1)
+    avg3 = Y[:, -3:].sum(axis=1) / np.maximum(n3, 1)
+    var3 = np.where(cnt >= 3, ((Y[:, -3:] - avg3[:, None])**2).mean(axis=1, dtype=np.float32), np.float32(0))
+    x = np.arange(M.shape[1], dtype=np.float32)
+    n = np.maximum(cnt, 1)
+    xbar = (valid * x).sum(axis=1) / n
+    ybar = Y.sum(axis=1) / n
+    dx = np.where(valid, x - xbar[:, None], np.float32(0))
+    num = (dx * (Y - ybar[:, None])).sum(axis=1)
+    den = (dx**2).sum(axis=1)
+    slope = np.where((cnt >= 3) & (den > 0), num / np.where(den > 0, den, np.float32(1)), np.float32(0))
+    return avg3, slope, var3
 
 def hazard_features(df: pd.DataFrame, priors: Dict[str, Dict[str, float]]) -> pd.DataFrame:
     feats=pd.DataFrame(index=df.index)
@@ -170,17 +207,34 @@ def hazard_features(df: pd.DataFrame, priors: Dict[str, Dict[str, float]]) -> pd
     feats["stint_no"]=df["stint_no"].fillna(1).astype(int)
     comp=df["compound"].str.upper().fillna("HARD")
     for c in COMPOUNDS: feats[f"compound_{c}"]=(comp==c).astype(int)
-    last=df["last_laps_json"].apply(parse_last)
-    feats["last3_avg"]=last.apply(lambda a: float(np.mean(a[-3:])) if len(a) else 0.0)
-    feats["last5_slope"]=last.apply(slope)
-    feats["last3_var"]=last.apply(var3)
-    med=df.apply(lambda r: priors.get(r["track"],{}).get(str(r["compound"]).upper(),None), axis=1)
-    feats["typical_stint_len"]=med.fillna(0).astype(float)
+    feats["last3_avg"], feats["last5_slope"], feats["last3_var"] = last_lap_stats(df[LAST_LAP_COLS].to_numpy(dtype=np.float32))
+    # (track, compound) -> median stint length as one MultiIndex lookup instead of a per-row apply
+    pri=pd.Series({(t,c): v for t,d in priors.items() for c,v in d.items()}, dtype=float)
+    key=pd.MultiIndex.from_arrays([df["track"], df["compound"].map(str).str.upper()])
+    med=pri.reindex(key).to_numpy() if len(pri) else np.full(len(df), np.nan)
+    feats["typical_stint_len"]=pd.Series(med, index=df.index).fillna(0).astype(float)
     feats["age_vs_typical"]=feats["tire_age_laps"]-feats["typical_stint_len"]
     feats["age_percentile"]=(feats["tire_age_laps"]/(feats["typical_stint_len"]+1e-6)).clip(upper=1.4)
     feats["overshoot"]=(feats["tire_age_laps"]-feats["typical_stint_len"]).clip(lower=0)
     return feats
 
+def _runlen(arr: np.ndarray) -> np.ndarray:
+    # consecutive non-zero run length, reset at every 0
+    out = np.empty_like(arr); c = 0
+    for i in range(arr.size):
+        c = c + 1 if arr[i] else 0
+        out[i] = c
+    return out
+
+try:  # AOT-built kernel (scripts/_kernels_build.py): no JIT warm-up
+    from rb_kernels import runlen_i32 as _runlen
+except ImportError:
+    try:  # JIT the scan when numba is available; plain loop otherwise
+        from numba import njit
+        _runlen = njit(cache=True)(_runlen)
+    except ImportError:
+        pass
+
 def tactical_features(df: pd.DataFrame, perlap: pd.DataFrame) -> pd.DataFrame:
     feats=pd.DataFrame(index=df.index)
     cheap=df["cheap_stop_flag_true"].astype(int)
@@ -188,17 +242,11 @@ def tactical_features(df: pd.DataFrame, perlap: pd.DataFrame) -> pd.DataFrame:
     grp=df.groupby("race_id")
     feats["cheap_prev1"]=grp["cheap_stop_flag_true"].shift(1).fillna(0).astype(int)
     feats["cheap_prev2"]=grp["cheap_stop_flag_true"].shift(2).fillna(0).astype(int)
-    # run length per race
-    run_series=pd.Series(0,index=df.index,dtype=int)
-    for rid, idx in df.sort_values(["race_id","lap"]).groupby("race_id").groups.items():
-        sub=df.loc[idx]
-        arr=sub["cheap_stop_flag_true"].astype(int).to_numpy()
-        out=np.zeros_like(arr,dtype=int); c=0
-        for i,v in enumerate(arr):
-            c = c+1 if v==1 else 0
-            out[i]=c
-        run_series.loc[idx]=out
-    feats["non_green_runlen"]=run_series.astype(int)
+    # run length per race (rows in race_id, lap order)
+    srt=df.sort_values(["race_id","lap"])
+    run_series=srt.groupby("race_id", sort=False)["cheap_stop_flag_true"].transform(
+        lambda x: _runlen((x.to_numpy()==1).astype(np.int32)))
+    feats["non_green_runlen"]=run_series.reindex(df.index).astype(int)
     # per-lap pit behavior
     joined=df.merge(perlap, how="left", on=["race_id","lap"]).fillna({"pits_prev1":0,"pits_prev2":0})
     feats["pits_prev1"]=joined["pits_prev1"].astype(float)
@@ -247,35 +295,128 @@ def build_net_from_ckpt(ckpt):
     net.eval()
     return net
 
+def load_scripted_net(ckpt, artifacts_dir: str, device, quantize: bool = True):
+    """
+    TorchScript net (dynamic-INT8 Linears on CPU), frozen for inference and
+    cached next to the checkpoint as qrdqn_ts_{int8|fp32}_<in_dim>.pt; the
+    cache is rebuilt whenever qrdqn.pt is newer.
+    """
+    rl_dir = Path(artifacts_dir) / "rl"
+    in_dim = int(ckpt["in_dim"])
+    q = quantize and device.type == "cpu"
+    ts_path = rl_dir / f"qrdqn_ts_{'int8' if q else 'fp32'}_{in_dim}.pt"
+    src = rl_dir / "qrdqn.pt"
+    if ts_path.exists() and (not src.exists() or ts_path.stat().st_mtime >= src.stat().st_mtime):
+        return torch.jit.load(str(ts_path), map_location=device)
+
+    net = build_net_from_ckpt(ckpt)
+    if q:
+        net = torch.ao.quantization.quantize_dynamic(net, {nn.Linear}, dtype=torch.qint8)
+    net = net.to(device).eval()
+    with torch.inference_mode():
+        ts = torch.jit.trace(net, torch.zeros(1, in_dim, device=device), check_trace=False)
+        ts = torch.jit.freeze(ts.eval())
+        if not q:  # Linear+ReLU fusion passes target the float path
+            ts = torch.jit.optimize_for_inference(ts)
+    try:
+        ts.save(str(ts_path))
+        print(f"Saved TorchScript cache: {ts_path}")
+    except (OSError, RuntimeError) as e:
+        print(f"[WRN] could not cache TorchScript net ({e})")
+    return ts
+
+try:  # single saturating C ufunc when scipy is around
+    from scipy.special import expit
+except ImportError:
+    def expit(z):
+        # overflow-free logistic: 0.5 * (1 + tanh(z/2))
+        z = np.asarray(z)
+        return 0.5 * (1.0 + np.tanh(0.5 * z))
+
 def platt(scores: np.ndarray, calib: dict) -> np.ndarray:
-    z = calib["coef"] * scores + calib["intercept"]
-    return 1.0 / (1.0 + np.exp(-z))
+    return expit(calib["coef"] * scores + calib["intercept"])
+
+_PINNED = None  # reusable pinned host staging buffer (CUDA only)
+
+def _to_device(X_block: np.ndarray, device) -> torch.Tensor:
+    global _PINNED
+    x = torch.from_numpy(np.ascontiguousarray(X_block, dtype=np.float32))  # zero-copy view
+    if device.type != "cuda":
+        return x.to(device)
+    if _PINNED is None or _PINNED.shape[0] < x.shape[0] or _PINNED.shape[1] != x.shape[1]:
+        _PINNED = torch.empty(tuple(x.shape), dtype=torch.float32, pin_memory=True)
+    buf = _PINNED[:x.shape[0]]
+    buf.copy_(x)
+    return buf.to(device, non_blocking=True)
 
 def score_gap(net, device, X_block: np.ndarray) -> np.ndarray:
-    with torch.no_grad():
-        x = torch.tensor(X_block, dtype=torch.float32, device=device)
-        qz = net(x).cpu().numpy()
-        exp = qz.mean(axis=-1)
-        return exp[:,1] - exp[:,0]
+    with torch.inference_mode():
+        x = _to_device(X_block, device)
+        exp = net(x).mean(dim=-1)               # (N,2), reduced on device
+        return (exp[:,1] - exp[:,0]).cpu().numpy()
 
 def prob_within2(net, device, X_block: np.ndarray, calib: dict) -> np.ndarray:
     return platt(score_gap(net, device, X_block), calib)
 
-def prob_within3(net, device, X_block: np.ndarray, calib: dict) -> np.ndarray:
-    p2_t  = platt(score_gap(net, device, X_block), calib)
-    X_next = np.vstack([X_block[1:], X_block[-1:]])
-    p2_t1 = platt(score_gap(net, device, X_next), calib)
-    return 1.0 - (1.0 - p2_t) * (1.0 - p2_t1)
+def prob_within3(net, device, X_block: np.ndarray, calib: dict, sizes: List[int] = None) -> np.ndarray:
+    # sizes: lengths of stacked per-driver blocks; the t+1 shift stays inside each block.
+    # X_t+1 is X_t shifted by one, so score each block once with its last row repeated
+    # (n+1 rows) and read p(t) / p(t+1) as neighbouring entries.
+    sizes = np.asarray(sizes if sizes else [len(X_block)])
+    blocks = np.split(X_block, np.cumsum(sizes)[:-1])
+    p = platt(score_gap(net, device, np.concatenate([np.vstack([b, b[-1:]]) for b in blocks])), calib)
+    t = np.arange(len(X_block)) + np.repeat(np.arange(len(sizes)), sizes)  # skip each block's extra row
+    return 1.0 - (1.0 - p[t]) * (1.0 - p[t + 1])
+
+# ----------------------------- Per-race base cache -----------------------------
+
+# pandas reads/writes Parquet through pyarrow or fastparquet; without one the cache defaults off
+HAVE_PARQUET = any(find_spec(m) is not None for m in ("pyarrow", "fastparquet"))
+
+def race_cache_path(cache_root: str, race_spec: str) -> Path:
+    year_s, gp = race_spec.split(":", 1)
+    key = f"{year_s}_{gp}".replace(" ", "_")
+    # own suffix: predict_qrdqn caches a different (upper-cased, re-ordered) base table as <key>_base.parquet
+    return Path(cache_root) / f"{key}_multi_base.parquet"
+
+def load_race_cache(cache_root: str, race_spec: str, fastf1_cache: str):
+    """Cached all-driver base table if newer than the FastF1 season cache, else None."""
+    path = race_cache_path(cache_root, race_spec)
+    if not path.exists():
+        return None
+    season_dir = Path(fastf1_cache) / race_spec.split(":", 1)[0]
+    if season_dir.exists() and season_dir.stat().st_mtime > path.stat().st_mtime:
+        return None
+    try:
+        return pd.read_parquet(path)
+    except Exception as e:
+        print(f"[WRN] race cache unreadable ({e}); rebuilding")
+        return None
+
+def save_race_cache(cache_root: str, race_spec: str, base_all: pd.DataFrame):
+    path = race_cache_path(cache_root, race_spec)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        base_all.to_parquet(path, compression="zstd")
+        print(f"Saved race cache: {path}")
+    except Exception as e:
+        print(f"[WRN] could not write race cache {path}: {e}")
 
 # ----------------------------- Core routine -----------------------------
 
 def compute_probs_for_all_drivers(race_spec: str, cache_dir: str, artifacts_dir: str,
-                                  hops: int, only_drivers: List[str] = None) -> Dict[str, pd.DataFrame]:
-    enable_cache(cache_dir)
-    ses, race_id, track, year = load_race_session(race_spec)
-
-    # Build base across ALL drivers (keep original index!)
-    base_all = build_car_lap_rows(ses, race_id, track, year)
+                                  hops: int, only_drivers: List[str] = None,
+                                  quantize: bool = True, race_cache: str = None) -> Dict[str, pd.DataFrame]:
+    # Build base across ALL drivers (keep original index!); reuse the on-disk copy when fresh
+    base_all = load_race_cache(race_cache, race_spec, cache_dir) if race_cache else None
+    if base_all is not None:
+        print(f"Loaded race cache for {race_spec} ({len(base_all)} rows)")
+    else:
+        enable_cache(cache_dir)
+        ses, race_id, track, year = load_race_session(race_spec)
+        base_all = build_car_lap_rows(ses, race_id, track, year)
+        if race_cache:
+            save_race_cache(race_cache, race_spec, base_all)
 
     # Features from full grid
     X_all, feat_list = build_state_matrix(base_all)
@@ -284,15 +425,17 @@ def compute_probs_for_all_drivers(race_spec: str, cache_dir: str, artifacts_dir:
     ckpt, meta, calib, auto_th = load_artifacts(artifacts_dir)
     model_feats = meta.get("feat_list", feat_list)
 
-    # Ensure ALL model_feats exist in X_all (add zeros for any missing), then reorder
+    # Ensure ALL model_feats exist in X_all (add zeros for any missing)
     for col in model_feats:
         if col not in X_all.columns:
             X_all[col] = 0.0
-    # If X_all has extra columns, that’s fine; select only model feats in order:
-    X_all = X_all[model_feats]
+    # Column positions for model_feats, resolved once; a repeated name pulls every
+    # matching column, exactly like X_all[model_feats] (26 names -> 38 inputs)
+    names = X_all.columns.to_numpy()
+    col_pos = np.concatenate([np.flatnonzero(names == c) for c in model_feats])
 
     device = choose_device()
-    net = build_net_from_ckpt(ckpt).to(device)
+    net = load_scripted_net(ckpt, artifacts_dir, device, quantize=quantize)
 
     # Driver selection
     drivers = sorted(base_all["driver"].unique().tolist())
@@ -300,23 +443,27 @@ def compute_probs_for_all_drivers(race_spec: str, cache_dir: str, artifacts_dir:
         target = {d.strip().upper() for d in only_drivers}
         drivers = [d for d in drivers if str(d).upper() in target]
 
+    # Row positions per driver (lap order); X_all rows line up with base_all
+    lap_arr = base_all["lap"].to_numpy()
+    pos_by_driver = base_all.groupby("driver", sort=False).indices
+    subs = [(drv, pos_by_driver[drv]) for drv in drivers if drv in pos_by_driver]
+    subs = [(drv, pos[np.argsort(lap_arr[pos], kind="stable")]) for drv, pos in subs]
+    if not subs:
+        return {}, auto_th
+
+    # One float32 cast of the whole grid, then all drivers stacked -> one forward pass
+    X_np = X_all.to_numpy(dtype=np.float32)[:, col_pos]
+    sizes = [len(pos) for _, pos in subs]
+    X_cat = X_np[np.concatenate([pos for _, pos in subs])]
+    if hops == 2:
+        probs = prob_within2(net, device, X_cat, calib)
+    else:
+        probs = prob_within3(net, device, X_cat, calib, sizes)
+
+    out_cols = {c: base_all[c].to_numpy() for c in ["lap", "cheap_stop_flag_true", "pitted_this_lap", "pitted_within2"]}
     results = {}
-    for drv in drivers:
-        # USE ORIGINAL INDICES, not reset()
-        sub = base_all.loc[base_all["driver"] == drv].sort_values("lap")
-        idx = sub.index  # original positions into X_all
-        if len(idx) == 0:
-            continue
-
-        X_drv = X_all.loc[idx].to_numpy(dtype=np.float32)
-        if hops == 2:
-            probs = prob_within2(net, device, X_drv, calib)
-        else:
-            probs = prob_within3(net, device, X_drv, calib)
-
-        out = sub[["lap", "cheap_stop_flag_true", "pitted_this_lap", "pitted_within2"]].copy()
-        out[f"prob_within{hops}"] = probs
-        results[str(drv)] = out.reset_index(drop=True)  # safe to reset for pretty output
+    for (drv, pos), p in zip(subs, np.split(probs, np.cumsum(sizes)[:-1])):
+        results[str(drv)] = pd.DataFrame({**{c: v[pos] for c, v in out_cols.items()}, f"prob_within{hops}": p})
 
     return results, auto_th
 
@@ -326,42 +473,38 @@ def compute_probs_for_all_drivers(race_spec: str, cache_dir: str, artifacts_dir:
 def plot_multi_driver(results: Dict[str, pd.DataFrame], hops: int, title: str,
                       save_path: str = None, threshold: float = None, max_drivers_in_legend: int = 24):
     import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+    from matplotlib.lines import Line2D
 
     plt.figure(figsize=(14, 6))
     ax = plt.gca()
 
-    # Plot probability line per driver and draw a "cross" at actual pit laps
-    for drv, df in results.items():
-        laps = df["lap"].to_numpy()
-        probs = df[f"prob_within{hops}"].to_numpy()
-
-        # main probability curve
-        (line,) = ax.plot(laps, probs, linewidth=1.8, label=drv)
-        color = line.get_color()
-
-        # mark actual pit laps with a big "x" at the top (so it’s super visible)
+    # All probability curves as ONE LineCollection artist (not one Line2D per driver)
+    drivers = list(results)
+    colors = plt.get_cmap("tab20")(np.linspace(0, 1, max(len(drivers), 1)))
+    segments = [np.column_stack([df["lap"].to_numpy(), df[f"prob_within{hops}"].to_numpy()])
+                for df in results.values()]
+    ax.add_collection(LineCollection(segments, colors=colors[:len(segments)], linewidths=1.8))
+
+    # Actual pit laps: one scatter + one vlines call for every driver, same color as its curve,
+    # crosses slightly above the plot so they don't hide the curves
+    pit_laps, pit_colors = [], []
+    for color, df in zip(colors, results.values()):
         if "pitted_this_lap" in df.columns:
-            pit_mask = df["pitted_this_lap"].to_numpy(dtype=bool)
-            if pit_mask.any():
-                # place crosses slightly above the plot so they don't hide the curve
-                y_cross = np.full(pit_mask.sum(), 1.02)
-                ax.scatter(
-                    laps[pit_mask],
-                    y_cross,
-                    marker="x",
-                    s=80,
-                    linewidths=2.0,
-                    color=color,
-                    clip_on=False,
-                    zorder=5,
-                    label=f"{drv} pit"
-                )
-                # small vertical tick for extra readability
-                ax.vlines(laps[pit_mask], 0.98, 1.02, colors=color, linewidth=1.0, alpha=0.7)
+            laps = df["lap"].to_numpy()[df["pitted_this_lap"].to_numpy(dtype=bool)]
+            pit_laps.append(laps); pit_colors.append(np.repeat(color[None, :], len(laps), axis=0))
+    has_pits = bool(pit_laps) and sum(map(len, pit_laps)) > 0
+    if has_pits:
+        pit_laps = np.concatenate(pit_laps); pit_colors = np.concatenate(pit_colors)
+        ax.scatter(pit_laps, np.full(len(pit_laps), 1.02), marker="x", s=80, linewidths=2.0,
+                   c=pit_colors, clip_on=False, zorder=5)
+        # small vertical tick for extra readability
+        ax.vlines(pit_laps, 0.98, 1.02, colors=pit_colors, linewidth=1.0, alpha=0.7)
 
     if threshold is not None:
-        ax.axhline(threshold, linestyle="--", linewidth=1.2, label=f"threshold={threshold:.2f}")
+        ax.axhline(threshold, linestyle="--", linewidth=1.2, color="black")
 
+    ax.autoscale_view()
     ax.set_xlabel("Lap")
     ax.set_ylabel(f"P(box ≤ {hops} laps)")
     ax.set_title(title)
@@ -370,24 +513,13 @@ def plot_multi_driver(results: Dict[str, pd.DataFrame], hops: int, title: str,
     # expand ylim to show the pit crosses above 1.0
     ax.set_ylim(0.0, 1.06)
 
-    # Trim legend so it doesn’t explode with “pit” labels; keep at most N drivers + threshold
-    handles, labels = ax.get_legend_handles_labels()
-    if len(labels) > max_drivers_in_legend:
-        kept = []
-        seen = set()
-        for h, lab in zip(handles, labels):
-            if "pit" in lab:
-                continue  # hide per-driver "pit" entries to keep legend compact
-            if lab not in seen:
-                kept.append((h, lab)); seen.add(lab)
-            if len(kept) >= max_drivers_in_legend:
-                break
-        if threshold is not None:
-            kept.append((plt.Line2D([0], [0], linestyle="--", color="black"), f"threshold={threshold:.2f}"))
-        if kept:
-            handles, labels = zip(*kept)
-        else:
-            handles, labels = [], []
+    # Legend from lightweight proxies: at most N drivers, one pit entry, threshold
+    handles = [Line2D([0], [0], color=c, linewidth=1.8) for c in colors[:len(drivers)]][:max_drivers_in_legend]
+    labels = drivers[:max_drivers_in_legend]
+    if has_pits:
+        handles.append(Line2D([0], [0], marker="x", linestyle="", color="gray", markersize=8)); labels.append("actual pit")
+    if threshold is not None:
+        handles.append(Line2D([0], [0], linestyle="--", color="black")); labels.append(f"threshold={threshold:.2f}")
     ax.legend(handles, labels, ncols=4 if len(labels) > 12 else 1, fontsize=9)
 
     plt.tight_layout()
@@ -413,8 +545,13 @@ def main():
     ap.add_argument("--save_csv", action="store_true")
     ap.add_argument("--save_png", action="store_true")
     ap.add_argument("--threshold", type=float, default=None, help="Horizontal threshold line; if omitted and metrics exist, auto-uses platt_best_threshold")
+    ap.add_argument("--no_int8", action="store_true", help="Keep FP32 weights on CPU (default: dynamic INT8 Linears)")
+    ap.add_argument("--race_cache", default="data/race_cache" if HAVE_PARQUET else "",
+                    help="Dir for per-race Parquet base-table cache ('' disables; off by default without pyarrow)")
     args = ap.parse_args()
 
+    torch.set_num_threads(os.cpu_count() or 1)
+    torch.set_float32_matmul_precision("high")  # TF32 Linears on Ampere+ CUDA
     only = [s.strip() for s in args.drivers.split(",")] if args.drivers else None
 
     results, auto_th = compute_probs_for_all_drivers(
@@ -422,7 +559,9 @@ def main():
         cache_dir=args.cache,
         artifacts_dir=args.artifacts,
         hops=args.hops,
-        only_drivers=only
+        only_drivers=only,
+        quantize=not args.no_int8,
+        race_cache=args.race_cache or None
     )
 
     if not results:
@@ -2,10 +2,12 @@
 # -*- coding: utf-8 -*-
 
 import argparse, json, os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Tuple
 
 import numpy as np
+import pandas as pd
 import torch
 import matplotlib.pyplot as plt
 
@@ -25,11 +27,19 @@ def load_artifacts(artifacts_dir: str) -> Tuple[torch.jit.ScriptModule, Dict, Di
     calib = json.loads(calib_path.read_text()) if calib_path.exists() else {"a": 1.0, "b": 0.0}
     return model, meta, calib
 
+try:  # single saturating C ufunc when scipy is around
+    from scipy.special import expit
+except ImportError:
+    def expit(z):
+        # overflow-free logistic: 0.5 * (1 + tanh(z/2))
+        z = np.asarray(z)
+        return 0.5 * (1.0 + np.tanh(0.5 * z))
+
 def sigmoid(x: np.ndarray) -> np.ndarray:
-    return 1.0 / (1.0 + np.exp(-x))
+    return expit(x)
 
 def platt(gap: np.ndarray, a: float, b: float) -> np.ndarray:
-    return 1.0 / (1.0 + np.exp(-(a * gap + b)))
+    return expit(a * gap + b)
 
 def ensure_outdir(base: Path, race_tag: str) -> Path:
     out = base / race_tag / "drivers"
@@ -74,9 +84,59 @@ def typical_stint_by_compound(stint_lengths: List[int]) -> float:
         return 18.0
     return float(np.median(stint_lengths))
 
+try:  # AOT-built kernel (scripts/_kernels_build.py), else the NumPy closed form below
+    from rb_kernels import rolling_slope_f8 as _rolling_slope_aot
+except ImportError:
+    _rolling_slope_aot = None
+
+def _window_sums(v: np.ndarray, w: int) -> np.ndarray:
+    # sum of v[max(0,i-w+1):i+1] for every i, from one cumsum
+    c = np.cumsum(v, dtype=np.float64)
+    return c - np.concatenate([np.zeros(min(w, len(c))), c[:-w]])
+
+def rolling_avg(x: np.ndarray, w: int) -> np.ndarray:
+    n_w = np.minimum(np.arange(1, len(x) + 1), w)
+    return _window_sums(x, w) / n_w
+
+def rolling_var(x: np.ndarray, w: int) -> np.ndarray:
+    # population variance E[x^2]-E[x]^2; centred first so the difference stays well-conditioned
+    x = x - (x.mean() if len(x) else 0.0)
+    n_w = np.minimum(np.arange(1, len(x) + 1), w)
+    e1 = _window_sums(x, w) / n_w
+    return np.maximum(_window_sums(x * x, w) / n_w - e1 * e1, 0.0)
+
+def rolling_slope(x: np.ndarray, w: int) -> np.ndarray:
+    """OLS slope of each trailing window (up to w points) vs lap index; 0 for windows of < 2."""
+    if _rolling_slope_aot is not None:
+        return _rolling_slope_aot(np.ascontiguousarray(x, dtype=np.float64), w)
+    x = x - (x.mean() if len(x) else 0.0)
+    t = np.arange(len(x), dtype=np.float64)
+    n_w = np.minimum(np.arange(1, len(x) + 1), w).astype(np.float64)
+    sx, sy = _window_sums(t, w), _window_sums(x, w)
+    sxy, sxx = _window_sums(t * x, w), _window_sums(t * t, w)
+    den = n_w * sxx - sx * sx
+    return np.where(n_w >= 2, (n_w * sxy - sx * sy) / np.where(n_w >= 2, den, 1.0), 0.0)
+
+def _runlen(arr: np.ndarray) -> np.ndarray:
+    # consecutive non-zero run length, reset at every 0
+    out = np.empty_like(arr); c = 0
+    for i in range(arr.size):
+        c = c + 1 if arr[i] else 0
+        out[i] = c
+    return out
+
+try:  # AOT-built kernel (scripts/_kernels_build.py): no JIT warm-up
+    from rb_kernels import runlen_i32 as _runlen
+except ImportError:
+    try:  # JIT the scan when numba is available; plain loop otherwise
+        from numba import njit
+        _runlen = njit(cache=True)(_runlen)
+    except ImportError:
+        pass
+
 def compute_driver_features(laps_df, drv_code: str, feat_list: List[str]) -> Tuple[np.ndarray, List[int], List[int]]:
     """Returns (X [n_laps x in_dim], lap_numbers, pit_laps) for a driver."""
-    dlaps = laps_df.pick_driver(drv_code).reset_index(drop=True)
+    dlaps = laps_df[laps_df["Driver"] == drv_code].reset_index(drop=True)
     if len(dlaps) == 0:
         return np.zeros((0, len(feat_list)), dtype=np.float32), [], []
 
@@ -104,34 +164,6 @@ def compute_driver_features(laps_df, drv_code: str, feat_list: List[str]) -> Tup
             comp_oh[i, comp_idx[c]] = 1.0
 
     # Rolling stats
-    def rolling_avg(x, w):
-        y = np.copy(x)
-        for i in range(len(x)):
-            s = max(0, i - w + 1)
-            y[i] = float(np.mean(x[s:i+1]))
-        return y
-
-    def rolling_var(x, w):
-        y = np.copy(x)
-        for i in range(len(x)):
-            s = max(0, i - w + 1)
-            y[i] = float(np.var(x[s:i+1]))
-        return y
-
-    def rolling_slope(x, w):
-        y = np.zeros_like(x)
-        for i in range(len(x)):
-            s = max(0, i - w + 1)
-            xs = np.arange(i - s + 1, dtype=np.float64)
-            ys = x[s:i+1].astype(np.float64)
-            if len(xs) >= 2:
-                A = np.vstack([xs, np.ones_like(xs)]).T
-                m, _ = np.linalg.lstsq(A, ys, rcond=None)[0]
-                y[i] = float(m)
-            else:
-                y[i] = 0.0
-        return y
-
     last3_avg  = rolling_avg(lap_time_s, 3)
     last3_var  = rolling_var(lap_time_s, 3)
     last5_slope= rolling_slope(lap_time_s, 5)
@@ -166,14 +198,7 @@ def compute_driver_features(laps_df, drv_code: str, feat_list: List[str]) -> Tup
     cheap_prev2 = np.roll(cheap_flag, 2); cheap_prev2[:2] = 0.0
 
     # non_green_runlen: consecutive non-green run length
-    non_green_run = np.zeros(len(track_status), dtype=np.float32)
-    r = 0
-    for i, st in enumerate(track_status):
-        if st != 0:
-            r += 1
-        else:
-            r = 0
-        non_green_run[i] = float(r)
+    non_green_run = _runlen((track_status != 0).astype(np.int32)).astype(np.float32)
 
     # pits_prev1/prev2: recent pit flags
     pit_prev1 = np.roll(pit_in.astype(np.float32), 1); pit_prev1[0] = 0.0
@@ -206,15 +231,8 @@ def compute_driver_features(laps_df, drv_code: str, feat_list: List[str]) -> Tup
     # Some feat names in meta may repeat (as in training). Respect order strictly:
     X = np.zeros((len(dlaps), len(feat_list)), dtype=np.float32)
     for j, name in enumerate(feat_list):
-        if name in cols:
+        if name in cols:  # unseen column names stay 0
             X[:, j] = cols[name]
-        else:
-            # If duplicate keys like tire_age_laps appear again, still map from cols
-            if name in cols:
-                X[:, j] = cols[name]
-            else:
-                # unseen column name — fill 0
-                X[:, j] = 0.0
 
     return X, lap_numbers, pit_laps
 
@@ -235,9 +253,11 @@ def predict_p2_from_torchscript(model, X: np.ndarray, calib: Dict) -> np.ndarray
 def plot_driver(race_tag: str, drv: str, laps: List[int], p2: np.ndarray, pit_laps: List[int], out_dir: Path):
     plt.figure(figsize=(9, 4.2))
     plt.plot(laps, p2, linewidth=2)
-    # crosses for pit-in laps
-    for L in pit_laps:
-        plt.plot([L], [p2[laps.index(L)] if L in laps else 0.0], marker="x", markersize=8)
+    # crosses for pit-in laps, all in one scatter call
+    lap_to_i = {L: i for i, L in enumerate(laps)}
+    pit_idx = np.fromiter((lap_to_i[L] for L in pit_laps if L in lap_to_i), dtype=int)
+    if len(pit_idx):
+        plt.scatter(np.asarray(laps)[pit_idx], np.asarray(p2)[pit_idx], marker="x", s=64)
 
     plt.ylim(0.0, 1.0)
     plt.xlim(min(laps), max(laps) if len(laps) else 1)
@@ -250,6 +270,28 @@ def plot_driver(race_tag: str, drv: str, laps: List[int], p2: np.ndarray, pit_la
     plt.savefig(out_path, dpi=150)
     plt.close()
 
+# -------------------- Per-driver worker --------------------
+
+_WORKER = {}  # process-local TorchScript model
+
+def _init_worker(artifacts_dir: str):
+    torch.set_num_threads(1)  # parallelism comes from the pool, not intra-op threads
+    _WORKER["model"], _, _ = load_artifacts(artifacts_dir)
+
+def _process_driver(job) -> str:
+    """features -> predict -> PNG for one driver; job = (drv, driver laps, feat_list, calib, race_tag, out_dir)."""
+    drv, dlaps, feat_list, calib, race_tag, out_dir = job
+    X, laps, pit_laps = compute_driver_features(dlaps, drv, feat_list)
+    if X.shape[0] == 0:
+        return f"[SKIP] {drv}: no laps"
+    # Guard: feature dimension must match
+    if X.shape[1] != len(feat_list):
+        return f"[WARN] {drv}: X.shape[1] ({X.shape[1]}) != in_dim ({len(feat_list)}); skipping"
+
+    p2 = predict_p2_from_torchscript(_WORKER["model"], X, calib)  # np.array len = n_laps
+    plot_driver(race_tag, drv, laps, p2, pit_laps, out_dir)
+    return f"[OK] wrote {drv} → {out_dir / (drv + '_p2.png')}"
+
 # -------------------- Main --------------------
 
 def main():
@@ -259,12 +301,13 @@ def main():
     ap.add_argument("--artifacts", default="artifacts")
     ap.add_argument("--out", default="reports")
     ap.add_argument("--only", default="", help='Comma sep driver codes to filter, e.g. "VER,LEC,HAM"')
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                    help="Processes for per-driver feature/predict/plot (1 = serial)")
     args = ap.parse_args()
 
     # Artifacts
     model, meta, calib = load_artifacts(args.artifacts)
     feat_list = meta.get("feat_list", FEAT_ORDER_DEFAULT_26)
-    in_dim = len(feat_list)
 
     # FastF1
     fastf1.Cache.enable_cache(args.cache)
@@ -280,20 +323,19 @@ def main():
     race_tag = f"{year}_{gp.strip().replace(' ', '')}"
     out_dir = ensure_outdir(Path(args.out), race_tag)
 
-    # For each driver → build features → predict → plot
-    for drv in drivers:
-        X, laps, pit_laps = compute_driver_features(session.laps, drv, feat_list)
-        if X.shape[0] == 0:
-            print(f"[SKIP] {drv}: no laps")
-            continue
-        # Guard: feature dimension must match
-        if X.shape[1] != in_dim:
-            print(f"[WARN] {drv}: X.shape[1] ({X.shape[1]}) != in_dim ({in_dim}); skipping")
-            continue
-
-        p2 = predict_p2_from_torchscript(model, X, calib)  # np.array len = n_laps
-        plot_driver(race_tag, drv, laps, p2, pit_laps, out_dir)
-        print(f"[OK] wrote {drv} → {out_dir / (drv + '_p2.png')}")
+    # For each driver → build features → predict → plot; workers get plain
+    # per-driver lap frames (the FastF1 session itself is not shipped)
+    laps_all = pd.DataFrame(session.laps)
+    jobs = [(drv, laps_all[laps_all["Driver"] == drv], feat_list, calib, race_tag, out_dir) for drv in drivers]
+    if args.workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(jobs)),
+                                 initializer=_init_worker, initargs=(args.artifacts,)) as ex:
+            for msg in ex.map(_process_driver, jobs):
+                print(msg)
+    else:
+        _WORKER["model"] = model
+        for job in jobs:
+            print(_process_driver(job))
 
     print(f"Done. PNGs in {out_dir}")
 
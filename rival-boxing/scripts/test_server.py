@@ -1,21 +1,90 @@
 #!/usr/bin/env python3
-from flask import Flask, request, jsonify
+import os
+# Tiny MLP + threaded Flask: one intra-op thread per request thread avoids
+# oversubscription (must be set before torch/OpenMP initialise)
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
+LOG_PRED = os.getenv('LOG_PRED') == '1'  # resolved once; handlers test this constant
+from flask import Flask, Response, request, abort
 import torch
 import json
 import sys
-import os
-from datetime import datetime
+import threading
+import operator
+import queue
+import time
+import logging
+import logging.handlers
+import atexit
+import numpy as np
+
+try:  # optional: much faster (de)serialisation than stdlib json
+    import orjson
+    _loads, _dumps = orjson.loads, orjson.dumps
+except ImportError:
+    _loads = json.loads
+    _dumps = lambda obj: json.dumps(obj).encode()
+
+try:  # optional: onnxruntime serving backend (see export_torchscript_26.py --out_onnx)
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+torch.set_num_threads(1)
+torch.set_num_interop_threads(1)
 
 app = Flask(__name__)
 
-# Load model
-try:
-    model = torch.jit.load('artifacts/rl/qrdqn_torchscript.pt')
-    model.eval()
-    print("✓ Model loaded: artifacts/rl/qrdqn_torchscript.pt")
-except Exception as e:
-    print(f"❌ Failed to load model: {e}")
-    sys.exit(1)
+# ---- request logging: handlers enqueue records, a listener thread formats and writes them ----
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        return record  # leave %-formatting to the listener thread
+
+log = logging.getLogger('ingest')
+log.setLevel(logging.DEBUG if LOG_PRED else logging.WARNING)
+log.propagate = False
+_LOG_Q = queue.SimpleQueue()
+log.addHandler(_DeferredQueueHandler(_LOG_Q))
+_log_sink = logging.StreamHandler(sys.stdout)
+_log_sink.setFormatter(logging.Formatter('%(message)s'))
+_log_listener = logging.handlers.QueueListener(_LOG_Q, _log_sink)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+# Load model: the ONNX Runtime graph when exported and onnxruntime is installed, else TorchScript
+ONNX_PATH = os.getenv('ONNX_MODEL', 'artifacts/rl/qrdqn.onnx')
+ort_sess = None
+if ort is not None and os.path.exists(ONNX_PATH):
+    try:
+        so = ort.SessionOptions()
+        so.intra_op_num_threads = 1
+        so.inter_op_num_threads = 1
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        ort_sess = ort.InferenceSession(ONNX_PATH, sess_options=so, providers=['CPUExecutionProvider'])
+        print(f"✓ Model loaded (onnxruntime): {ONNX_PATH}")
+    except Exception as e:
+        print(f"[WRN] onnxruntime load failed ({e}); falling back to TorchScript")
+# Dynamic-INT8 sibling (export_torchscript_26.py --quantize) is preferred on CPU; INT8=0 forces fp32
+TS_PATH = 'artifacts/rl/qrdqn_torchscript.pt'
+TS_INT8_PATH = 'artifacts/rl/qrdqn_torchscript_int8.pt'
+if os.getenv('INT8', '1') == '1' and os.path.exists(TS_INT8_PATH):
+    TS_PATH = TS_INT8_PATH
+if ort_sess is None:
+    try:
+        model = torch.jit.load(TS_PATH)
+        model.eval()
+        # inference-only: inline params as constants, fuse ops (no-op if already frozen by the exporter)
+        model = torch.jit.optimize_for_inference(torch.jit.freeze(model))
+        print(f"✓ Model loaded: {TS_PATH}")
+    except Exception as e:
+        print(f"❌ Failed to load model: {e}")
+        sys.exit(1)
+
+def forward(x):
+    """float32 [B, in_dim] ndarray -> [B, 2, n_quantiles] tensor, on whichever backend is loaded"""
+    if ort_sess is not None:
+        return torch.from_numpy(ort_sess.run(None, {'x': x})[0])
+    return model(torch.from_numpy(x))
 
 # Load meta
 try:
@@ -23,7 +92,7 @@ try:
     feat_list = meta['feat_list']
     print(f"✓ Loaded {len(feat_list)} features from meta.json")
     
-    if os.getenv('LOG_PRED') == '1':
+    if LOG_PRED:
         print("\n📋 Feature list:")
         for i, f in enumerate(feat_list):
             print(f"   [{i:2d}] {f}")
@@ -32,56 +101,157 @@ except Exception as e:
     print(f"❌ Failed to load meta: {e}")
     sys.exit(1)
 
+# Warm up: the first TorchScript calls run the profiling executor (and ORT
+# allocates its arenas) far slower than steady state, so pay that before serving
+try:
+    with torch.inference_mode():
+        for _ in range(5):
+            forward(np.zeros((1, len(feat_list)), dtype=np.float32))
+    print("✓ Model warmed up")
+except Exception as e:
+    print(f"❌ Warmup forward failed: {e}")
+    sys.exit(1)
+
+FEAT_KEYS = tuple(feat_list)
+# Payload -> feature tuple in one C-level call; missing keys default to 0.0
+FEAT_GETTER = operator.itemgetter(*FEAT_KEYS)
+FEAT_DEFAULTS = {k: 0.0 for k in FEAT_KEYS}
+
+def predict_batch(vecs):
+    """[B, in_dim] feature rows (lists or a float32 array) -> (p2 list, p3 list) from one forward pass"""
+    with torch.inference_mode():
+        output = forward(np.asarray(vecs, dtype=np.float32))  # [B, 2, 101]
+        # Mean over quantiles -> [B, 2]; gap between Q(pit) and Q(no_pit)
+        gap = output.mean(dim=-1)
+        gap = gap[:, 1] - gap[:, 0]
+        # Map gap to probabilities via one sigmoid over [gap, 1.25*gap] -> [2, B], one host copy
+        p2, p3 = torch.sigmoid(torch.stack((gap, gap * 1.25))).tolist()
+    return p2, p3
+
+# ---- micro-batching: concurrent /ingest calls share one forward pass ----
+BATCH_MAX = int(os.getenv('BATCH_MAX', '32'))
+BATCH_WAIT_S = float(os.getenv('BATCH_WAIT_MS', '2')) / 1000.0
+# Reusable batch input, owned by the worker thread: filled in place, handed to the backend without a copy
+BATCH_NP = np.zeros((BATCH_MAX, len(FEAT_KEYS)), dtype=np.float32)
+REQ_Q = queue.Queue()
+
+def _batch_worker():
+    """Pop up to BATCH_MAX pending rows (or whatever arrives within BATCH_WAIT_MS), run one forward, wake each caller"""
+    while True:
+        jobs = [REQ_Q.get()]
+        deadline = time.monotonic() + BATCH_WAIT_S
+        while len(jobs) < BATCH_MAX:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            try:
+                jobs.append(REQ_Q.get(timeout=left))
+            except queue.Empty:
+                break
+        n = len(jobs)
+        try:
+            for i, job in enumerate(jobs):
+                BATCH_NP[i] = job[0]
+            p2, p3 = predict_batch(BATCH_NP[:n])
+            results = list(zip(p2, p3))
+        except Exception as e:
+            results = [e] * n
+        for job, res in zip(jobs, results):
+            job[2] = res
+            job[1].set()
+
+threading.Thread(target=_batch_worker, name='batch-worker', daemon=True).start()
+
+PREDICT_TIMEOUT_S = float(os.getenv('PREDICT_TIMEOUT_MS', '2000')) / 1000.0
+
+def predict_one(vec):
+    """Queue one feature row for the batch worker and block until its (p2, p3) is ready (503 on timeout)"""
+    job = [vec, threading.Event(), None]
+    REQ_Q.put(job)
+    if not job[1].wait(PREDICT_TIMEOUT_S):
+        abort(503)
+    if isinstance(job[2], Exception):
+        raise job[2]
+    return job[2]
+
+def read_json():
+    """Parse the raw request body once (no Werkzeug cache); 400 on an empty or malformed body"""
+    raw = request.get_data(cache=False)
+    try:
+        return _loads(raw) if raw else abort(400)
+    except ValueError:
+        abort(400)
+
+def feature_row(data):
+    """Payload -> float32 feature row in FEAT_KEYS order; 400 on non-numeric or non-finite values"""
+    try:
+        vec = np.asarray(FEAT_GETTER({**FEAT_DEFAULTS, **data}), dtype=np.float32)
+    except (ValueError, TypeError):
+        abort(400)
+    if vec.ndim == 0:  # itemgetter of a single key returns the bare value
+        vec = vec.reshape(1)
+    if vec.shape != (len(FEAT_KEYS),) or not np.isfinite(vec).all():
+        abort(400)
+    return vec
+
+def json_response(obj):
+    return Response(_dumps(obj), mimetype='application/json')
+
 @app.route('/ingest', methods=['POST'])
 def ingest():
-    data = request.json
+    data = read_json()
     driver = data.get('driver', 'UNK')
     lap = data.get('lap', 0)
     
     # Extract features in the correct order
-    vec = [float(data.get(k, 0.0)) for k in feat_list]
-    
-    # Check for all zeros (common bug)
-    nonzero = sum(1 for v in vec if v != 0.0)
-    if nonzero == 0:
-        print(f"⚠️  All-zero input for {driver} lap {lap}")
+    vec = feature_row(data)
     
-    # Run inference
-    with torch.no_grad():
-        input_t = torch.tensor([vec], dtype=torch.float32)
-        output = model(input_t)  # [1, 2, 101]
-        
-        # Mean over quantiles -> [1, 2]
-        q_mean = output.mean(dim=-1)
-        
-        # Gap between Q(pit) and Q(no_pit)
-        gap = q_mean[0, 1] - q_mean[0, 0]
-        
-        # Map gap to probabilities via sigmoid
-        p2 = float(torch.sigmoid(gap))
-        p3 = float(torch.sigmoid(gap * 1.25))
+    # Run inference (coalesced with any concurrent requests)
+    p2, p3 = predict_one(vec)
     
-    # Detailed logging if enabled
-    if os.getenv('LOG_PRED') == '1':
-        sample = [f"{feat_list[i]}={vec[i]:.1f}" for i in range(min(6, len(vec)))]
-        print(f"📥 {driver:3s} L{lap:2d}: nz={nonzero:2d}/{len(vec)} [{', '.join(sample)}...] | 📤 p2={p2:.3f} p3={p3:.3f}")
+    # Detailed logging if LOG_PRED=1 (includes the all-zero check, a common bug)
+    if LOG_PRED:
+        nonzero = int(np.count_nonzero(vec))
+        if nonzero == 0:
+            log.debug("⚠️  All-zero input for %s lap %s", driver, lap)
+        sample = ", ".join(f"{feat_list[i]}={vec[i]:.1f}" for i in range(min(6, len(vec))))
+        log.debug("📥 %-3s L%2d: nz=%2d/%d [%s...] | 📤 p2=%.3f p3=%.3f",
+                  driver, lap, nonzero, len(vec), sample, p2, p3)
     
-    return jsonify({
-        't': int(datetime.now().timestamp() * 1000),
+    return json_response({
+        't': time.time_ns() // 1_000_000,
         'driver': driver,
         'lap': lap,
         'p2': p2,
         'p3': p3
     })
 
+@app.route('/ingest_batch', methods=['POST'])
+def ingest_batch():
+    rows = (read_json() or {}).get('batch', [])
+    if not rows:
+        return json_response({'results': []})
+    vecs = np.stack([feature_row(r) for r in rows])
+    p2, p3 = predict_batch(vecs)
+    t = time.time_ns() // 1_000_000
+    
+    if LOG_PRED:
+        log.debug("📥 batch of %d (lap %s) | 📤 mean p2=%.3f", len(rows), rows[0].get('lap', 0), sum(p2) / len(p2))
+    
+    return json_response({'results': [
+        {'t': t, 'driver': r.get('driver', 'UNK'), 'lap': r.get('lap', 0), 'p2': a, 'p3': b}
+        for r, a, b in zip(rows, p2, p3)
+    ]})
+
 if __name__ == '__main__':
     print("\n" + "="*70)
     print("🚀 RT Predictor Test Server")
     print("="*70)
     print(f"   Listening on: http://0.0.0.0:8080")
-    print(f"   Model: artifacts/rl/qrdqn_torchscript.pt")
+    print(f"   Model: {ONNX_PATH + ' (onnxruntime)' if ort_sess is not None else TS_PATH}")
     print(f"   Features: {len(feat_list)}")
     print(f"\n💡 Tip: Set LOG_PRED=1 for detailed request/response logs")
+    print(f"💡 Dev server only; for serving use: gunicorn -c scripts/gunicorn.conf.py test_server:app")
     print("="*70 + "\n")
     
     app.run(host='0.0.0.0', port=8080, debug=False, threaded=True)
@@ -18,6 +18,8 @@ Outputs:
 import os
 import json
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Dict, Tuple
 
@@ -26,13 +28,8 @@ import pandas as pd
 
 import torch
 import torch.nn as nn
-from torch.utils.data import DataLoader, Dataset
 
-from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import (
-    average_precision_score, roc_auc_score,
-    precision_recall_fscore_support, fbeta_score
-)
+from sklearn.metrics import average_precision_score, roc_auc_score
 
 import fastf1
 
@@ -46,6 +43,7 @@ def enable_fastf1_cache(cache_dir: str):
     os.makedirs(cache_dir, exist_ok=True)
     fastf1.Cache.enable_cache(cache_dir)
 
+@lru_cache(maxsize=8)  # repeat train_qrdqn calls in one process (sweeps) reuse loaded sessions
 def load_race_session(spec: str):
     year_s, gp = spec.split(":")
     year = int(year_s)
@@ -56,10 +54,6 @@ def load_race_session(spec: str):
     year_evt = int(pd.Timestamp(ses.event["EventDate"]).year)
     return ses, race_id, track_name, year_evt
 
-def _safe_secs(td):
-    try: return float(td.total_seconds())
-    except Exception: return None
-
 def lap_time_window_cols(laps_df: pd.DataFrame) -> pd.DataFrame:
     df = laps_df.copy()
     if "LapStartTime" not in df.columns or df["LapStartTime"].isna().all():
@@ -71,64 +65,81 @@ def lap_time_window_cols(laps_df: pd.DataFrame) -> pd.DataFrame:
     df["LapEndTime"] = df["LapStartTime"] + df["LapTime"].fillna(pd.Timedelta(seconds=0))
     return df
 
-def non_green_in_window(track_status: pd.DataFrame, start: pd.Timedelta, end: pd.Timedelta) -> int:
-    if track_status is None or len(track_status)==0: return 0
-    sub = track_status[(track_status["Time"] >= start) & (track_status["Time"] <= end)]
-    return int(((sub["Status"].astype(str) != "1")).any())
-
-def parse_last(js, k=5):
-    try:
-        arr = json.loads(js) if isinstance(js,str) else js
-        return [float(x) for x in (arr or [])][-k:]
-    except Exception:
-        return []
-
-def slope(vals):
-    if len(vals)<3: return 0.0
-    x = np.arange(len(vals), dtype=float); y = np.array(vals, dtype=float)
-    x -= x.mean(); y -= y.mean()
-    d = (x**2).sum()
-    return float((x*y).sum()/d) if d else 0.0
-
-def var3(vals):
-    if len(vals)<3: return 0.0
-    return float(np.var(vals[-3:]))
+def non_green_in_windows(track_status: pd.DataFrame, starts: pd.Series, ends: pd.Series) -> np.ndarray:
+    """
+    Per lap: 1 if any non-"1" track-status entry has start <= Time <= end.
+    One searchsorted pair over the sorted status times + a prefix sum.
+    """
+    n = len(starts)
+    if track_status is None or len(track_status)==0: return np.zeros(n, dtype=int)
+    ts = track_status[track_status["Time"].notna()].sort_values("Time", kind="stable")
+    t = ts["Time"].to_numpy(dtype="timedelta64[ns]").astype(np.int64)
+    bad = np.r_[0, np.cumsum(ts["Status"].astype(str).to_numpy() != "1")]
+    st = pd.to_timedelta(starts).to_numpy(dtype="timedelta64[ns]")
+    en = pd.to_timedelta(ends).to_numpy(dtype="timedelta64[ns]")
+    ok = ~(np.isnat(st) | np.isnat(en))
+    lo = np.searchsorted(t, st.astype(np.int64), side="left")
+    hi = np.searchsorted(t, en.astype(np.int64), side="right")
+    return (ok & (bad[np.maximum(hi, lo)] - bad[lo] > 0)).astype(int)
+
+LAST_LAP_COLS = [f"last_lap_m{k}" for k in range(5, 0, -1)]  # oldest -> newest, NaN-padded
 
 def build_car_lap_rows(session, race_id: str, track_key: str, year_evt: int) -> pd.DataFrame:
-    rows=[]
-    laps_all = lap_time_window_cols(session.laps)
+    """
+    One row per (driver, lap), drivers sorted, laps ascending. Stint/age and
+    the pit-within-2 labels come from per-driver shifts / lap-number lookups
+    over the whole laps table instead of a per-row loop; LAST_LAP_COLS hold
+    the previous (up to 5) valid lap times in seconds.
+    """
+    laps = lap_time_window_cols(session.laps)
+    laps = laps[laps["Driver"].notna()].sort_values(["Driver","LapNumber"], kind="stable").reset_index(drop=True)
     ts = getattr(session, "track_status", None)
-    for drv, g in laps_all.groupby("Driver"):
-        g=g.sort_values("LapNumber").reset_index(drop=True)
-        stint_no=0; last_comp=None; age=0; last_full=[]
-        index_map={int(r["LapNumber"]): r for _, r in g.iterrows()}
-        for _, row in g.iterrows():
-            lap=int(row["LapNumber"])
-            comp=str(row.get("Compound","")).upper() or "HARD"
-            pit_in=row.get("PitInTime"); pit_out=row.get("PitOutTime")
-            if (comp != last_comp) or pd.notnull(pit_out):
-                stint_no+=1; age=0; last_comp=comp
-            next_lap = index_map.get(lap+1)
-            pitted_this = int(pd.notnull(pit_in) or (next_lap is not None and pd.notnull(next_lap.get("PitOutTime"))))
-            next2 = index_map.get(lap+2)
-            pitted_next = int(next_lap is not None and (pd.notnull(next_lap.get("PitInTime")) or (next2 is not None and pd.notnull(next2.get("PitOutTime")))))
-            y_within2 = int(pitted_this or pitted_next)
-            start_t=row["LapStartTime"]; end_t=row["LapEndTime"]
-            cheap = non_green_in_window(ts, start_t, end_t)
-            rows.append({
-                "race_id": race_id, "track": track_key, "year": year_evt, "driver": drv, "lap": lap,
-                "stint_no": stint_no, "compound": comp, "tire_age_laps": age,
-                "last_laps_json": json.dumps(last_full[-5:]),
-                "cheap_stop_flag_true": cheap,
-                "pitted_this_lap": pitted_this,
-                "pitted_within2": y_within2
-            })
-            lt=row.get("LapTime")
-            if pd.notnull(lt):
-                s=_safe_secs(lt)
-                if s is not None: last_full.append(s)
-            age+=1
-    return pd.DataFrame(rows)
+    drv = laps["Driver"]
+    lapno = laps["LapNumber"]
+    new_drv = (drv != drv.shift()).to_numpy()
+
+    comp = (laps["Compound"].map(str).str.upper() if "Compound" in laps else pd.Series("", index=laps.index))
+    comp = comp.mask(comp == "", "HARD")
+    pit_in = laps["PitInTime"].notna() if "PitInTime" in laps else pd.Series(False, index=laps.index)
+    pit_out = laps["PitOutTime"].notna() if "PitOutTime" in laps else pd.Series(False, index=laps.index)
+
+    # stint starts on compound change, pit-out, or a new driver; age counts laps within stint
+    new_stint = new_drv | (comp != comp.shift()).to_numpy() | pit_out.to_numpy()
+    stint_no = pd.Series(new_stint.astype(int)).groupby(drv).cumsum()
+    age = pd.Series(0, index=laps.index).groupby([drv, stint_no]).cumcount()
+
+    # lap+1 / lap+2 lookups by lap number (gaps -> missing), last row wins on duplicates
+    flags = pd.DataFrame({"present": True, "pit_in": pit_in, "pit_out": pit_out,
+                          "Driver": drv, "LapNumber": lapno}).drop_duplicates(["Driver","LapNumber"], keep="last")
+    flags = flags.set_index(["Driver","LapNumber"])
+    def at(offset):
+        key = pd.MultiIndex.from_arrays([drv, lapno + offset])
+        return flags.reindex(key).fillna(False).astype(bool).to_numpy().T  # present, pit_in, pit_out
+    nx_present, nx_in, nx_out = at(1)
+    _, _, nx2_out = at(2)
+    pitted_this = pit_in.to_numpy() | nx_out
+    pitted_next = nx_present & (nx_in | nx2_out)
+
+    # previous up-to-5 valid lap times: index into the compacted valid-time array
+    secs = laps["LapTime"].dt.floor("us").dt.total_seconds().to_numpy()  # microsecond resolution, as Timedelta.total_seconds()
+    valid = ~np.isnan(secs)
+    vt = secs[valid]
+    before = np.cumsum(valid) - valid                      # valid laps strictly before each row
+    drv_start = np.maximum.accumulate(np.where(new_drv, before, 0))
+    last = {}
+    for k in range(1, 6):
+        idx = before - k
+        last[f"last_lap_m{k}"] = np.where(idx >= drv_start, vt[np.clip(idx, 0, max(len(vt)-1, 0))] if len(vt) else np.nan, np.nan)
+
+    cheap = non_green_in_windows(ts, laps["LapStartTime"], laps["LapEndTime"])
+    return pd.DataFrame({
+        "race_id": race_id, "track": track_key, "year": year_evt, "driver": drv, "lap": lapno.astype(int),
+        "stint_no": stint_no.astype(int), "compound": comp, "tire_age_laps": age.astype(int),
+        **{c: last[c].astype(np.float32) for c in LAST_LAP_COLS},  # fixed-width float32 buffer, no JSON
+        "cheap_stop_flag_true": np.asarray(cheap, dtype=int),
+        "pitted_this_lap": pitted_this.astype(int),
+        "pitted_within2": (pitted_this | pitted_next).astype(int),
+    })
 
 def median_stint_lengths(df: pd.DataFrame) -> Dict[str, Dict[str, float]]:
     stint = (df.groupby(["race_id","driver","stint_no"], as_index=False)
@@ -147,58 +158,177 @@ def make_per_lap_pit_counts(df: pd.DataFrame) -> pd.DataFrame:
     agg["pits_prev2"] = agg.groupby("race_id")["pits_this_lap"].shift(2).fillna(0)
     return agg[["race_id","lap","pits_prev1","pits_prev2"]]
 
+# ----------------------------- Per-race base cache -----------------------------
+# build_car_lap_rows output (last laps as float32 columns) persisted as Parquet, so
+# re-runs over the same races skip the FastF1 load and row build entirely
+
+def race_cache_path(cache_root: str, race_spec: str) -> Path:
+    year_s, gp = race_spec.split(":", 1)
+    key = f"{year_s}_{gp}".replace(" ", "_")
+    return Path(cache_root) / f"{key}_train_base.parquet"
+
+def load_race_cache(cache_root: str, race_spec: str, fastf1_cache: str):
+    """Cached base rows if newer than the FastF1 season cache, else None."""
+    path = race_cache_path(cache_root, race_spec)
+    if not path.exists():
+        return None
+    season_dir = Path(fastf1_cache) / race_spec.split(":", 1)[0]
+    if season_dir.exists() and season_dir.stat().st_mtime > path.stat().st_mtime:
+        return None
+    try:
+        return pd.read_parquet(path)
+    except Exception as e:
+        print(f"[WRN] race cache unreadable ({e}); rebuilding")
+        return None
+
+def save_race_cache(cache_root: str, race_spec: str, rows: pd.DataFrame):
+    path = race_cache_path(cache_root, race_spec)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        rows.to_parquet(path, compression="zstd")
+        print(f"Saved race cache: {path}")
+    except Exception as e:
+        print(f"[WRN] could not write race cache {path}: {e}")
+
 # ----------------------------- Featureization -----------------------------
 
-def hazard_features(df: pd.DataFrame, priors: Dict[str, Dict[str, float]]) -> pd.DataFrame:
-    feats=pd.DataFrame(index=df.index)
-    feats["tire_age_laps"]=df["tire_age_laps"].fillna(0).clip(lower=0).astype(float)
-    feats["stint_no"]=df["stint_no"].fillna(1).astype(int)
+def _last_lap_stats_np(M: np.ndarray):
+    valid = ~np.isnan(M)
+    Y = np.where(valid, M, np.float32(0))
+    cnt = valid.sum(axis=1)
+    n3 = valid[:, -3:].sum(axis=1)
+    avg3 = Y[:, -3:].sum(axis=1) / np.maximum(n3, 1)
+    var3 = np.where(cnt >= 3, ((Y[:, -3:] - avg3[:, None])**2).mean(axis=1, dtype=np.float32), np.float32(0))
+    x = np.arange(M.shape[1], dtype=np.float32)
+    n = np.maximum(cnt, 1)
+    xbar = (valid * x).sum(axis=1) / n
+    ybar = Y.sum(axis=1) / n
+    dx = np.where(valid, x - xbar[:, None], np.float32(0))
+    num = (dx * (Y - ybar[:, None])).sum(axis=1)
+    den = (dx**2).sum(axis=1)
+    slope = np.where((cnt >= 3) & (den > 0), num / np.where(den > 0, den, np.float32(1)), np.float32(0))
+    return avg3, slope, var3
+
+def _runlen_np(v: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    # idx - last reset, where a reset is a 0 flag or (one before) a group start
+    idx = np.arange(len(v))
+    reset = np.maximum.accumulate(np.where(v == 0, idx, np.where(starts, idx - 1, -1)))
+    return idx - reset
+
+try:  # one fused pass per row / per group when numba is available; NumPy above otherwise
+    from numba import njit, prange
+
+    @njit(parallel=True, cache=True)
+    def _last_lap_stats_nb(M):
+        N, W = M.shape
+        avg3 = np.zeros(N, np.float32); slope = np.zeros(N, np.float32); var3 = np.zeros(N, np.float32)
+        for i in prange(N):
+            cnt = 0; n3 = 0; sx = np.float32(0); sy = np.float32(0); s3 = np.float32(0)
+            for j in range(W):
+                y = M[i, j]
+                if y == y:
+                    cnt += 1; sx += np.float32(j); sy += y
+                    if j >= W - 3:
+                        n3 += 1; s3 += y
+            a = s3 / np.float32(max(n3, 1))
+            avg3[i] = a
+            if cnt < 3:
+                continue
+            q = np.float32(0)
+            for j in range(W - 3, W):
+                y = M[i, j]
+                d = (y if y == y else np.float32(0)) - a
+                q += d * d
+            var3[i] = q / np.float32(3)
+            xbar = sx / np.float32(cnt); ybar = sy / np.float32(cnt)
+            num = np.float32(0); den = np.float32(0)
+            for j in range(W):
+                y = M[i, j]
+                if y == y:
+                    dx = np.float32(j) - xbar
+                    num += dx * (y - ybar); den += dx * dx
+            if den > 0:
+                slope[i] = num / den
+        return avg3, slope, var3
+
+    @njit(cache=True)
+    def _runlen_nb(v, starts):
+        out = np.empty(v.size, np.int64); c = 0
+        for i in range(v.size):
+            c = 0 if (v[i] == 0) else (1 if starts[i] else c + 1)
+            out[i] = c
+        return out
+except ImportError:
+    _last_lap_stats_nb = _runlen_nb = None
+
+def last_lap_stats(M: np.ndarray):
+    """
+    Row-wise over the NaN-padded last-laps matrix:
+    last3_avg (mean of up to 3, 0 if none), last5_slope (OLS over the valid
+    tail, 0 if <3 points), last3_var (population var of last 3, 0 if <3).
+    """
+    M = M.astype(np.float32, copy=False)
+    if _last_lap_stats_nb is not None:
+        return _last_lap_stats_nb(np.ascontiguousarray(M))
+    return _last_lap_stats_np(M)
+
+def group_runlen(v: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Consecutive non-zero run length of v, also reset where starts is True (first row of a group)."""
+    if _runlen_nb is not None:
+        return _runlen_nb(np.ascontiguousarray(v), np.ascontiguousarray(starts))
+    return _runlen_np(v, starts)
+
+def compound_onehot(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """compound_<C> int8 indicator columns (missing -> HARD, unknown -> all zero) from one categorical encode."""
     comp=df["compound"].str.upper().fillna("HARD")
-    for c in COMPOUNDS: feats[f"compound_{c}"]=(comp==c).astype(int)
-    last=df["last_laps_json"].apply(parse_last)
-    feats["last3_avg"]=last.apply(lambda a: float(np.mean(a[-3:])) if len(a) else 0.0)
-    feats["last5_slope"]=last.apply(slope)
-    feats["last3_var"]=last.apply(var3)
-    med=df.apply(lambda r: priors.get(r["track"],{}).get(str(r["compound"]).upper(),None), axis=1)
-    feats["typical_stint_len"]=med.fillna(0).astype(float)
-    feats["age_vs_typical"]=feats["tire_age_laps"]-feats["typical_stint_len"]
-    feats["age_percentile"]=(feats["tire_age_laps"]/(feats["typical_stint_len"]+1e-6)).clip(upper=1.4)
-    feats["overshoot"]=(feats["tire_age_laps"]-feats["typical_stint_len"]).clip(lower=0)
-    return feats
-
-def tactical_features(df: pd.DataFrame, perlap: pd.DataFrame) -> pd.DataFrame:
-    feats=pd.DataFrame(index=df.index)
-    cheap=df["cheap_stop_flag_true"].astype(int)
-    feats["cheap_stop_flag"]=cheap
+    codes=pd.Categorical(comp, categories=COMPOUNDS).codes
+    onehot=(codes[:, None] == np.arange(len(COMPOUNDS))).astype(np.int8)
+    return {f"compound_{c}": onehot[:, j] for j, c in enumerate(COMPOUNDS)}
+
+def hazard_features(df: pd.DataFrame, priors: Dict[str, Dict[str, float]], onehot: Dict[str, np.ndarray] = None) -> pd.DataFrame:
+    # columns are computed as plain ndarrays and the frame is built once at the end
+    age=np.clip(df["tire_age_laps"].fillna(0).to_numpy(dtype=float), 0, None)
+    cols={"tire_age_laps": age, "stint_no": df["stint_no"].fillna(1).to_numpy().astype(int)}
+    cols.update(compound_onehot(df) if onehot is None else onehot)
+    cols["last3_avg"], cols["last5_slope"], cols["last3_var"] = last_lap_stats(df[LAST_LAP_COLS].to_numpy(dtype=np.float32))
+    # (track, compound) -> median stint length as one MultiIndex lookup instead of a per-row apply
+    pri=pd.Series({(t,c): v for t,d in priors.items() for c,v in d.items()}, dtype=float)
+    key=pd.MultiIndex.from_arrays([df["track"], df["compound"].map(str).str.upper()])
+    med=pri.reindex(key).to_numpy() if len(pri) else np.full(len(df), np.nan)
+    typ=np.nan_to_num(med.astype(float), nan=0.0)
+    cols["typical_stint_len"]=typ
+    gap=age-typ
+    cols["age_vs_typical"]=gap
+    cols["age_percentile"]=np.minimum(age/(typ+1e-6), 1.4)
+    cols["overshoot"]=np.maximum(gap, 0.0)
+    return pd.DataFrame(cols, index=df.index)
+
+def tactical_features(df: pd.DataFrame, perlap: pd.DataFrame, onehot: Dict[str, np.ndarray] = None) -> pd.DataFrame:
+    cols={"cheap_stop_flag": df["cheap_stop_flag_true"].astype(int).to_numpy()}
     grp=df.groupby("race_id")
-    feats["cheap_prev1"]=grp["cheap_stop_flag_true"].shift(1).fillna(0).astype(int)
-    feats["cheap_prev2"]=grp["cheap_stop_flag_true"].shift(2).fillna(0).astype(int)
-    # run length per race
-    run_series=pd.Series(0,index=df.index,dtype=int)
-    for rid, idx in df.sort_values(["race_id","lap"]).groupby("race_id").groups.items():
-        sub=df.loc[idx]
-        arr=sub["cheap_stop_flag_true"].astype(int).to_numpy()
-        out=np.zeros_like(arr,dtype=int); c=0
-        for i,v in enumerate(arr):
-            c = c+1 if v==1 else 0
-            out[i]=c
-        run_series.loc[idx]=out
-    feats["non_green_runlen"]=run_series.astype(int)
-    # per-lap pit behavior
-    joined=df.merge(perlap, how="left", on=["race_id","lap"]).fillna({"pits_prev1":0,"pits_prev2":0})
-    feats["pits_prev1"]=joined["pits_prev1"].astype(float)
-    feats["pits_prev2"]=joined["pits_prev2"].astype(float)
+    cols["cheap_prev1"]=grp["cheap_stop_flag_true"].shift(1).fillna(0).astype(int).to_numpy()
+    cols["cheap_prev2"]=grp["cheap_stop_flag_true"].shift(2).fillna(0).astype(int).to_numpy()
+    # run length per race, all races in one pass over the race-sorted flags
+    srt=df.sort_values(["race_id","lap"])
+    v=srt["cheap_stop_flag_true"].astype(int).to_numpy()
+    rid=srt["race_id"].to_numpy()
+    starts=np.r_[True, rid[1:]!=rid[:-1]][:len(v)]
+    cols["non_green_runlen"]=pd.Series(group_runlen(v, starts), index=srt.index).reindex(df.index).to_numpy().astype(int)
+    # per-lap pit behavior (a left merge keeps df's row order)
+    joined=df[["race_id","lap"]].merge(perlap, how="left", on=["race_id","lap"])
+    cols["pits_prev1"]=joined["pits_prev1"].fillna(0).to_numpy(dtype=float)
+    cols["pits_prev2"]=joined["pits_prev2"].fillna(0).to_numpy(dtype=float)
     # due markers
-    feats["tire_age_laps"]=df["tire_age_laps"].fillna(0).clip(lower=0).astype(float)
-    comp=df["compound"].str.upper().fillna("HARD")
-    for c in COMPOUNDS: feats[f"compound_{c}"]=(comp==c).astype(int)
-    return feats
+    cols["tire_age_laps"]=np.clip(df["tire_age_laps"].fillna(0).to_numpy(dtype=float), 0, None)
+    cols.update(compound_onehot(df) if onehot is None else onehot)
+    return pd.DataFrame(cols, index=df.index)
 
 def build_state_matrix(base: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
     priors=median_stint_lengths(base)
     perlap=make_per_lap_pit_counts(base)
-    H=hazard_features(base, priors)
-    T=tactical_features(base, perlap)
+    onehot=compound_onehot(base)  # shared by both blocks
+    H=hazard_features(base, priors, onehot)
+    T=tactical_features(base, perlap, onehot)
     X=pd.concat([H,T], axis=1)
     feat_list=list(X.columns)
     return X, feat_list
@@ -214,50 +344,34 @@ def build_replay(
     cheap_boost: float = 1.3
 ) -> Tuple[dict, dict]:
     """
-    Tuples: (s_t, a_t, r_t, s_{t+2}, done)
+    Transitions (s_t, a_t, r_t, s_{t+2}, done) as parallel arrays S, A, R, S2, D,
+    rows in (race_id, driver, lap) order; s_{t+2} is the same driver two rows on
+    (zeros and done=1 past the end of the driver's race).
     Reward shaping:
       +pos_reward (× cheap_boost if non-green) when action==BOX and pit within 2 laps
       neg_reward when action==BOX and no pit within 2 laps
       0 otherwise
     """
-    tuples = []
-    groups = []
-
-    y_this = base["pitted_this_lap"].astype(int).values
-    y_within2 = base["pitted_within2"].astype(int).values
-
     X_np = X[feat_list].to_numpy(dtype=np.float32)
 
-    sorted_base = base.sort_values(["race_id","driver","lap"])
-    for (rid, drv), g in sorted_base.groupby(["race_id","driver"], sort=False):
-        idxs = g.index.to_list()
-        n = len(idxs)
-        for k in range(n):
-            i = idxs[k]
-            k2 = k+2
-            if k2 >= n:
-                done = True
-                s_tp2 = np.zeros_like(X_np[i])
-            else:
-                done = False
-                s_tp2 = X_np[idxs[k2]]
-
-            s_t = X_np[i]
-            a_t = 1 if y_this[i]==1 else 0
-            will_pit_in2 = y_within2[i]==1
-
-            cheap = int(base.loc[i, "cheap_stop_flag_true"]) if "cheap_stop_flag_true" in base.columns else 0
-            r = 0.0
-            if a_t==1 and will_pit_in2:
-                r = pos_reward * (cheap_boost if cheap==1 else 1.0)
-            elif a_t==1 and not will_pit_in2:
-                r = neg_reward
-
-            tuples.append((s_t, a_t, r, s_tp2, done))
-            groups.append(rid)
-
-    replay = {"tuples": tuples, "feat_list": feat_list}
-    meta = {"groups": groups}
+    srt = base.reset_index(drop=True).sort_values(["race_id","driver","lap"])
+    i = srt.index.to_numpy()
+    g = srt.groupby(["race_id","driver"], sort=False)
+    k = g.cumcount().to_numpy()
+    n = g["lap"].transform("size").to_numpy()
+    has2 = k + 2 < n
+    i2 = i[np.minimum(np.arange(len(i)) + 2, max(len(i) - 1, 0))]
+
+    S = X_np[i]
+    S2 = np.where(has2[:, None], X_np[i2], np.float32(0))
+    A = (srt["pitted_this_lap"].astype(int).to_numpy() == 1).astype(np.int64)
+    will_pit_in2 = srt["pitted_within2"].astype(int).to_numpy() == 1
+    cheap = (srt["cheap_stop_flag_true"].astype(int).to_numpy() == 1) if "cheap_stop_flag_true" in srt.columns else np.zeros(len(i), dtype=bool)
+    R = np.where(A == 1, np.where(will_pit_in2, pos_reward * np.where(cheap, cheap_boost, 1.0), neg_reward), 0.0)
+
+    replay = {"S": S, "A": A, "R": R.astype(np.float32), "S2": S2, "D": (~has2).astype(np.float32),
+              "feat_list": feat_list}
+    meta = {"groups": srt["race_id"].to_numpy()}
     return replay, meta
 
 # ----------------------------- Model -----------------------------
@@ -278,40 +392,111 @@ class QRDQN(nn.Module):
         q = self.head(z)
         return q.view(-1, self.n_actions, self.n_quantiles)
 
-def quantile_huber_loss(pred: torch.Tensor, target: torch.Tensor, taus: torch.Tensor, kappa: float = 1.0):
-    u = target.unsqueeze(1) - pred.unsqueeze(2)  # (B,Q,Q)
-    abs_u = torch.abs(u)
-    huber = torch.where(abs_u <= kappa, 0.5 * u ** 2, kappa * (abs_u - 0.5 * kappa))
-    tau = taus.view(1, -1, 1)
-    weight = torch.abs((u.detach() < 0).float() - tau)
-    return (weight * huber).mean()
+class _QuantileHuber(torch.autograd.Function):
+    """
+    Streams target quantiles in chunks: peak memory (B, Q, chunk) instead of
+    the (B, Q, Q) pairwise tensor, and no per-chunk graph is kept. The pred
+    gradient is accumulated in closed form, -sum_j w * clamp(u, -kappa, kappa);
+    the target is a no-grad bootstrap and gets no gradient.
+    """
+    @staticmethod
+    def forward(ctx, pred, target, taus, kappa: float, chunk: int):
+        tau = taus.view(1, -1, 1)
+        loss = pred.new_zeros(())
+        grad = torch.zeros_like(pred)
+        for j in range(0, target.size(1), chunk):
+            u = target[:, None, j:j+chunk] - pred[:, :, None]  # (B,Q,c)
+            w = torch.abs((u < 0).float() - tau)
+            abs_u = torch.abs(u)
+            loss += (w * torch.where(abs_u <= kappa, 0.5 * u * u, kappa * (abs_u - 0.5 * kappa))).sum()
+            grad -= (w * u.clamp(-kappa, kappa)).sum(dim=2)
+        n = pred.numel() * target.size(1)
+        ctx.save_for_backward(grad / n)
+        return loss / n
+
+    @staticmethod
+    def backward(ctx, g):
+        (grad,) = ctx.saved_tensors
+        return g * grad, None, None, None, None
+
+def quantile_huber_loss(pred: torch.Tensor, target: torch.Tensor, taus: torch.Tensor, kappa: float = 1.0,
+                        chunk: int = 16):
+    # always reduced in float32, also under bf16/fp16 autocast
+    return _QuantileHuber.apply(pred.float(), target.detach().float(), taus, kappa, chunk)
 
 # ----------------------------- Data utils -----------------------------
 
-class OfflineBuffer(Dataset):
-    def __init__(self, tuples: List[tuple], oversample_pos: int = 8):
-        self.base = tuples
-        pos = [t for t in tuples if t[2] > 0]
-        neg = [t for t in tuples if t[2] <= 0]
-        self.items = neg + pos * max(1, oversample_pos)
-
-    def __len__(self): return len(self.items)
-
-    def __getitem__(self, idx):
-        s, a, r, s2, done = self.items[idx]
-        return (
-            torch.tensor(s, dtype=torch.float32),
-            torch.tensor(a, dtype=torch.long),
-            torch.tensor(r, dtype=torch.float32),
-            torch.tensor(s2, dtype=torch.float32),
-            torch.tensor(done, dtype=torch.float32),
-        )
+class OfflineBuffer:
+    """
+    Replay rows `idx` as dense tensors (S, A, R, S2, D) uploaded to `device`
+    once; positives are oversampled by repeating their row index in `pool`,
+    and batches are gathered by on-device indexing (no DataLoader / collate).
+    """
+    def __init__(self, replay: dict, idx: np.ndarray, oversample_pos: int = 8, device: torch.device = torch.device("cpu")):
+        idx = np.asarray(idx, dtype=np.int64)
+        self.S, self.A, self.R, self.S2, self.D = (torch.from_numpy(np.ascontiguousarray(replay[k][idx])).to(device)
+                                                   for k in ("S","A","R","S2","D"))
+        R = replay["R"][idx]
+        pos = np.flatnonzero(R > 0)
+        neg = np.flatnonzero(R <= 0)
+        self.pool = torch.from_numpy(np.concatenate([neg] + [pos] * max(1, oversample_pos))).to(device)
+
+    def __len__(self): return len(self.pool)
+
+    def batches(self, batch_size: int, shuffle: bool = True, drop_last: bool = True):
+        """One epoch over the pool: a device-side randperm, then index-gathered (s, a, r, s2, done) batches."""
+        order = self.pool[torch.randperm(len(self.pool), device=self.pool.device)] if shuffle else self.pool
+        stop = len(order) - (len(order) % batch_size if drop_last else 0)
+        for i in range(0, stop, batch_size):
+            j = order[i:i+batch_size]
+            yield self.S[j], self.A[j], self.R[j], self.S2[j], self.D[j]
 
 def choose_device():
     if torch.cuda.is_available(): return torch.device("cuda")
     if torch.backends.mps.is_available(): return torch.device("mps")
     return torch.device("cpu")
 
+# ----------------------------- Calibration / thresholding -----------------------------
+
+def platt_fit(scores: np.ndarray, labels: np.ndarray, C: float = 1.0, iters: int = 50) -> Dict[str, float]:
+    """
+    1-D Platt scaling by Newton/IRLS on the 2x2 system. Same objective as
+    LogisticRegression(C=C, class_weight="balanced"): class-balanced log loss
+    plus an L2 penalty of 1/(2C) on the slope (intercept unpenalized).
+    """
+    s = np.asarray(scores, dtype=np.float64).ravel()
+    y = (np.asarray(labels) == 1).astype(np.float64)
+    n_pos = y.sum(); n_neg = len(y) - n_pos
+    sw = np.where(y == 1, len(y) / (2 * max(n_pos, 1)), len(y) / (2 * max(n_neg, 1)))
+    a = b = 0.0
+    for _ in range(iters):
+        p = 1.0 / (1.0 + np.exp(-(a * s + b)))
+        r, h = sw * (p - y), sw * p * (1 - p)
+        g = np.array([r @ s + a / C, r.sum()])
+        H = np.array([[h @ (s * s) + 1.0 / C, h @ s], [h @ s, h.sum() + 1e-12]])
+        da, db = np.linalg.solve(H, g)
+        a, b = a - da, b - db
+        if abs(da) + abs(db) < 1e-10:
+            break
+    return {"coef": float(a), "intercept": float(b)}
+
+
+def threshold_sweep(probs: np.ndarray, labels: np.ndarray, grid: np.ndarray):
+    """
+    Binary precision / recall / F1 / F2 (zero_division=0) for every threshold
+    in `grid` at once, from one (len(grid), N) prediction matrix.
+    """
+    y = np.asarray(labels) == 1
+    pred = np.asarray(probs)[None, :] >= np.asarray(grid)[:, None]
+    tp = (pred & y).sum(axis=1).astype(float)
+    fp = pred.sum(axis=1) - tp
+    fn = y.sum() - tp
+    def div(a, b): return np.divide(a, b, out=np.zeros_like(a), where=b > 0)
+    pr, rc = div(tp, tp + fp), div(tp, tp + fn)
+    f1 = div(2 * tp, 2 * tp + fp + fn)
+    f2 = div(5 * tp, 5 * tp + 4 * fn + fp)
+    return pr, rc, f1, f2
+
 # ----------------------------- Training -----------------------------
 
 def train_qrdqn(
@@ -331,15 +516,24 @@ def train_qrdqn(
     cheap_boost: float = 1.3,
     target_recall: float = 0.0,  # 0 -> disabled; else enforce recall floor when choosing threshold
     seed: int = 42,
+    amp: str = "off",  # "bf16" / "fp16" autocast for the training step
+    race_cache: str = None,  # dir for per-race Parquet base rows (None/"" disables)
+    torch_compile: bool = False,  # torch.compile the fixed-shape training forwards
 ):
     torch.manual_seed(seed); np.random.seed(seed)
     enable_fastf1_cache(cache_dir)
 
-    # Build base rows
-    all_rows=[]
-    for spec in races:
-        ses, rid, track, yr = load_race_session(spec)
-        all_rows.append(build_car_lap_rows(ses, rid, track, yr))
+    # Build base rows (reusing the on-disk copy when fresh); the IO-bound
+    # FastF1 loads of the remaining races run concurrently
+    all_rows=[load_race_cache(race_cache, spec, cache_dir) if race_cache else None for spec in races]
+    todo=[i for i, rows in enumerate(all_rows) if rows is None]
+    if todo:
+        with ThreadPoolExecutor(max_workers=min(8, len(todo))) as ex:
+            sessions=list(ex.map(load_race_session, [races[i] for i in todo]))
+        for i, (ses, rid, track, yr) in zip(todo, sessions):
+            all_rows[i]=build_car_lap_rows(ses, rid, track, yr)
+            if race_cache:
+                save_race_cache(race_cache, races[i], all_rows[i])
     base = pd.concat(all_rows, ignore_index=True)
 
     # Features
@@ -350,37 +544,33 @@ def train_qrdqn(
         base, X, feat_list,
         pos_reward=pos_reward, neg_reward=neg_reward, cheap_boost=cheap_boost
     )
-    tuples = replay["tuples"]
-    groups = np.array(meta["groups"])
-
-    # Sanity on dims
-    replay_dim = len(tuples[0][0])
-    for j in (len(tuples)//3, 2*len(tuples)//3, len(tuples)-1):
-        assert len(tuples[j][0]) == replay_dim
-        assert len(tuples[j][3]) == replay_dim
+    S, R = replay["S"], replay["R"]
+    groups = np.asarray(meta["groups"])
+
+    replay_dim = S.shape[1]
     print(f"[QRDQN] feat_list={len(feat_list)} ; replay_dim={replay_dim}")
 
     # Split by race (last race as val)
     uniq = np.unique(groups)
     if len(uniq) >= 2:
         val_race = uniq[-1]
-        train_idx = [i for i,g in enumerate(groups) if g != val_race]
-        val_idx   = [i for i,g in enumerate(groups) if g == val_race]
+        train_idx = np.flatnonzero(groups != val_race)
+        val_idx   = np.flatnonzero(groups == val_race)
     else:
-        N = len(tuples); perm=np.random.permutation(N); cut=int(0.8*N)
+        N = len(S); perm=np.random.permutation(N); cut=int(0.8*N)
         train_idx, val_idx = perm[:cut], perm[cut:]
 
-    train_tuples = [tuples[i] for i in train_idx]
-    val_tuples   = [tuples[i] for i in val_idx]
-
-    train_ds = OfflineBuffer(train_tuples, oversample_pos=oversample_pos)
-    val_ds   = OfflineBuffer(val_tuples,   oversample_pos=1)
+    val_states = S[val_idx]
+    val_labels = (R[val_idx] > 0.5).astype(float)
 
-    train_loader = DataLoader(train_ds, batch_size=batch_size, shuffle=True, drop_last=True)
-    val_loader   = DataLoader(val_ds,   batch_size=batch_size, shuffle=False, drop_last=False)
+    # Replay lives on the training device; batches are gathered there
+    device = choose_device()
+    train_ds = OfflineBuffer(replay, train_idx, oversample_pos=oversample_pos, device=device)
+    # Validation states go to the device once; each scoring pass copies back only the [N] gap
+    val_S = torch.from_numpy(np.ascontiguousarray(val_states, dtype=np.float32)).to(device)
+    val_buf = torch.empty(len(val_idx), dtype=torch.float32, pin_memory=device.type == "cuda")
 
     # Model
-    device = choose_device()
     in_dim = replay_dim
     net = QRDQN(in_dim, 2, n_quantiles, hidden).to(device)
     tgt = QRDQN(in_dim, 2, n_quantiles, hidden).to(device)
@@ -391,36 +581,70 @@ def train_qrdqn(
 
     target_tau = 200
     step = 0
+    rows = torch.arange(batch_size, device=device)  # batch row index, built once on-device
+    # CUDA: the no-grad target forward runs on a side stream, overlapping the online forward
+    tgt_stream = torch.cuda.Stream(device) if device.type == "cuda" else None
+    # Mixed precision: forwards under autocast, loss reduced in fp32; fp16 also needs loss scaling
+    amp_dtype = {"bf16": torch.bfloat16, "fp16": torch.float16}.get(amp)
+
+    def val_scores() -> np.ndarray:
+        """Expectation gap (BOX - NO_BOX) over the validation states, one forward."""
+        with torch.no_grad():
+            q = net(val_S).mean(dim=-1)
+            val_buf.copy_(q[:, 1] - q[:, 0])
+        return val_buf.numpy()
+    scaler = torch.amp.GradScaler(device.type, enabled=amp_dtype is torch.float16)
+    # Training-step forwards; batches are fixed-size (drop_last), so a compiled graph is
+    # specialised once per shape. Parameters stay shared with net/tgt (saving, syncing, val).
+    net_fw, tgt_fw = net, tgt
+    if torch_compile:
+        if hasattr(torch, "compile"):
+            net_fw = torch.compile(net, dynamic=False, fullgraph=True)
+            tgt_fw = torch.compile(tgt, dynamic=False, fullgraph=True)
+        else:
+            print("[WRN] torch.compile unavailable; training uncompiled")
 
     # Train
     for ep in range(epochs):
         net.train()
-        for (s, a, r, s2, done) in train_loader:
-            s = s.to(device); a=a.to(device); r=r.to(device); s2=s2.to(device); done=done.to(device)
+        for (s, a, r, s2, done) in train_ds.batches(batch_size):
             B = s.size(0)
-
-            with torch.no_grad():
-                qz_next_online = net(s2)
-                exp_next = qz_next_online.mean(dim=-1)
-                a_star = exp_next.argmax(dim=1)
-
-                qz_next_target = tgt(s2)
-                target_z = qz_next_target[torch.arange(B), a_star]
-                Tz = r.unsqueeze(1) + (1.0 - done.unsqueeze(1)) * (gamma**2) * target_z
-
-            qz = net(s)
-            qz_a = qz[torch.arange(B), a]
-            loss = quantile_huber_loss(qz_a, Tz, taus, kappa=1.0)
-
-            if cql_alpha > 0.0:
-                exp_all = qz.mean(dim=-1)
-                logsum = torch.logsumexp(exp_all, dim=1)
-                q_beh = exp_all[torch.arange(B), a]
-                loss = loss + cql_alpha * (logsum - q_beh).mean()
-
-            opt.zero_grad(); loss.backward()
+            ar = rows[:B]
+
+            with torch.autocast(device_type=device.type, dtype=amp_dtype or torch.bfloat16, enabled=amp_dtype is not None):
+                if tgt_stream is not None:
+                    tgt_stream.wait_stream(torch.cuda.current_stream(device))
+                    with torch.cuda.stream(tgt_stream), torch.no_grad():
+                        qz_next_target = tgt_fw(s2)
+                else:
+                    with torch.no_grad():
+                        qz_next_target = tgt_fw(s2)
+
+                # separate no-grad online forward: stacking [s; s2] into one grad-enabled pass
+                # keeps the s2 half in the graph and backprops zeros through it (slower)
+                with torch.no_grad():
+                    exp_next = net_fw(s2).mean(dim=-1)
+                    a_star = exp_next.argmax(dim=1)
+
+                    if tgt_stream is not None:
+                        torch.cuda.current_stream(device).wait_stream(tgt_stream)
+                    target_z = qz_next_target[ar, a_star]
+                    Tz = r.unsqueeze(1) + (1.0 - done.unsqueeze(1)) * (gamma**2) * target_z
+
+                qz = net_fw(s)
+                qz_a = qz[ar, a]
+                loss = quantile_huber_loss(qz_a, Tz, taus, kappa=1.0)
+
+                if cql_alpha > 0.0:
+                    exp_all = qz.mean(dim=-1)
+                    logsum = torch.logsumexp(exp_all, dim=1)
+                    q_beh = exp_all[ar, a]
+                    loss = loss + cql_alpha * (logsum - q_beh).mean()
+
+            opt.zero_grad(); scaler.scale(loss).backward()
+            scaler.unscale_(opt)  # clip true gradients (no-op unless fp16)
             torch.nn.utils.clip_grad_norm_(net.parameters(), 5.0)
-            opt.step()
+            scaler.step(opt); scaler.update()
 
             step += 1
             if step % target_tau == 0:
@@ -428,18 +652,12 @@ def train_qrdqn(
 
         # quick directional val (AUC/AP on reward-proxy labels)
         net.eval()
-        with torch.no_grad():
-            val_states = np.stack([t[0] for t in val_tuples], axis=0)
-            s_tensor = torch.tensor(val_states, dtype=torch.float32, device=device)
-            qz = net(s_tensor).cpu().numpy()
-            exp = qz.mean(axis=-1)
-            scores = exp[:,1] - exp[:,0]
-            val_labels = np.array([1.0 if (t[2] > 0.5) else 0.0 for t in val_tuples], dtype=float)
-            try:
-                auc = roc_auc_score(val_labels, scores)
-                ap  = average_precision_score(val_labels, scores)
-            except Exception:
-                auc, ap = float("nan"), float("nan")
+        scores = val_scores()
+        try:
+            auc = roc_auc_score(val_labels, scores)
+            ap  = average_precision_score(val_labels, scores)
+        except Exception:
+            auc, ap = float("nan"), float("nan")
         print(f"[epoch {ep+1}/{epochs}] val AUC={auc:.3f} AP={ap:.3f}")
 
     # Save model + meta
@@ -461,52 +679,27 @@ def train_qrdqn(
         "note": "Expectation gap (BOX - NO_BOX) -> Platt -> prob",
     }, indent=2))
 
-    # Platt calibration
-    with torch.no_grad():
-        ss = torch.tensor(np.stack([t[0] for t in val_tuples], axis=0), dtype=torch.float32, device=device)
-        qz = net(ss).cpu().numpy()
-        exp = qz.mean(axis=-1)
-        scores = exp[:,1] - exp[:,0]
-    val_labels = np.array([1.0 if (t[2] > 0.5) else 0.0 for t in val_tuples], dtype=float)
-
-    lr_platt = LogisticRegression(max_iter=500, class_weight="balanced")
-    lr_platt.fit(scores.reshape(-1,1), val_labels)
-    calib = {"coef": float(lr_platt.coef_[0,0]), "intercept": float(lr_platt.intercept_[0])}
+    # Platt calibration (same on-device validation tensor)
+    net.eval()
+    scores = val_scores().copy()
+
+    calib = platt_fit(scores, val_labels)
     (rl_dir / "calib_platt.json").write_text(json.dumps(calib, indent=2))
 
     # Threshold selection — F2 priority, optional recall floor
     probs = 1.0 / (1.0 + np.exp(-(calib["coef"]*scores + calib["intercept"])))
 
-    best = {"th": 0.5, "f2": -1.0, "pr": 0.0, "rc": 0.0, "f1": 0.0}
     grid = np.linspace(0.2, 0.8, 121)
+    pr, rc, f1, f2 = threshold_sweep(probs, val_labels, grid)
 
-    # If recall floor requested, pre-filter candidates
-    if target_recall > 0.0:
-        candidates = []
-        for th in grid:
-            pred = (probs >= th).astype(int)
-            pr, rc, f1, _ = precision_recall_fscore_support(val_labels, pred, average="binary", zero_division=0)
-            if rc >= target_recall:
-                candidates.append((th, pr, rc, f1, fbeta_score(val_labels, pred, beta=2.0, average="binary", zero_division=0)))
-        if candidates:
-            # choose best precision among those meeting recall floor
-            th, pr, rc, f1, f2 = max(candidates, key=lambda x: (x[1], x[4]))
-            best = {"th": th, "f2": f2, "pr": pr, "rc": rc, "f1": f1}
-        else:
-            # fall back to plain F2 maximization
-            for th in grid:
-                pred = (probs >= th).astype(int)
-                f2 = fbeta_score(val_labels, pred, beta=2.0, average="binary", zero_division=0)
-                if f2 > best["f2"]:
-                    pr, rc, f1, _ = precision_recall_fscore_support(val_labels, pred, average="binary", zero_division=0)
-                    best = {"th": th, "f2": f2, "pr": pr, "rc": rc, "f1": f1}
+    # If recall floor requested, pick best precision (then F2) among thresholds meeting it
+    ok = np.flatnonzero(rc >= target_recall) if target_recall > 0.0 else np.zeros(0, dtype=int)
+    if len(ok):
+        i = ok[np.lexsort((ok, -f2[ok], -pr[ok]))[0]]
     else:
-        for th in grid:
-            pred = (probs >= th).astype(int)
-            f2 = fbeta_score(val_labels, pred, beta=2.0, average="binary", zero_division=0)
-            if f2 > best["f2"]:
-                pr, rc, f1, _ = precision_recall_fscore_support(val_labels, pred, average="binary", zero_division=0)
-                best = {"th": th, "f2": f2, "pr": pr, "rc": rc, "f1": f1}
+        # plain F2 maximization (first best threshold)
+        i = int(np.argmax(f2))
+    best = {"th": grid[i], "f2": f2[i], "pr": pr[i], "rc": rc[i], "f1": f1[i]}
 
     reports = Path(out_dir) / "reports"
     reports.mkdir(parents=True, exist_ok=True)
@@ -540,6 +733,8 @@ def main():
     ap.add_argument("--races", required=True, help="Comma-separated list like 2023:Monaco,2023:Monza")
     ap.add_argument("--cache", default="data/fastf1_cache")
     ap.add_argument("--out",   default="artifacts")
+    ap.add_argument("--race_cache", default="data/race_cache",
+                    help="Dir for per-race Parquet base-row cache ('' disables)")
     # model/train
     ap.add_argument("--epochs", type=int, default=20)
     ap.add_argument("--batch_size", type=int, default=512)
@@ -548,6 +743,8 @@ def main():
     ap.add_argument("--lr", type=float, default=1e-3)
     ap.add_argument("--hidden", type=int, default=256)
     ap.add_argument("--cql_alpha", type=float, default=0.0)
+    ap.add_argument("--amp", choices=["off","bf16","fp16"], default="off", help="Mixed-precision autocast for the training step (loss stays fp32)")
+    ap.add_argument("--compile", action="store_true", help="torch.compile the training-step forwards (fixed batch shapes)")
     # imbalance knobs
     ap.add_argument("--oversample_pos", type=int, default=8)
     ap.add_argument("--pos_reward", type=float, default=2.0)
@@ -574,6 +771,9 @@ def main():
         neg_reward=args.neg_reward,
         cheap_boost=args.cheap_boost,
         target_recall=args.target_recall,
+        amp=args.amp,
+        race_cache=args.race_cache,
+        torch_compile=args.compile,
     )
 
 if __name__ == "__main__":
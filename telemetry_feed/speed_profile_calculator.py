@@ -0,0 +1,245 @@
+"""
+Sliding-window speed profile for integration-based time-to-call estimates.
+
+Python counterpart of speed_profile_calculator.rs. The window is stored as two
+parallel float32 ring buffers (distance, speed) instead of a deque of dicts, so
+profile queries are a handful of NumPy ops over contiguous memory. Profiles are
+returned as a pair of contiguous float32 arrays (xs, vs) that a native consumer
+can read through the buffer protocol without per-sample conversion.
+"""
+
+import json
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Samples within this margin before/after the requested range are kept for smoother integration
+BUFFER_M = 50.0
+
+# (xs, vs): distances in m and speeds in m/s, float32, sorted by distance
+Profile = Tuple[np.ndarray, np.ndarray]
+
+
+def _sorted_profile(x: np.ndarray, v: np.ndarray, min_x: float, max_x: float) -> Optional[Profile]:
+    """Samples with min_x <= x <= max_x, sorted by x; None if fewer than 2 qualify."""
+    mask = (x >= min_x) & (x <= max_x)
+    xs, vs = x[mask], v[mask]
+    # Need at least 2 points for meaningful integration
+    if xs.size < 2:
+        return None
+    order = np.argsort(xs, kind="stable")
+    return xs[order], vs[order]
+
+
+try:  # optional: the whole window query as one compiled pass (NumPy paths below otherwise)
+    from numba import njit
+
+    @njit(cache=True)
+    def build_profile(x, v, head, count, min_x, max_x):
+        """Ring window (oldest at head once full) -> in-range (xs, vs), stable-sorted by x."""
+        W = x.size
+        start = head if count == W else 0
+        xs = np.empty(count, np.float32); vs = np.empty(count, np.float32)
+        k = 0
+        for n in range(count):
+            i = (start + n) % W
+            xi = x[i]
+            if xi >= min_x and xi <= max_x:
+                # insertion sort: O(k) per point, ~free for the usual already-sorted window
+                j = k
+                while j > 0 and xs[j - 1] > xi:
+                    xs[j] = xs[j - 1]; vs[j] = vs[j - 1]
+                    j -= 1
+                xs[j] = xi; vs[j] = v[i]
+                k += 1
+        return xs[:k].copy(), vs[:k].copy()
+
+    # compile (or load the cached build) at import, not on the first live sample
+    build_profile(np.zeros(2, np.float32), np.zeros(2, np.float32), 0, 2, np.float32(0), np.float32(1))
+except ImportError:
+    build_profile = None
+
+
+class SpeedProfileCalculator:
+    """Maintains a sliding window of recent telemetry and generates speed profiles."""
+
+    def __init__(self, window_size: int = 50, lookahead_m: float = 500.0):
+        """
+        Args:
+            window_size: Number of recent samples to keep in the sliding window
+            lookahead_m: Distance ahead (meters) to include in the profile for integration
+        """
+        self.window_size = int(window_size)
+        self.lookahead_m = float(lookahead_m)
+        self.x = np.empty(self.window_size, np.float32)  # lap distance, m
+        self.v = np.empty(self.window_size, np.float32)  # speed, m/s
+        self.head = 0   # next write slot
+        self.count = 0  # filled slots
+        # dn[i]: slot i's distance is below its predecessor's; desc counts them in the window.
+        # Within a lap distances only grow, so desc == 0 is the common case and the window
+        # is already sorted oldest -> newest (no mask / argsort needed)
+        self.dn = [False] * self.window_size
+        self.desc = 0
+        self._last_x = 0.0
+
+    def add_sample(self, lap_distance_m: float, speed_kph: float) -> None:
+        """Add a telemetry sample (speed in km/h), overwriting the oldest once the window is full."""
+        self.add_sample_mps(lap_distance_m, speed_kph / 3.6)
+
+    def add_sample_mps(self, lap_distance_m: float, speed_mps: float) -> None:
+        """add_sample with speed already in m/s (convert whole columns once upstream)."""
+        h, W, dn = self.head, self.window_size, self.dn
+        if self.count == W:  # evicting slot h: its successor loses its predecessor
+            nxt = (h + 1) % W
+            self.desc -= dn[h] + dn[nxt]
+            dn[nxt] = False
+        self.x[h] = lap_distance_m
+        self.v[h] = speed_mps
+        x = float(self.x[h])  # compare as stored (float32)
+        d = 0 < self.count and 1 < W and x < self._last_x
+        dn[h] = d
+        self.desc += d
+        self._last_x = x
+        self.head = (h + 1) % W
+        if self.count < W:
+            self.count += 1
+
+    def _window(self):
+        """Window contents oldest -> newest as (x, v) arrays."""
+        if self.count < self.window_size:
+            return self.x[:self.count], self.v[:self.count]
+        h = self.head
+        return np.concatenate((self.x[h:], self.x[:h])), np.concatenate((self.v[h:], self.v[:h]))
+
+    def get_profile(self, current_distance_m: float, target_distance_m: float) -> Optional[Profile]:
+        """
+        Samples covering [current - BUFFER_M, target + BUFFER_M], sorted by distance.
+
+        Returns:
+            (xs, vs) float32 arrays, or None if fewer than 2 samples qualify
+        """
+        if self.count < 2:
+            return None
+        min_x, max_x = current_distance_m - BUFFER_M, target_distance_m + BUFFER_M
+        if build_profile is not None:
+            # float32 bounds: compare exactly as the NumPy paths do
+            xs, vs = build_profile(self.x, self.v, self.head, self.count, np.float32(min_x), np.float32(max_x))
+            return (xs, vs) if xs.size >= 2 else None
+        x, v = self._window()
+        if self.desc:
+            return _sorted_profile(x, v, min_x, max_x)
+        # window already sorted oldest -> newest: bound the range with two binary searches
+        i, j = x.searchsorted(min_x, "left"), x.searchsorted(max_x, "right")
+        if j - i < 2:
+            return None
+        return x[i:j].copy(), v[i:j].copy()  # detach from the ring, which keeps changing
+
+    def get_lookahead_profile(self, current_distance_m: float) -> Optional[Profile]:
+        """Profile from the current position to lookahead_m ahead (see get_profile)."""
+        if self.count < 2:
+            return None
+        return self.get_profile(current_distance_m, current_distance_m + self.lookahead_m)
+
+    def reset(self) -> None:
+        """Clear the sliding window."""
+        self.head = 0
+        self.count = 0
+        self.dn = [False] * self.window_size
+        self.desc = 0
+
+    def window_len(self) -> int:
+        """Number of samples currently in the window."""
+        return self.count
+
+
+def calculate_speed_profile_from_dataframe(
+    telemetry_df: pd.DataFrame,
+    current_distance_m: float,
+    target_distance_m: float,
+) -> Optional[Profile]:
+    """
+    Profile over [current, target] straight from a FastF1 telemetry frame
+    (`Distance` in m, `Speed` in km/h), column-wise with no per-row access.
+    """
+    dist = telemetry_df["Distance"]
+    d = dist.to_numpy()
+    lo, hi = 0, d.size
+    if dist.is_monotonic_increasing:
+        # single-lap telemetry (add_distance) is sorted: bound the slice first, convert only that
+        lo = int(np.searchsorted(d, current_distance_m, side="left"))
+        hi = int(np.searchsorted(d, target_distance_m, side="right"))
+    x = d[lo:hi].astype(np.float32)
+    v = telemetry_df["Speed"].to_numpy()[lo:hi].astype(np.float32) / np.float32(3.6)
+    return _sorted_profile(x, v, current_distance_m, target_distance_m)
+
+
+def profile_to_samples(profile: Optional[Profile]) -> Optional[List[Dict[str, float]]]:
+    """(xs, vs) profile -> JSON-ready [{"x_m", "v_mps"}, ...], the backend's Vec<SpeedSample> (None passes through)."""
+    if profile is None:
+        return None
+    xs, vs = profile
+    return [{"x_m": x, "v_mps": v} for x, v in zip(xs.tolist(), vs.tolist())]
+
+
+def profile_to_columns(profile: Optional[Profile]) -> Optional[Dict[str, List[float]]]:
+    """(xs, vs) profile -> JSON-ready {"x_m": [...], "v_mps": [...]} (None passes through)."""
+    if profile is None:
+        return None
+    xs, vs = profile
+    return {"x_m": xs.tolist(), "v_mps": vs.tolist()}
+
+
+class ProfileEncoder:
+    """
+    Profile -> JSON text ("null" for None), reusing serialization work across calls.
+
+    Consecutive lookahead profiles share almost all of their samples, so each
+    sample (or, columnar, each distance/speed value) is encoded once and a
+    profile is a join of cached pieces; an unchanged profile returns the
+    previous text outright. Output parses to exactly
+    json.dumps(profile_to_samples(profile)), or profile_to_columns with columnar=True.
+    """
+
+    def __init__(self, max_entries: int = 4096, columnar: bool = False):
+        self.max_entries = max_entries
+        self.columnar = columnar
+        self._parts: Dict[object, str] = {}
+        self._last: Optional[Profile] = None
+        self._last_text = "null"
+
+    def _join(self, vals: List[float]) -> str:
+        parts = self._parts
+        out = []
+        for x in vals:
+            t = parts.get(x)
+            if t is None:
+                t = parts[x] = json.dumps(x)
+            out.append(t)
+        return ",".join(out)
+
+    def _join_samples(self, xs: List[float], vs: List[float]) -> str:
+        parts = self._parts
+        out = []
+        for k in zip(xs, vs):
+            t = parts.get(k)
+            if t is None:
+                t = parts[k] = '{"x_m":%s,"v_mps":%s}' % (json.dumps(k[0]), json.dumps(k[1]))
+            out.append(t)
+        return ",".join(out)
+
+    def __call__(self, profile: Optional[Profile]) -> str:
+        if profile is None:
+            return "null"
+        xs, vs = profile
+        last = self._last
+        if last is not None and np.array_equal(last[0], xs) and np.array_equal(last[1], vs):
+            return self._last_text
+        if len(self._parts) > self.max_entries:
+            self._parts.clear()
+        if self.columnar:
+            text = '{"x_m":[%s],"v_mps":[%s]}' % (self._join(xs.tolist()), self._join(vs.tolist()))
+        else:
+            text = "[" + self._join_samples(xs.tolist(), vs.tolist()) + "]"
+        self._last, self._last_text = profile, text
+        return text
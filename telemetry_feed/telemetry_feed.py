@@ -3,53 +3,178 @@ import asyncio
 import json
 import websockets
 import os
-from speed_profile_calculator import SpeedProfileCalculator
+import math
+import numpy as np
+from speed_profile_calculator import SpeedProfileCalculator, ProfileEncoder, profile_to_samples
+
+try:  # optional: much faster float encoding
+    import orjson
+except ImportError:
+    orjson = None
+
+def _num(x):
+    # JSON number text, as json.dumps would write it
+    return repr(x) if math.isfinite(x) else json.dumps(x)
+
+# Fixed per-sample schema for the stdlib path, formatted once per sample (and encoded once per frame)
+_SAMPLE_TMPL = '{"lap_distance_m":%s,"speed_kph":%s,"speed_profile":%s}'
+
+def encode_sample(lap_distance_m, speed_kph, profile, encode_profile: ProfileEncoder) -> str:
+    """One legacy TelemetryPacket {lap_distance_m, speed_kph, speed_profile: [{x_m, v_mps}, ...]} as JSON text"""
+    if orjson is not None:
+        return orjson.dumps({"lap_distance_m": lap_distance_m, "speed_kph": speed_kph,
+                             "speed_profile": profile_to_samples(profile)}).decode()
+    return _SAMPLE_TMPL % (_num(lap_distance_m), _num(speed_kph), encode_profile(profile))
+
+def encode_frame(samples, encode_profile: ProfileEncoder) -> bytes:
+    """[(lap_distance_m, speed_kph, profile), ...] -> one {"samples": [...]} JSON frame as bytes,
+    profiles as columnar {"x_m": [...], "v_mps": [...]} (batched format only)"""
+    if orjson is not None:
+        # orjson writes the float32 profile columns straight from the arrays
+        return orjson.dumps({"samples": [
+            {"lap_distance_m": d, "speed_kph": v, "speed_profile": None if p is None else {"x_m": p[0], "v_mps": p[1]}}
+            for d, v, p in samples]}, option=orjson.OPT_SERIALIZE_NUMPY)
+    # stdlib: overlapping profiles are serialized incrementally and spliced into the frame.
+    # Fresh dicts/strings per frame measure faster here than reusing a dict or bytearray buffer
+    return ('{"samples":[' + ",".join(
+        _SAMPLE_TMPL % (_num(d), _num(v), encode_profile(p)) for d, v, p in samples) + ']}').encode()
+
+try:  # optional: libuv event loop (lower send latency/jitter); stock asyncio otherwise
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # Enable FastF1 caching
 fastf1.Cache.enable_cache('fastf1_cache')
 
-async def stream_telemetry(ws, team="Williams", year=2023, gp="Monaco", session_type="R"):
-    session = fastf1.get_session(year, gp, session_type)
-    session.load()
-    # Filter laps by team
-    laps = session.laps[session.laps['Team'] == team]
+SAMPLE_PERIOD_S = 0.2  # 5 Hz sample rate
+# Wire format. "legacy" (default): one TelemetryPacket text frame per sample, what
+# pit_timer_backend deserializes today. "batched": {"samples": [...]} binary frames,
+# opt-in until the backend accepts them
+FRAME_FORMAT = os.getenv("FRAME_FORMAT", "legacy")
+BATCHED = FRAME_FORMAT == "batched"
+# Samples per websocket frame in batched mode: one {"samples": [...]} message instead of a frame per 5 Hz sample
+SAMPLES_PER_FRAME = int(os.getenv("SAMPLES_PER_FRAME", "10"))
+
+QUEUE_MAX = 256  # samples buffered between producer and writer
+
+# Stacked per-team Distance/Speed arrays, reused across launches (delete to rebuild)
+TELEMETRY_CACHE_DIR = os.getenv("TELEMETRY_CACHE_DIR", "telemetry_cache")
+
+YEAR, GP, SESSION_TYPE = 2023, "Monaco", "R"
+# Comma-separated teams streamed concurrently, one websocket each
+TEAMS = [t.strip() for t in os.getenv("TEAMS", "Williams").split(",") if t.strip()]
+
+async def _produce_samples(queue, dist_arr, speed_arr, samples_per_frame):
+    """Feed the profile calculator and queue (lap_distance_m, speed_kph, profile) at 5 Hz; None marks the end."""
+    # 50-sample sliding window and 500m lookahead (adjust these based on your track/needs)
+    profile_calc = SpeedProfileCalculator(window_size=50, lookahead_m=500.0)
+    speed_mps_arr = speed_arr * (1.0 / 3.6)  # one vectorized conversion for the whole stream
+    rows = zip(dist_arr.tolist(), speed_arr.tolist(), speed_mps_arr.tolist())
+    # Absolute schedule: sample i is due at t0 + i*period, so per-sleep jitter never
+    # accumulates and a late producer just skips sleeps until it is back on time
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    for i, (lap_distance_m, speed_kph, speed_mps) in enumerate(rows, start=1):
+        profile_calc.add_sample_mps(lap_distance_m, speed_mps)
+        await queue.put((lap_distance_m, speed_kph, profile_calc.get_lookahead_profile(lap_distance_m)))
+        if i % samples_per_frame == 0:  # release a frame's worth at a time
+            delay = t0 + i * SAMPLE_PERIOD_S - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+    await queue.put(None)
+
+async def _write_frames(ws, queue, samples_per_frame):
+    """Drain whatever is queued (up to samples_per_frame) into one frame per send."""
+    # batched frames carry columnar profiles, legacy packets the backend's list of {x_m, v_mps}
+    encode_profile = ProfileEncoder(columnar=BATCHED)
+    done = False
+    while not done:
+        batch = [await queue.get()]
+        while len(batch) < samples_per_frame and not queue.empty():
+            batch.append(queue.get_nowait())
+        if batch[-1] is None:  # end marker is always the last item queued
+            batch.pop()
+            done = True
+        if not batch:
+            continue
+        if BATCHED:
+            await ws.send(encode_frame(batch, encode_profile))
+        else:
+            for d, v, p in batch:
+                await ws.send(encode_sample(d, v, p, encode_profile))  # str -> text frame
+
+def load_team_telemetry(session, team):
+    """Stacked (Distance m, Speed km/h) float64 arrays over all of a team's laps in a loaded session; None if it has no laps."""
+    # Team filter once (FastF1's own selector keeps the Laps/session linkage)
+    laps = session.laps.pick_teams(team)
     
     if laps.empty:
-        print(f"No laps found for team {team} in {gp} {year}")
-        return
+        return None
 
     print(f"Loaded {len(laps)} laps for team {team}")
 
-    # Initialize speed profile calculator with a 50-sample sliding window
-    # and 500m lookahead (adjust these based on your track/needs)
-    profile_calc = SpeedProfileCalculator(window_size=50, lookahead_m=500.0)
+    # Flatten all telemetry into two columns; positional rows instead of iterrows'
+    # (index, Series) tuples -- each is still a Lap, which get_car_data needs
+    dist_parts, speed_parts = [], []
+    for i in range(len(laps)):
+        tel = laps.iloc[i].get_car_data().add_distance()
+        dist_parts.append(tel["Distance"].to_numpy(dtype=np.float64))
+        speed_parts.append(tel["Speed"].to_numpy(dtype=np.float64))
+    return np.concatenate(dist_parts), np.concatenate(speed_parts)
 
-    # Flatten all telemetry rows into a single stream
-    telemetry_rows = []
-    for _, lap in laps.iterrows():
-        tel = lap.get_car_data().add_distance()
-        for idx, row in tel.iterrows():
-            telemetry_rows.append(row)
-
-    print(f"Streaming {len(telemetry_rows)} telemetry rows at 5Hz...")
-    for row in telemetry_rows:
-        lap_distance_m = float(row["Distance"])
-        speed_kph = float(row["Speed"])
-        profile_calc.add_sample(lap_distance_m, speed_kph)
-        speed_profile = profile_calc.get_lookahead_profile(lap_distance_m)
-        payload = {
-            "lap_distance_m": lap_distance_m,
-            "speed_kph": speed_kph,
-            "speed_profile": speed_profile
-        }
-        await ws.send(json.dumps(payload))
-        await asyncio.sleep(0.2)  # 5 Hz stream
-    print("Telemetry stream complete.")
+def telemetry_cache_path(team, year, gp, session_type):
+    return os.path.join(TELEMETRY_CACHE_DIR, f"{year}_{gp}_{session_type}_{team}.npy".replace(" ", "_"))
 
-async def main():
-    backend_url = os.getenv("BACKEND_URL", "ws://rust-backend:8765")
-    print(f"Connecting to backend at {backend_url}")
+def load_teams_telemetry(teams, year, gp, session_type):
+    """{team: (dist_arr, speed_arr) or None}, memoized on disk per team as one [2, N] .npy
+    (add_distance is deterministic per session). The session is loaded at most once, and only on a miss."""
+    out, session = {}, None
+    for team in teams:
+        path = telemetry_cache_path(team, year, gp, session_type)
+        if os.path.exists(path):
+            try:
+                data = np.load(path)
+                print(f"Loaded telemetry for team {team} from cache: {path}")
+                out[team] = (data[0], data[1])
+                continue
+            except (OSError, ValueError) as e:
+                print(f"[WRN] telemetry cache unreadable ({e}); rebuilding {path}")
+        if session is None:
+            session = fastf1.get_session(year, gp, session_type)
+            session.load()
+        res = out[team] = load_team_telemetry(session, team)
+        if res is None:
+            continue
+        try:
+            os.makedirs(TELEMETRY_CACHE_DIR, exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, np.stack(res))
+            os.replace(tmp, path)  # readers never see a half-written file
+        except OSError as e:
+            print(f"[WRN] could not write telemetry cache ({e})")
+    return out
 
+async def stream_telemetry(ws, dist_arr, speed_arr, samples_per_frame=SAMPLES_PER_FRAME, label=""):
+    """Stream pre-loaded telemetry arrays over ws (NumPy only: no pandas/FastF1 on the streaming path)."""
+    # legacy frames carry one sample each, so they are also paced one sample at a time
+    samples_per_frame = max(1, int(samples_per_frame)) if BATCHED else 1
+    print(f"{label}Streaming {len(dist_arr)} telemetry rows at 5Hz, {samples_per_frame} per frame ({FRAME_FORMAT})...")
+    # Producer computes profiles, writer drains and sends: a slow send never stalls
+    # profile computation and vice versa. TaskGroup cancels the peer if either fails.
+    queue = asyncio.Queue(maxsize=QUEUE_MAX)
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(_produce_samples(queue, dist_arr, speed_arr, samples_per_frame))
+            tg.create_task(_write_frames(ws, queue, samples_per_frame))
+    except ExceptionGroup as eg:
+        raise eg.exceptions[0]  # surface the real error (e.g. connection closed) to the reconnect loop
+    print(f"{label}Telemetry stream complete.")
+
+async def stream_team(backend_url, team, dist_arr, speed_arr):
+    """One team's stream on its own connection, so the backend sees one feed per socket as before."""
+    label = f"[{team}] " if len(TEAMS) > 1 else ""
     # Reconnect loop: if connection drops or handshake fails, retry with a short backoff
     while True:
         try:
@@ -58,15 +183,35 @@ async def main():
                 ping_interval=20,   # seconds between keepalive pings
                 ping_timeout=20,    # wait this long for a pong
                 close_timeout=5,    # graceful close
+                compression=None,   # no permessage-deflate: compressing each small frame costs more CPU than it saves
                 max_queue=None      # unbounded recv queue to avoid backpressure disconnects
             ) as ws:
-                print("WebSocket connected. Streaming telemetry...")
-                await stream_telemetry(ws)
-                print("Stream finished, closing connection.")
+                print(f"{label}WebSocket connected. Streaming telemetry...")
+                await stream_telemetry(ws, dist_arr, speed_arr, label=label)
+                print(f"{label}Stream finished, closing connection.")
                 break  # Completed streaming successfully
         except Exception as e:
-            print(f"WebSocket error: {e}. Reconnecting in 1s...")
+            print(f"{label}WebSocket error: {e}. Reconnecting in 1s...")
             await asyncio.sleep(1.0)
 
+async def main():
+    backend_url = os.getenv("BACKEND_URL", "ws://rust-backend:8765")
+    telemetry = load_teams_telemetry(TEAMS, YEAR, GP, SESSION_TYPE)
+    streams = []
+    for team in TEAMS:
+        if telemetry[team] is None:
+            print(f"No laps found for team {team} in {GP} {YEAR}")
+        else:
+            streams.append(stream_team(backend_url, team, *telemetry[team]))
+    if not streams:
+        return
+    print(f"Connecting to backend at {backend_url}")
+    # One coroutine per team on the same loop; each paces itself against its own absolute schedule
+    await asyncio.gather(*streams)
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is None:
+        asyncio.run(main())
+    else:
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            runner.run(main())
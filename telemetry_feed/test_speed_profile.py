@@ -4,7 +4,11 @@ Unit test and demonstration for speed_profile_calculator.py
 Run this to verify the speed profile logic works correctly before Docker build.
 """
 
-from speed_profile_calculator import SpeedProfileCalculator
+import numpy as np
+
+from speed_profile_calculator import (
+    BUFFER_M, SpeedProfileCalculator, ProfileEncoder, profile_to_columns, profile_to_samples,
+)
 
 
 def test_basic_profile_generation():
@@ -21,18 +25,19 @@ def test_basic_profile_generation():
     current_distance = 1490.0
     profile = calc.get_lookahead_profile(current_distance)
     
-    if profile:
-        print(f"✓ Generated profile with {len(profile)} samples")
-        print(f"  First sample: x={profile[0]['x_m']:.1f}m, v={profile[0]['v_mps']:.2f}m/s")
-        print(f"  Last sample:  x={profile[-1]['x_m']:.1f}m, v={profile[-1]['v_mps']:.2f}m/s")
+    if profile is not None:
+        xs, vs = profile
+        print(f"✓ Generated profile with {len(xs)} samples")
+        print(f"  First sample: x={xs[0]:.1f}m, v={vs[0]:.2f}m/s")
+        print(f"  Last sample:  x={xs[-1]:.1f}m, v={vs[-1]:.2f}m/s")
         
         # Verify samples are in range [current, current+lookahead]
-        assert all(current_distance - 50 <= s['x_m'] <= current_distance + 200 + 50 for s in profile), \
+        assert all(current_distance - 50 <= x <= current_distance + 200 + 50 for x in xs), \
             "Profile samples outside expected range"
         
         # Verify monotonic increasing x
-        for i in range(1, len(profile)):
-            assert profile[i]['x_m'] >= profile[i-1]['x_m'], "Profile not sorted by distance"
+        for i in range(1, len(xs)):
+            assert xs[i] >= xs[i-1], "Profile not sorted by distance"
         
         print("✓ All assertions passed")
     else:
@@ -53,17 +58,18 @@ def test_target_range_profile():
     # Request profile from 2200m to 2400m
     profile = calc.get_profile(current_distance_m=2200.0, target_distance_m=2400.0)
     
-    if profile:
-        print(f"\n✓ Target range profile: {len(profile)} samples from {profile[0]['x_m']:.1f}m to {profile[-1]['x_m']:.1f}m")
+    if profile is not None:
+        xs, vs = profile
+        print(f"\n✓ Target range profile: {len(xs)} samples from {xs[0]:.1f}m to {xs[-1]:.1f}m")
         
         # Verify all samples are around the target range (with buffer tolerance)
-        assert profile[0]['x_m'] >= 2150, "Start too far back"
-        assert profile[-1]['x_m'] <= 2450, "End too far forward"
+        assert xs[0] >= 2150, "Start too far back"
+        assert xs[-1] <= 2450, "End too far forward"
         
         # Verify speed conversion (80 kph = 22.22 m/s)
         expected_mps = 80.0 / 3.6
-        for sample in profile:
-            assert abs(sample['v_mps'] - expected_mps) < 0.01, "Speed conversion error"
+        for v in vs:
+            assert abs(v - expected_mps) < 0.01, "Speed conversion error"
         
         print("✓ Target range test passed")
     else:
@@ -95,21 +101,122 @@ def test_json_serialization():
     
     profile = calc.get_lookahead_profile(3180.0)
     
-    if profile:
+    if profile is not None:
+        xs, vs = profile
         # This should not raise an exception
-        json_str = json.dumps(profile, indent=2)
+        json_str = json.dumps(profile_to_samples(profile), indent=2)
         print(f"\n✓ JSON serialization successful ({len(json_str)} chars)")
         print("Sample JSON:")
         print(json_str[:200] + "..." if len(json_str) > 200 else json_str)
         
         # Verify round-trip
         decoded = json.loads(json_str)
-        assert len(decoded) == len(profile), "Round-trip failed"
+        assert len(decoded) == len(xs), "Round-trip failed"
         print("✓ JSON round-trip successful")
     else:
         print("✗ No profile to serialize")
 
 
+def _reference_profile(window, current_distance_m, target_distance_m):
+    """Mask + stable sort over the (x, v) samples currently in the window, oldest first."""
+    x = np.array([w[0] for w in window], dtype=np.float32)
+    v = np.array([w[1] for w in window], dtype=np.float32)
+    mask = (x >= current_distance_m - BUFFER_M) & (x <= target_distance_m + BUFFER_M)
+    xs, vs = x[mask], v[mask]
+    if xs.size < 2:
+        return None
+    order = np.argsort(xs, kind="stable")
+    return xs[order], vs[order]
+
+
+def _assert_matches_reference(calc, window, queries):
+    for current in queries:
+        got = calc.get_profile(current, current + calc.lookahead_m)
+        ref = _reference_profile(window, current, current + calc.lookahead_m)
+        if ref is None:
+            assert got is None, f"Expected no profile at {current}m"
+        else:
+            assert got is not None, f"Missing profile at {current}m"
+            assert np.array_equal(got[0], ref[0]) and np.array_equal(got[1], ref[1]), \
+                f"Profile mismatch at {current}m"
+
+
+def _lap_crossing_stream():
+    """Distances running to the end of a lap, then restarting from 0 (descending step)."""
+    end_of_lap = [(float(d), 200.0 - (d - 5000) / 10) for d in range(5000, 5300, 20)]
+    next_lap = [(float(d), 150.0 + d / 10) for d in range(0, 600, 20)]
+    return end_of_lap + next_lap
+
+
+def test_lap_rollover_window():
+    """Window spanning a lap-distance reset matches a mask+sort reference."""
+    calc = SpeedProfileCalculator(window_size=20, lookahead_m=300.0)
+    stream = _lap_crossing_stream()
+    window = []
+    
+    # Stop a few samples after the reset: both laps are in the window
+    for distance, speed_kph in stream[:20]:
+        calc.add_sample(distance, speed_kph)
+        window = (window + [(distance, speed_kph / 3.6)])[-calc.window_size:]
+    # Just after the reset only the new lap's samples are ahead of the car, sorted, newest included
+    current = stream[19][0]
+    profile = calc.get_lookahead_profile(current)
+    assert profile is not None, "No profile just after the lap reset"
+    xs, vs = profile
+    assert xs[0] >= current - BUFFER_M and xs[-1] == current, "Old-lap samples leaked into the profile"
+    assert np.all(np.diff(xs) >= 0), "Profile not sorted across the lap reset"
+    _assert_matches_reference(calc, window, [0.0, 40.0, 5100.0, 5250.0, 5280.0, 2500.0])
+    print("\n✓ Lap rollover profile matches reference")
+
+
+def test_ring_wraparound_after_rollover():
+    """Eviction wrapping past the reset sample, then reset(), still matches the reference."""
+    calc = SpeedProfileCalculator(window_size=20, lookahead_m=300.0)
+    window = []
+    
+    for i, (distance, speed_kph) in enumerate(_lap_crossing_stream()):
+        calc.add_sample(distance, speed_kph)
+        window = (window + [(distance, speed_kph / 3.6)])[-calc.window_size:]
+        # Check at every step while the reset sample is being pushed out of the ring
+        _assert_matches_reference(calc, window, [0.0, 200.0, 5200.0])
+    
+    # Old lap fully evicted: a profile over the whole lap is the window in arrival order
+    xs, vs = calc.get_profile(0.0, 1000.0)
+    assert np.array_equal(xs, np.float32([w[0] for w in window])), "Window order wrong after wrap-around"
+    assert np.array_equal(vs, np.float32([w[1] for w in window])), "Speeds misaligned after wrap-around"
+    _assert_matches_reference(calc, window, [100.0, 300.0, 450.0, 560.0])
+    
+    calc.reset()
+    assert calc.window_len() == 0 and calc.get_lookahead_profile(0.0) is None, "reset() left samples behind"
+    window = []
+    for distance in (1000.0, 990.0, 1010.0, 1020.0):  # starts with a descending step
+        calc.add_sample(distance, 90.0)
+        window.append((distance, 90.0 / 3.6))
+    _assert_matches_reference(calc, window, [980.0, 1000.0])
+    print("\n✓ Ring wrap-around and reset() match reference")
+
+
+def test_profile_encoder():
+    """ProfileEncoder text parses to the profile_to_samples / profile_to_columns payloads."""
+    import json
+    
+    calc = SpeedProfileCalculator(window_size=20, lookahead_m=200.0)
+    encode_samples = ProfileEncoder()
+    encode_columns = ProfileEncoder(columnar=True)
+    tiny = ProfileEncoder(max_entries=8)  # clears its cache every few profiles
+    
+    assert encode_samples(None) == "null", "None should encode as null"
+    for distance, speed_kph in _lap_crossing_stream():
+        calc.add_sample(distance, speed_kph)
+        profile = calc.get_lookahead_profile(distance)
+        for _ in range(2):  # second call: unchanged profile served from the last text
+            assert json.loads(encode_samples(profile)) == profile_to_samples(profile), "Sample layout mismatch"
+            assert json.loads(encode_columns(profile)) == profile_to_columns(profile), "Columnar layout mismatch"
+            assert json.loads(tiny(profile)) == profile_to_samples(profile), "Mismatch after cache clear"
+    assert encode_samples(profile) is encode_samples(profile), "Unchanged profile not reused"
+    print("\n✓ ProfileEncoder output matches json.dumps payloads")
+
+
 def demo_integration_payload():
     """Demonstrate what the telemetry_feed.py will send to Rust backend."""
     import json
@@ -128,6 +235,8 @@ def demo_integration_payload():
     print("DEMO: Telemetry Payload Integration")
     print("="*60)
     
+    # Collect the report and print it once: no stdout writes inside the sample loop
+    lines = []
     for lap_distance_m, speed_kph in test_samples:
         calc.add_sample(lap_distance_m, speed_kph)
         speed_profile = calc.get_lookahead_profile(lap_distance_m)
@@ -135,16 +244,17 @@ def demo_integration_payload():
         payload = {
             "lap_distance_m": lap_distance_m,
             "speed_kph": speed_kph,
-            "speed_profile": speed_profile
+            "speed_profile": profile_to_samples(speed_profile)
         }
         
         json_payload = json.dumps(payload)
-        profile_info = f"{len(speed_profile)} samples" if speed_profile else "None"
-        print(f"\n📡 Sending: dist={lap_distance_m}m, speed={speed_kph}kph, profile={profile_info}")
-        
-        if speed_profile and len(test_samples) == 4:  # Show detail on last sample
-            print(f"   Profile range: {speed_profile[0]['x_m']:.1f}m to {speed_profile[-1]['x_m']:.1f}m")
-            print(f"   JSON size: {len(json_payload)} bytes")
+        profile_info = f"{len(speed_profile[0])} samples" if speed_profile is not None else "None"
+        lines.append(f"\n📡 Sending: dist={lap_distance_m}m, speed={speed_kph}kph, profile={profile_info}")
+    
+    if speed_profile is not None:  # Show detail on last sample
+        lines.append(f"   Profile range: {speed_profile[0][0]:.1f}m to {speed_profile[0][-1]:.1f}m")
+        lines.append(f"   JSON size: {len(json_payload)} bytes")
+    print("\n".join(lines))
 
 
 if __name__ == "__main__":
@@ -155,6 +265,9 @@ if __name__ == "__main__":
         test_target_range_profile()
         test_insufficient_data()
         test_json_serialization()
+        test_lap_rollover_window()
+        test_ring_wraparound_after_rollover()
+        test_profile_encoder()
         demo_integration_payload()
         
         print("\n" + "="*60)